@@ -4,23 +4,42 @@ import socket
 import ssl
 import datetime
 import json
+import csv
+import base64
+import hashlib
 import os
+import sys
 import argparse
+from abc import ABC, abstractmethod
+import sqlite3
 from pathlib import Path
 import customtkinter as ctk
 from CTkMessagebox import CTkMessagebox
-from typing import Dict, List, Optional
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
 import threading
 import time
+import queue
+import bisect
+import heapq
+import random
+from collections import Counter, defaultdict, deque
+from itertools import islice
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
 from urllib.parse import urlparse
 import requests
-from dataclasses import dataclass, asdict
+from dataclasses import dataclass, asdict, field, fields
 import logging
 from datetime import datetime, timedelta
 import tkinter as tk
 from tkinter import ttk
 
 
+DEFAULT_PORT = 443
+
+# Fields that choose the endpoints of a domain, kept across refreshes
+ENDPOINT_SETTINGS = ('ports', 'sni_names', 'all_addresses')
+
+
 @dataclass
 class Certificate:
     domain: str
@@ -34,97 +53,684 @@ class Certificate:
     last_checked: datetime
     alert_threshold: int  # days before expiration to start alerting
     notes: str = ""
+    # SHA-256 fingerprints of the presented chain, leaf first; the
+    # certificates themselves are kept once each as ChainCertificate
+    chain: List[str] = field(default_factory=list)
+    # Where to check: every port, for every SNI name (the domain itself by
+    # default) and, with all_addresses, at every A/AAAA record
+    ports: List[int] = field(default_factory=lambda: [DEFAULT_PORT])
+    sni_names: List[str] = field(default_factory=list)
+    all_addresses: bool = False
+    # Outcome of the last check at each endpoint
+    endpoints: List[Dict] = field(default_factory=list)
 
 
-class SSLCertificateManager:
+@dataclass
+class ChainCertificate:
+    """One certificate of a presented chain, shared by all domains sending it"""
+    fingerprint: str  # SHA-256 of the DER encoding, in hex
+    subject: str
+    issuer: str
+    not_before: datetime
+    not_after: datetime
+    der: bytes
+
+
+DATE_FIELDS = ('not_before', 'not_after', 'added_date', 'last_checked')
+
+# Exit codes of the batch commands, following the monitoring plugin
+# convention; a run exits with the worst status it saw
+STATUS_EXIT_CODES = {'ok': 0, 'warning': 1, 'expired': 2, 'error': 3}
+
+
+def certificate_to_dict(cert: Certificate) -> Dict:
+    """Certificate as a JSON-serializable dict"""
+    data = asdict(cert)
+    # Convert datetime objects to ISO format strings
+    for name in DATE_FIELDS:
+        data[name] = data[name].isoformat()
+    return data
+
+
+def certificate_from_dict(data: Dict) -> Certificate:
+    data = dict(data)
+    # Convert string dates to datetime objects
+    for name in DATE_FIELDS:
+        data[name] = datetime.fromisoformat(data[name])
+    return Certificate(**data)
+
+
+def chain_certificate_to_dict(cert: ChainCertificate) -> Dict:
+    data = asdict(cert)
+    data['not_before'] = cert.not_before.isoformat()
+    data['not_after'] = cert.not_after.isoformat()
+    data['der'] = base64.b64encode(cert.der).decode('ascii')
+    return data
+
+
+def chain_certificate_from_dict(data: Dict) -> ChainCertificate:
+    data = dict(data)
+    data['not_before'] = datetime.fromisoformat(data['not_before'])
+    data['not_after'] = datetime.fromisoformat(data['not_after'])
+    data['der'] = base64.b64decode(data['der'])
+    return ChainCertificate(**data)
+
+
+def name_of(rdns) -> str:
+    """Common name of a decoded subject or issuer, else its organization"""
+    attributes = dict(x[0] for x in rdns)
+    return attributes.get('commonName') or attributes.get('organizationName', '')
+
+
+def parse_chain_certificate(fingerprint: str, der: bytes,
+                            info: Dict) -> ChainCertificate:
+    """ChainCertificate from DER and its decoded form as getpeercert gives it"""
+    return ChainCertificate(
+        fingerprint=fingerprint,
+        subject=name_of(info['subject']),
+        issuer=name_of(info['issuer']),
+        not_before=datetime.strptime(info['notBefore'], '%b %d %H:%M:%S %Y %Z'),
+        not_after=datetime.strptime(info['notAfter'], '%b %d %H:%M:%S %Y %Z'),
+        der=der)
+
+
+class CertificateStore(ABC):
+    """Where certificates are persisted, one record per domain"""
+
+    @abstractmethod
+    def load(self) -> Dict[str, Certificate]:
+        """All stored records by domain"""
+
+    @abstractmethod
+    def upsert(self, certificates: Dict[str, Certificate]):
+        """Insert or replace the given records in one transaction"""
+
+    @abstractmethod
+    def delete(self, domain: str):
+        """Remove the record of domain, if there is one"""
+
+    @abstractmethod
+    def load_chain_certificates(self) -> Dict[str, ChainCertificate]:
+        """All stored chain certificates by fingerprint"""
+
+    @abstractmethod
+    def add_chain_certificates(self, certificates: Dict[str, ChainCertificate]):
+        """Store chain certificates by fingerprint; existing ones are kept"""
+
+    def close(self):
+        pass
+
+
+def write_atomic(path: Path, text: str):
+    """Write to a temporary name and rename it over path"""
+    tmp_path = path.with_name(path.name + '.tmp')
+    with open(tmp_path, 'w') as f:
+        f.write(text)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+class JSONCertificateStore(CertificateStore):
+    """All certificates in one JSON file, rewritten on every change.
+
+    The file is written to a temporary name and renamed over the old one,
+    so a crash never leaves a half-written store behind. Chain
+    certificates go in a directory next to it, one file per fingerprint,
+    since they never change once written.
+    """
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self.chain_dir = self.path.with_name(self.path.stem + '_chain')
+        self._certificates: Dict[str, Certificate] = {}
+        self._lock = threading.Lock()
+
+    def load(self) -> Dict[str, Certificate]:
+        if self.path.exists():
+            data = json.loads(self.path.read_text())
+            self._certificates = {domain: certificate_from_dict(cert_data)
+                                  for domain, cert_data in data.items()}
+        return dict(self._certificates)
+
+    def _write(self):
+        data = {domain: certificate_to_dict(cert)
+                for domain, cert in self._certificates.items()}
+        write_atomic(self.path, json.dumps(data, indent=2))
+
+    def upsert(self, certificates: Dict[str, Certificate]):
+        with self._lock:
+            self._certificates.update(certificates)
+            self._write()
+
+    def delete(self, domain: str):
+        with self._lock:
+            self._certificates.pop(domain, None)
+            self._write()
+
+    def load_chain_certificates(self) -> Dict[str, ChainCertificate]:
+        certificates = {}
+        if self.chain_dir.is_dir():
+            for path in self.chain_dir.glob('*.json'):
+                cert = chain_certificate_from_dict(json.loads(path.read_text()))
+                certificates[cert.fingerprint] = cert
+        return certificates
+
+    def add_chain_certificates(self, certificates: Dict[str, ChainCertificate]):
+        if not certificates:
+            return
+        self.chain_dir.mkdir(exist_ok=True)
+        for fingerprint, cert in certificates.items():
+            path = self.chain_dir / f"{fingerprint}.json"
+            if not path.exists():
+                write_atomic(path, json.dumps(chain_certificate_to_dict(cert)))
+
+
+class SQLiteCertificateStore(CertificateStore):
+    """Certificates in a SQLite database in WAL mode.
+
+    Every change only touches its own rows, in a single transaction, so a
+    refresh of n certificates costs n row writes instead of n rewrites of
+    the whole store, and an interrupted write is rolled back.
+    """
+
+    COLUMNS = [field.name for field in fields(Certificate)]
+
+    # Stored as JSON text
+    JSON_COLUMNS = ('chain', 'ports', 'sni_names', 'endpoints')
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self._lock = threading.Lock()
+        # The GUI saves from both the Tk thread and refresh threads
+        self._conn = sqlite3.connect(str(self.path), check_same_thread=False)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('PRAGMA synchronous=NORMAL')
+        self._conn.execute(
+            'CREATE TABLE IF NOT EXISTS certificates ('
+            'domain TEXT PRIMARY KEY, issuer TEXT, not_before TEXT, '
+            'not_after TEXT, serial_number TEXT, subject TEXT, '
+            'version INTEGER, added_date TEXT, last_checked TEXT, '
+            'alert_threshold INTEGER, notes TEXT, chain TEXT, ports TEXT, '
+            'sni_names TEXT, all_addresses INTEGER, endpoints TEXT)')
+        columns = [row[1] for row in
+                   self._conn.execute('PRAGMA table_info(certificates)')]
+        for name in self.COLUMNS:
+            if name not in columns:
+                # Databases from before the field existed; NULL means the
+                # field's default
+                self._conn.execute(f'ALTER TABLE certificates ADD COLUMN {name}')
+        self._conn.execute(
+            'CREATE TABLE IF NOT EXISTS chain_certificates ('
+            'fingerprint TEXT PRIMARY KEY, subject TEXT, issuer TEXT, '
+            'not_before TEXT, not_after TEXT, der BLOB)')
+        self._conn.commit()
+
+    def load(self) -> Dict[str, Certificate]:
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT {', '.join(self.COLUMNS)} FROM certificates").fetchall()
+        certificates = {}
+        for row in rows:
+            data = {name: value for name, value in zip(self.COLUMNS, row)
+                    if value is not None}
+            for name in self.JSON_COLUMNS:
+                if name in data:
+                    data[name] = json.loads(data[name])
+            if 'all_addresses' in data:
+                data['all_addresses'] = bool(data['all_addresses'])
+            certificates[data['domain']] = certificate_from_dict(data)
+        return certificates
+
+    def is_empty(self) -> bool:
+        with self._lock:
+            return self._conn.execute(
+                'SELECT 1 FROM certificates LIMIT 1').fetchone() is None
+
+    def upsert(self, certificates: Dict[str, Certificate]):
+        rows = []
+        for domain, cert in certificates.items():
+            data = certificate_to_dict(cert)
+            # Records are keyed by the name the user added, which may
+            # differ from the hostname in the certificate
+            data['domain'] = domain
+            for name in self.JSON_COLUMNS:
+                data[name] = json.dumps(data[name])
+            rows.append([data[name] for name in self.COLUMNS])
+        placeholders = ', '.join('?' * len(self.COLUMNS))
+        with self._lock, self._conn:
+            self._conn.executemany(
+                f"INSERT OR REPLACE INTO certificates ({', '.join(self.COLUMNS)}) "
+                f"VALUES ({placeholders})", rows)
+
+    def delete(self, domain: str):
+        with self._lock, self._conn:
+            self._conn.execute('DELETE FROM certificates WHERE domain = ?',
+                               (domain,))
+
+    def load_chain_certificates(self) -> Dict[str, ChainCertificate]:
+        with self._lock:
+            rows = self._conn.execute(
+                'SELECT fingerprint, subject, issuer, not_before, not_after, '
+                'der FROM chain_certificates').fetchall()
+        return {row[0]: ChainCertificate(
+                    fingerprint=row[0], subject=row[1], issuer=row[2],
+                    not_before=datetime.fromisoformat(row[3]),
+                    not_after=datetime.fromisoformat(row[4]), der=row[5])
+                for row in rows}
+
+    def add_chain_certificates(self, certificates: Dict[str, ChainCertificate]):
+        rows = [(cert.fingerprint, cert.subject, cert.issuer,
+                 cert.not_before.isoformat(), cert.not_after.isoformat(),
+                 cert.der)
+                for cert in certificates.values()]
+        with self._lock, self._conn:
+            self._conn.executemany(
+                'INSERT OR IGNORE INTO chain_certificates VALUES '
+                '(?, ?, ?, ?, ?, ?)', rows)
+
+    def migrate_from_json(self, json_path: Path) -> int:
+        """Import a certificates.json once, then rename it out of the way"""
+        json_path = Path(json_path)
+        if not json_path.exists() or not self.is_empty():
+            return 0
+        json_store = JSONCertificateStore(json_path)
+        certificates = json_store.load()
+        self.add_chain_certificates(json_store.load_chain_certificates())
+        self.upsert(certificates)
+        json_path.rename(json_path.with_name(json_path.name + '.migrated'))
+        logging.info(f"Migrated {len(certificates)} certificates from {json_path}")
+        return len(certificates)
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+def alert_instants(cert: Certificate) -> Dict[str, datetime]:
+    """When a certificate enters the warning and expired states
+
+    These follow the whole-day rounding of check_expiration: a certificate
+    is in warning once fewer than alert_threshold + 1 days remain, and
+    expired once less than one day remains.
+    """
+    return {
+        'warning': cert.not_after - timedelta(days=cert.alert_threshold + 1),
+        'expired': cert.not_after - timedelta(days=1)
+    }
+
+
+class ExpiryIndex:
+    """Certificates ordered by expiry and by their next alert instants.
+
+    Two sorted lists of (instant, ...) tuples are kept with bisect, so
+    "expiring within N days" and "what happens next" are binary searches
+    instead of passes over every certificate.
+    """
+
     def __init__(self):
+        self._expiry: List[Tuple[datetime, str]] = []
+        self._events: List[Tuple[datetime, str, str]] = []
+        self._entries: Dict[str, Tuple] = {}
+        self._lock = threading.Lock()
+        # Set whenever the index changes, to wake up a waiting monitor;
+        # take_changed() tells which domains changed
+        self.changed = threading.Event()
+        self._changed_domains = set()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def add(self, domain: str, cert: Certificate):
+        """Insert or update the entries of one certificate"""
+        with self._lock:
+            self._remove(domain)
+            expiry = (cert.not_after, domain)
+            events = [(instant, kind, domain)
+                      for kind, instant in alert_instants(cert).items()]
+            bisect.insort(self._expiry, expiry)
+            for event in events:
+                bisect.insort(self._events, event)
+            self._entries[domain] = (expiry, events)
+            self._changed_domains.add(domain)
+        self.changed.set()
+
+    def remove(self, domain: str):
+        with self._lock:
+            self._remove(domain)
+            self._changed_domains.add(domain)
+        self.changed.set()
+
+    def take_changed(self) -> set:
+        """Domains added, updated or removed since the last call"""
+        with self._lock:
+            domains = self._changed_domains
+            self._changed_domains = set()
+        return domains
+
+    def _remove(self, domain: str):
+        entry = self._entries.pop(domain, None)
+        if entry is None:
+            return
+        expiry, events = entry
+        del self._expiry[bisect.bisect_left(self._expiry, expiry)]
+        for event in events:
+            del self._events[bisect.bisect_left(self._events, event)]
+
+    def expiring_before(self, instant: datetime) -> List[str]:
+        """Domains whose certificates expire before instant, soonest first"""
+        with self._lock:
+            end = bisect.bisect_left(self._expiry, (instant,))
+            return [domain for _, domain in self._expiry[:end]]
+
+    def events_between(self, start: datetime,
+                       end: datetime) -> List[Tuple[datetime, str, str]]:
+        """(instant, kind, domain) of alerts with start <= instant < end"""
+        with self._lock:
+            return self._events[bisect.bisect_left(self._events, (start,)):
+                                bisect.bisect_left(self._events, (end,))]
+
+    def next_event(self, after: datetime) -> Optional[Tuple[datetime, str, str]]:
+        """The first alert at or after the given instant"""
+        with self._lock:
+            i = bisect.bisect_left(self._events, (after,))
+            return self._events[i] if i < len(self._events) else None
+
+
+def read_domain_list(lines: Iterable[str], default_threshold: int = 30
+                     ) -> Iterator[Tuple[str, int]]:
+    """(domain, alert_threshold) pairs from a text or CSV domain list
+
+    Plain text has one domain per line and '#' starts a comment line. CSV
+    rows are domain[,alert_threshold], or any columns under a header that
+    names a 'domain' column, so exported files can be imported again.
+    Lines are read as they are needed.
+    """
+    rows = csv.reader(line for line in lines
+                      if line.strip() and not line.lstrip().startswith('#'))
+    domain_column, threshold_column = 0, 1
+    for number, row in enumerate(rows, 1):
+        row = [value.strip() for value in row]
+        if number == 1 and 'domain' in row:
+            domain_column = row.index('domain')
+            threshold_column = (row.index('alert_threshold')
+                                if 'alert_threshold' in row else None)
+            continue
+        if len(row) <= domain_column or not row[domain_column]:
+            continue
+        threshold = default_threshold
+        if threshold_column is not None and len(row) > threshold_column \
+                and row[threshold_column]:
+            try:
+                threshold = int(row[threshold_column])
+            except ValueError:
+                raise ValueError(f"Row {number}: invalid alert threshold "
+                                 f"{row[threshold_column]!r}")
+        yield row[domain_column], threshold
+
+
+def csv_value(value):
+    """Lists of names or numbers as space-separated text, nested data as JSON"""
+    if isinstance(value, list) and all(isinstance(item, (str, int))
+                                       for item in value):
+        return ' '.join(map(str, value))
+    if isinstance(value, (list, dict)):
+        return json.dumps(value)
+    return value
+
+
+def setup_logging():
+    logging.basicConfig(
+        filename='ssl_manager.log',
+        level=logging.INFO,
+        format='%(asctime)s - %(levelname)s - %(message)s'
+    )
+
+
+def open_store(kind: str = 'sqlite') -> CertificateStore:
+    """The default store of the given kind in the working directory"""
+    # Before anything is logged, or logging would default to stderr and
+    # ignore this configuration (a migration logs while opening)
+    setup_logging()
+    if kind == 'json':
+        return JSONCertificateStore(Path("certificates.json"))
+    store = SQLiteCertificateStore(Path("certificates.db"))
+    store.migrate_from_json(Path("certificates.json"))
+    return store
+
+
+class SSLCertificateManager:
+    # Defaults for bulk checks: connections in flight overall and per IP
+    MAX_WORKERS = 32
+    PER_HOST_LIMIT = 2
+
+    # Domains taken from the input of a bulk check at any one time
+    MAX_IN_FLIGHT = 1024
+
+    # Refreshed certificates are written in batches of this many
+    SAVE_BATCH = 100
+
+    # Longest the monitor sleeps before re-reading the clock, so a
+    # suspended machine or a changed clock is noticed
+    MAX_MONITOR_SLEEP = 24 * 60 * 60
+
+    def __init__(self, store: Optional[CertificateStore] = None):
         self.certificates: Dict[str, Certificate] = {}
-        self.data_file = Path("certificates.json")
-        self.load_certificates()
+        self.index = ExpiryIndex()
+        # Chain certificates by fingerprint, the domains whose chains
+        # contain each intermediate, and which ones the store already has
+        self.chain_certificates: Dict[str, ChainCertificate] = {}
+        self._chain_domains: Dict[str, set] = defaultdict(set)
+        self._saved_chain = set()
+        self._ssl_context = None
         self.setup_logging()
+        self.store = store if store is not None else open_store()
+        self.load_certificates()
 
     def setup_logging(self):
-        logging.basicConfig(
-            filename='ssl_manager.log',
-            level=logging.INFO,
-            format='%(asctime)s - %(levelname)s - %(message)s'
-        )
+        setup_logging()
 
     def load_certificates(self):
-        """Load certificates from JSON file"""
-        if self.data_file.exists():
-            try:
-                data = json.loads(self.data_file.read_text())
-                for domain, cert_data in data.items():
-                    # Convert string dates to datetime objects
-                    cert_data['not_before'] = datetime.fromisoformat(
-                        cert_data['not_before'])
-                    cert_data['not_after'] = datetime.fromisoformat(
-                        cert_data['not_after'])
-                    cert_data['added_date'] = datetime.fromisoformat(
-                        cert_data['added_date'])
-                    cert_data['last_checked'] = datetime.fromisoformat(
-                        cert_data['last_checked'])
-                    self.certificates[domain] = Certificate(**cert_data)
-            except Exception as e:
-                logging.error(f"Error loading certificates: {e}")
+        """Load certificates from the store"""
+        try:
+            self.chain_certificates.update(self.store.load_chain_certificates())
+            self._saved_chain.update(self.chain_certificates)
+            for domain, cert in self.store.load().items():
+                self._set_certificate(domain, cert)
+        except Exception as e:
+            logging.error(f"Error loading certificates: {e}")
+
+    def _set_certificate(self, domain: str, cert: Certificate):
+        self._unlink_chain(domain)
+        self.certificates[domain] = cert
+        for fingerprint in cert.chain[1:]:
+            self._chain_domains[fingerprint].add(domain)
+        self.index.add(domain, cert)
+
+    def _unlink_chain(self, domain: str):
+        old_cert = self.certificates.get(domain)
+        if old_cert is None:
+            return
+        for fingerprint in old_cert.chain[1:]:
+            self._chain_domains[fingerprint].discard(domain)
+            if not self._chain_domains[fingerprint]:
+                del self._chain_domains[fingerprint]
 
-    def save_certificates(self):
-        """Save certificates to JSON file"""
+    def save_certificates(self, domains: Optional[Iterable[str]] = None):
+        """Save the given certificates (all by default) to the store"""
         try:
-            data = {domain: asdict(cert)
-                                   for domain, cert in self.certificates.items()}
-            # Convert datetime objects to ISO format strings
-            for cert_data in data.values():
-                cert_data['not_before'] = cert_data['not_before'].isoformat()
-                cert_data['not_after'] = cert_data['not_after'].isoformat()
-                cert_data['added_date'] = cert_data['added_date'].isoformat()
-                cert_data['last_checked'] = cert_data['last_checked'].isoformat()
-
-            self.data_file.write_text(json.dumps(data, indent=2))
+            if domains is None:
+                domains = list(self.certificates.keys())
+            certificates = {domain: self.certificates[domain]
+                            for domain in domains
+                            if domain in self.certificates}
+            # Chain certificates first, so no record points at a missing one
+            new_chain = {fingerprint: self.chain_certificates[fingerprint]
+                         for cert in certificates.values()
+                         for fingerprint in cert.chain
+                         if fingerprint not in self._saved_chain
+                         and fingerprint in self.chain_certificates}
+            if new_chain:
+                self.store.add_chain_certificates(new_chain)
+                self._saved_chain.update(new_chain)
+            self.store.upsert(certificates)
             logging.info("Certificates saved successfully")
         except Exception as e:
             logging.error(f"Error saving certificates: {e}")
 
-    def get_certificate_info(self, domain: str) -> Optional[Certificate]:
-        """Fetch SSL certificate information for a domain"""
+    @staticmethod
+    def hostname(domain: str) -> str:
+        """Domain without protocol or path"""
+        return urlparse(domain).netloc or domain
+
+    def resolve(self, domain: str) -> Optional[str]:
+        """First address a domain resolves to, or None"""
         try:
-            # Remove protocol if present
-            domain = urlparse(domain).netloc or domain
-
-            context = ssl.create_default_context()
-            with socket.create_connection((domain, 443), timeout=10) as sock:
-                with context.wrap_socket(sock, server_hostname=domain) as ssock:
-                    cert = ssock.getpeercert()
-
-                    return Certificate(
-                        domain=domain,
-                        issuer=dict(x[0]
-                                    for x in cert['issuer'])['commonName'],
-                        not_before=datetime.strptime(
-                            cert['notBefore'], '%b %d %H:%M:%S %Y %Z'),
-                        not_after=datetime.strptime(
-                            cert['notAfter'], '%b %d %H:%M:%S %Y %Z'),
-                        serial_number=cert['serialNumber'],
-                        subject=dict(x[0]
-                                     for x in cert['subject'])['commonName'],
-                        version=cert['version'],
-                        added_date=datetime.now(),
-                        last_checked=datetime.now(),
-                        alert_threshold=30  # Default 30 days alert threshold
-                    )
+            host = self.hostname(domain)
+            return socket.getaddrinfo(host, 443, type=socket.SOCK_STREAM)[0][4][0]
+        except Exception as e:
+            logging.error(f"Error resolving {domain}: {e}")
+            return None
+
+    def resolve_all(self, domain: str) -> List[str]:
+        """Every A and AAAA address of a domain, in resolver order"""
+        try:
+            host = self.hostname(domain)
+            infos = socket.getaddrinfo(host, DEFAULT_PORT,
+                                       type=socket.SOCK_STREAM)
+            return list(dict.fromkeys(info[4][0] for info in infos))
+        except Exception as e:
+            logging.error(f"Error resolving {domain}: {e}")
+            return []
+
+    def endpoints(self, domain: str, settings: Optional[Dict] = None
+                  ) -> List[Tuple[str, int, str]]:
+        """(address, port, server name) pairs to check for a domain
+
+        settings holds ports, sni_names and all_addresses; those missing
+        are taken from the stored certificate, or the defaults. Empty if
+        the domain does not resolve.
+        """
+        cert = self.certificates.get(domain)
+        if cert is not None:
+            defaults = {name: getattr(cert, name) for name in ENDPOINT_SETTINGS}
+        else:
+            defaults = {'ports': [DEFAULT_PORT], 'sni_names': [],
+                        'all_addresses': False}
+        settings = dict(defaults, **(settings or {}))
+        if settings['all_addresses']:
+            addresses = self.resolve_all(domain)
+        else:
+            address = self.resolve(domain)
+            addresses = [address] if address else []
+        server_names = settings['sni_names'] or [self.hostname(domain)]
+        return [(address, port, server_name)
+                for address in addresses
+                for port in settings['ports'] or [DEFAULT_PORT]
+                for server_name in server_names]
+
+    def get_certificate_info(self, domain: str, address: Optional[str] = None,
+                             timeout: float = 10, port: int = DEFAULT_PORT,
+                             server_name: Optional[str] = None
+                             ) -> Optional[Certificate]:
+        """Fetch SSL certificate information for a domain
+
+        With address, connect to that IP instead of resolving the domain;
+        server_name replaces the domain in SNI and hostname verification.
+        """
+        try:
+            return self._fetch_certificate(domain, address, timeout, port,
+                                           server_name)
         except Exception as e:
             logging.error(f"Error fetching certificate for {domain}: {e}")
             return None
 
-    def add_certificate(self, domain: str, alert_threshold: int = 30) -> bool:
-        """Add a new certificate to monitor"""
+    def check_endpoint(self, domain: str, endpoint: Tuple[str, int, str],
+                       timeout: float = 10
+                       ) -> Tuple[Optional[Certificate], Optional[str]]:
+        """(certificate, None) from one endpoint, or (None, error message)"""
+        address, port, server_name = endpoint
+        try:
+            return self._fetch_certificate(domain, address, timeout, port,
+                                           server_name), None
+        except Exception as e:
+            logging.error(f"Error fetching certificate for {domain} from "
+                          f"{address} port {port} as {server_name}: {e}")
+            return None, str(e) or type(e).__name__
+
+    def _fetch_certificate(self, domain: str, address: Optional[str],
+                           timeout: float, port: int,
+                           server_name: Optional[str]) -> Certificate:
+        # Remove protocol if present
+        domain = self.hostname(domain)
+
+        if self._ssl_context is None:
+            # Loading the CA store is slow, and contexts are thread-safe
+            self._ssl_context = ssl.create_default_context()
+        context = self._ssl_context
+        with socket.create_connection((address or domain, port),
+                                      timeout=timeout) as sock:
+            with context.wrap_socket(
+                    sock, server_hostname=server_name or domain) as ssock:
+                cert = ssock.getpeercert()
+                chain = self.capture_chain(ssock)
+
+                return Certificate(
+                    domain=domain,
+                    issuer=dict(x[0]
+                                for x in cert['issuer'])['commonName'],
+                    not_before=datetime.strptime(
+                        cert['notBefore'], '%b %d %H:%M:%S %Y %Z'),
+                    not_after=datetime.strptime(
+                        cert['notAfter'], '%b %d %H:%M:%S %Y %Z'),
+                    serial_number=cert['serialNumber'],
+                    subject=dict(x[0]
+                                 for x in cert['subject'])['commonName'],
+                    version=cert['version'],
+                    added_date=datetime.now(),
+                    last_checked=datetime.now(),
+                    alert_threshold=30,  # Default 30 days alert threshold
+                    chain=chain
+                )
+
+    def capture_chain(self, ssock: ssl.SSLSocket) -> List[str]:
+        """Fingerprints of the chain a server presented, leaf first
+
+        Each certificate is parsed only the first time its fingerprint is
+        seen. The presented chain is read from the underlying _ssl object
+        (Python 3.10+); elsewhere only the leaf is captured.
+        """
+        get_chain = getattr(getattr(ssock, '_sslobj', None),
+                            'get_unverified_chain', None)
+        if get_chain is not None:
+            presented = [(cert.public_bytes(ssl._ssl.ENCODING_DER),
+                          cert.get_info) for cert in get_chain() or []]
+        else:
+            presented = [(ssock.getpeercert(binary_form=True), ssock.getpeercert)]
+
+        chain = []
+        for der, get_info in presented:
+            fingerprint = hashlib.sha256(der).hexdigest()
+            if fingerprint not in self.chain_certificates:
+                self.chain_certificates[fingerprint] = parse_chain_certificate(
+                    fingerprint, der, get_info())
+            chain.append(fingerprint)
+        return chain
+
+    def add_certificate(self, domain: str, alert_threshold: int = 30,
+                        settings: Optional[Dict] = None) -> bool:
+        """Add a new certificate to monitor
+
+        settings may set ports, sni_names and all_addresses, see endpoints().
+        """
         try:
-            cert = self.get_certificate_info(domain)
+            _, cert = next(self.check_certificates([domain], settings=settings))
             if cert:
                 cert.alert_threshold = alert_threshold
-                self.certificates[domain] = cert
-                self.save_certificates()
+                for name, value in (settings or {}).items():
+                    setattr(cert, name, value)
+                self._set_certificate(domain, cert)
+                self.save_certificates([domain])
                 logging.info(f"Added certificate for {domain}")
                 return True
             return False
@@ -132,12 +738,58 @@ class SSLCertificateManager:
             logging.error(f"Error adding certificate for {domain}: {e}")
             return False
 
+    def add_certificates(self, domains: Iterable[Tuple[str, int]],
+                         on_result=None, **options) -> Tuple[int, int]:
+        """Add many certificates to monitor, fetched concurrently
+
+        domains yields (domain, alert_threshold) pairs; a domain given
+        twice is checked once. on_result(domain, success) is called as
+        each check completes and options are passed on to
+        check_certificates; endpoint settings given there are kept with
+        every certificate. New certificates are saved SAVE_BATCH at a
+        time, and those already fetched are saved even if reading domains
+        fails partway. Returns the number added and failed.
+        """
+        thresholds: Dict[str, int] = {}
+
+        def unique():
+            for domain, threshold in domains:
+                if domain not in thresholds:
+                    thresholds[domain] = threshold
+                    yield domain
+
+        success = 0
+        failed = 0
+        unsaved = []
+        try:
+            for domain, cert in self.check_certificates(unique(), **options):
+                if cert:
+                    cert.alert_threshold = thresholds[domain]
+                    for name, value in (options.get('settings') or {}).items():
+                        setattr(cert, name, value)
+                    self._set_certificate(domain, cert)
+                    unsaved.append(domain)
+                    success += 1
+                else:
+                    failed += 1
+                if len(unsaved) >= self.SAVE_BATCH:
+                    self.save_certificates(unsaved)
+                    unsaved = []
+                if on_result:
+                    on_result(domain, cert is not None)
+        finally:
+            self.save_certificates(unsaved)
+        logging.info(f"Added {success} certificates, {failed} failed")
+        return success, failed
+
     def remove_certificate(self, domain: str) -> bool:
         """Remove a certificate from monitoring"""
         try:
             if domain in self.certificates:
+                self._unlink_chain(domain)
                 del self.certificates[domain]
-                self.save_certificates()
+                self.index.remove(domain)
+                self.store.delete(domain)
                 logging.info(f"Removed certificate for {domain}")
                 return True
             return False
@@ -173,16 +825,290 @@ class SSLCertificateManager:
                 "message": f"Certificate valid for {days_until_expiry} days"
             }
 
+    def check_certificates(self, domains: Iterable[str],
+                           max_workers: int = MAX_WORKERS,
+                           per_host_limit: int = PER_HOST_LIMIT,
+                           timeout: float = 10,
+                           per_host_interval: float = 0,
+                           settings: Optional[Dict] = None,
+                           max_in_flight: int = MAX_IN_FLIGHT
+                           ) -> Iterator[Tuple[str, Optional[Certificate]]]:
+        """Fetch certificates for many domains concurrently
+
+        Every endpoint of a domain is checked (see endpoints(); settings
+        applies to all domains) and (domain, certificate or None) is
+        yielded once all of them are done, as aggregate_endpoints()
+        combines them. At most max_workers lookups and connections run at
+        once, at most per_host_limit connections go to any one IP address,
+        and connections to the same address start at least
+        per_host_interval seconds apart. Endpoints waiting for a busy
+        address are queued here rather than holding a worker thread.
+
+        domains is read as checks complete, keeping at most max_in_flight
+        domains in progress, so a long input is never held in memory. A
+        domain given again while it is still in progress is checked once.
+        """
+        domains = iter(domains)
+        with ThreadPoolExecutor(max_workers=max_workers) as pool:
+            pending = {}
+            in_flight = set()
+
+            def take_domains():
+                # Start resolving input domains while there is room
+                for domain in domains:
+                    if domain in in_flight:
+                        continue
+                    in_flight.add(domain)
+                    pending[pool.submit(self.endpoints, domain, settings)] = (
+                        domain, None)
+                    if len(in_flight) >= max_in_flight:
+                        break
+
+            take_domains()
+            waiting = defaultdict(deque)
+            active = Counter()
+            ready_at: Dict[str, float] = {}
+            # Endpoint results per domain, and how many are still to come
+            results: Dict[str, List] = defaultdict(list)
+            remaining: Dict[str, int] = {}
+
+            def dispatch(address):
+                # Start as many queued checks for address as limits allow
+                while (waiting[address] and active[address] < per_host_limit
+                       and time.monotonic() >= ready_at.get(address, 0)):
+                    queued, endpoint = waiting[address].popleft()
+                    active[address] += 1
+                    ready_at[address] = time.monotonic() + per_host_interval
+                    pending[pool.submit(self.check_endpoint, queued, endpoint,
+                                        timeout)] = (queued, endpoint)
+                if not waiting[address]:
+                    del waiting[address]
+
+            while pending or waiting:
+                # Sleep until a check completes or a rate-limited address
+                # may connect again; addresses at per_host_limit only move
+                # on when one of their checks completes
+                delay = None
+                ready = [ready_at.get(address, 0) for address in waiting
+                         if active[address] < per_host_limit]
+                if ready:
+                    delay = max(0.0, min(ready) - time.monotonic())
+                if pending:
+                    done, _ = wait(pending, timeout=delay,
+                                   return_when=FIRST_COMPLETED)
+                else:
+                    time.sleep(delay)
+                    done = set()
+
+                for future in done:
+                    domain, endpoint = pending.pop(future)
+                    if endpoint is None:
+                        # Resolved, now queue the connections
+                        endpoints = future.result()
+                        if not endpoints:
+                            in_flight.discard(domain)
+                            yield domain, None
+                            continue
+                        remaining[domain] = (remaining.get(domain, 0)
+                                             + len(endpoints))
+                        for endpoint in endpoints:
+                            waiting[endpoint[0]].append((domain, endpoint))
+                    else:
+                        active[endpoint[0]] -= 1
+                        results[domain].append((endpoint,) + future.result())
+                        remaining[domain] -= 1
+                        if not remaining[domain]:
+                            del remaining[domain]
+                            in_flight.discard(domain)
+                            yield domain, self.aggregate_endpoints(
+                                domain, results.pop(domain))
+                if len(in_flight) < max_in_flight:
+                    take_domains()
+                for address in list(waiting):
+                    dispatch(address)
+
+    def aggregate_endpoints(self, domain: str, results: List[Tuple]
+                            ) -> Optional[Certificate]:
+        """One certificate for a domain from (endpoint, certificate, error)
+        results, or None if no endpoint answered
+
+        The certificate expiring first stands for the domain, so a single
+        node serving an old certificate raises the alerts. The outcome at
+        every endpoint is kept in its endpoints list.
+        """
+        chosen = None
+        endpoints = []
+        for (address, port, server_name), cert, error in sorted(
+                results, key=lambda result: result[0]):
+            record = {'address': address, 'port': port,
+                      'server_name': server_name}
+            if cert is not None:
+                record['fingerprint'] = (cert.chain[0] if cert.chain
+                                         else cert.serial_number)
+                record['not_after'] = cert.not_after.isoformat()
+                if chosen is None or cert.not_after < chosen.not_after:
+                    chosen = cert
+            else:
+                record['error'] = error
+            endpoints.append(record)
+        if chosen is None:
+            return None
+        chosen.endpoints = endpoints
+        if len(endpoints) > 1:
+            disagreeing = self.disagreeing_endpoints(endpoints)
+            if disagreeing:
+                logging.warning(
+                    f"Endpoints of {domain} disagree: " + ', '.join(
+                        f"{e['address']} port {e['port']} as {e['server_name']}"
+                        for e in disagreeing))
+        return chosen
+
+    @staticmethod
+    def disagreeing_endpoints(endpoints: List[Dict]) -> List[Dict]:
+        """Endpoints that failed, or serve another certificate than most
+        addresses answering on the same port for the same SNI name"""
+        counts = defaultdict(Counter)
+        for endpoint in endpoints:
+            if 'fingerprint' in endpoint:
+                counts[endpoint.get('port'), endpoint.get('server_name')][
+                    endpoint['fingerprint']] += 1
+        majority = {group: count.most_common(1)[0][0]
+                    for group, count in counts.items()}
+        return [endpoint for endpoint in endpoints
+                if 'fingerprint' not in endpoint
+                or endpoint['fingerprint'] != majority[
+                    endpoint.get('port'), endpoint.get('server_name')]]
+
+    def _keep_settings(self, new_cert: Certificate, old_cert: Certificate):
+        # Preserve existing alert threshold, notes and endpoint settings
+        new_cert.alert_threshold = old_cert.alert_threshold
+        new_cert.notes = old_cert.notes
+        new_cert.added_date = old_cert.added_date
+        for name in ENDPOINT_SETTINGS:
+            setattr(new_cert, name, getattr(old_cert, name))
+
+    def refresh_certificates(self, domains: Optional[Iterable[str]] = None,
+                             on_result=None, **options) -> Tuple[int, int]:
+        """Refresh many certificates concurrently (all by default)
+
+        on_result(domain, success) is called as each check completes;
+        options are passed on to check_certificates. Refreshed
+        certificates are saved SAVE_BATCH at a time. Returns the number
+        refreshed and failed.
+        """
+        if domains is None:
+            domains = list(self.certificates.keys())
+        success = 0
+        failed = 0
+        unsaved = []
+        for domain, new_cert in self.check_certificates(domains, **options):
+            old_cert = self.certificates.get(domain)
+            if new_cert and old_cert:
+                self._keep_settings(new_cert, old_cert)
+                self._set_certificate(domain, new_cert)
+                unsaved.append(domain)
+                success += 1
+            else:
+                failed += 1
+            if len(unsaved) >= self.SAVE_BATCH:
+                self.save_certificates(unsaved)
+                unsaved = []
+            if on_result:
+                on_result(domain, bool(new_cert and old_cert))
+        self.save_certificates(unsaved)
+        logging.info(f"Refreshed {success} certificates, {failed} failed")
+        return success, failed
+
+    def status_record(self, domain: str) -> Dict:
+        """Expiration status of a domain as a JSON-serializable dict"""
+        record = {'domain': domain}
+        record.update(self.check_expiration(domain))
+        cert = self.certificates.get(domain)
+        if cert:
+            record['issuer'] = cert.issuer
+            record['not_after'] = cert.not_after.isoformat()
+            record['last_checked'] = cert.last_checked.isoformat()
+            if cert.chain:
+                record['fingerprint'] = cert.chain[0]
+            if len(cert.endpoints) > 1:
+                record['endpoints'] = len(cert.endpoints)
+                disagreeing = self.disagreeing_endpoints(cert.endpoints)
+                if disagreeing:
+                    record['disagreeing'] = disagreeing
+        return record
+
+    def expiring_intermediates(self, days: Optional[float] = None
+                               ) -> List[Tuple[ChainCertificate, List[str]]]:
+        """Intermediates expiring in the next days (all by default), with
+        the domains whose chains contain them, soonest first"""
+        limit = datetime.now() + timedelta(days=days) if days is not None else None
+        found = []
+        for fingerprint, domains in list(self._chain_domains.items()):
+            cert = self.chain_certificates.get(fingerprint)
+            if cert is not None and (limit is None or cert.not_after < limit):
+                found.append((cert, sorted(domains)))
+        found.sort(key=lambda item: (item[0].not_after, item[0].fingerprint))
+        return found
+
+    def expiring_within(self, days: float) -> List[str]:
+        """Domains whose certificates expire in the next days, soonest first"""
+        return self.index.expiring_before(datetime.now() + timedelta(days=days))
+
+    def monitor(self, on_alert, stop_event: threading.Event):
+        """Call on_alert(domain, expiry_info) as certificates need attention
+
+        Every certificate already in warning or expired state is reported
+        at the start. After that the loop sleeps until the next alert
+        instant in the index, or until certificates are added or
+        refreshed, and only looks at the certificates concerned. Each
+        certificate is reported once per state it enters. Runs until
+        stop_event is set; setting index.changed as well stops it at once.
+        """
+        reported: Dict[str, str] = {}
+
+        def review(domains):
+            for domain in domains:
+                if domain not in self.certificates:
+                    reported.pop(domain, None)
+                    continue
+                expiry_info = self.check_expiration(domain)
+                if expiry_info['status'] in ['expired', 'warning']:
+                    if reported.get(domain) != expiry_info['status']:
+                        reported[domain] = expiry_info['status']
+                        on_alert(domain, expiry_info)
+                else:
+                    reported.pop(domain, None)
+
+        self.index.take_changed()
+        review(list(self.certificates.keys()))
+        last = datetime.now()
+        while not stop_event.is_set():
+            timeout = self.MAX_MONITOR_SLEEP
+            next_event = self.index.next_event(last)
+            if next_event is not None:
+                timeout = min(timeout, max(
+                    0.0, (next_event[0] - datetime.now()).total_seconds()))
+            changed = self.index.changed.wait(timeout)
+            if stop_event.is_set():
+                break
+
+            now = datetime.now()
+            domains = {domain for _, _, domain
+                       in self.index.events_between(last, now)}
+            if changed:
+                self.index.changed.clear()
+                domains |= self.index.take_changed()
+            review(domains)
+            last = now
+
     def refresh_certificate(self, domain: str) -> bool:
         """Refresh certificate information"""
         try:
-            new_cert = self.get_certificate_info(domain)
+            _, new_cert = next(self.check_certificates([domain]))
             if new_cert:
-                # Preserve existing alert threshold and notes
-                new_cert.alert_threshold = self.certificates[domain].alert_threshold
-                new_cert.notes = self.certificates[domain].notes
-                self.certificates[domain] = new_cert
-                self.save_certificates()
+                self._keep_settings(new_cert, self.certificates[domain])
+                self._set_certificate(domain, new_cert)
+                self.save_certificates([domain])
                 logging.info(f"Refreshed certificate for {domain}")
                 return True
             return False
@@ -191,9 +1117,169 @@ class SSLCertificateManager:
             return False
 
 
+class RefreshScheduler:
+    """Refresh each certificate on its own schedule instead of all at once.
+
+    A certificate is checked again after VALIDITY_FRACTION of its
+    remaining validity, kept between MIN_INTERVAL and MAX_INTERVAL, so one
+    valid for a year is checked weekly and one about to expire hourly.
+    Certificates issued or swapped within ROTATION_WINDOW are checked every
+    ROTATED_INTERVAL to follow a rollout, and failed checks are retried
+    with exponential backoff from MIN_INTERVAL. Every interval gets up to
+    JITTER of random spread so checks do not line up.
+
+    The schedule is kept in memory and derived from last_checked when a
+    certificate is first seen, so nothing extra is stored.
+    """
+
+    MIN_INTERVAL = timedelta(hours=1)
+    MAX_INTERVAL = timedelta(days=7)
+    VALIDITY_FRACTION = 0.1
+    ROTATION_WINDOW = timedelta(days=2)
+    ROTATED_INTERVAL = timedelta(hours=6)
+    JITTER = 0.1
+
+    # Minimum seconds between handshakes to the same IP address
+    PER_HOST_INTERVAL = 1.0
+
+    # Longest run() sleeps before looking for new certificates
+    MAX_SLEEP = 5 * 60
+
+    def __init__(self, manager: 'SSLCertificateManager',
+                 per_host_interval: float = PER_HOST_INTERVAL, **options):
+        self.manager = manager
+        # Passed on to refresh_certificates
+        self.options = dict(options, per_host_interval=per_host_interval)
+        self.next_check: Dict[str, datetime] = {}
+        self.failures: Dict[str, int] = {}
+        self._heap: List[Tuple[datetime, str]] = []
+        self._checked: Dict[str, datetime] = {}
+        self._rotated: Dict[str, datetime] = {}
+        self._random = random.Random()
+
+    def interval(self, domain: str, now: Optional[datetime] = None) -> timedelta:
+        """Time until the next check of domain, before jitter"""
+        now = now or datetime.now()
+        cert = self.manager.certificates[domain]
+        interval = (cert.not_after - now) * self.VALIDITY_FRACTION
+        interval = min(max(interval, self.MIN_INTERVAL), self.MAX_INTERVAL)
+
+        rotated = max(cert.not_before, self._rotated.get(domain, cert.not_before))
+        if now - rotated < self.ROTATION_WINDOW:
+            interval = min(interval, self.ROTATED_INTERVAL)
+
+        failures = self.failures.get(domain, 0)
+        if failures:
+            interval = min(interval, self.MIN_INTERVAL * 2 ** (failures - 1))
+        return interval
+
+    def _schedule(self, domain: str, start: datetime, now: datetime):
+        spread = 1 + self.JITTER * self._random.uniform(-1, 1)
+        when = start + self.interval(domain, now) * spread
+        self.next_check[domain] = when
+        heapq.heappush(self._heap, (when, domain))
+
+    def sync(self, now: Optional[datetime] = None):
+        """Schedule new or otherwise refreshed certificates, drop removed ones"""
+        now = now or datetime.now()
+        for domain in list(self.next_check):
+            if domain not in self.manager.certificates:
+                del self.next_check[domain]
+                self._checked.pop(domain, None)
+                self._rotated.pop(domain, None)
+                self.failures.pop(domain, None)
+        for domain, cert in list(self.manager.certificates.items()):
+            if self._checked.get(domain) != cert.last_checked:
+                self._checked[domain] = cert.last_checked
+                self._schedule(domain, cert.last_checked, now)
+
+    def next_due(self) -> Optional[datetime]:
+        """When the next check is due, if any is scheduled"""
+        while self._heap:
+            when, domain = self._heap[0]
+            if self.next_check.get(domain) == when:
+                return when
+            # Superseded by a later _schedule() or a removal
+            heapq.heappop(self._heap)
+        return None
+
+    def due_domains(self, now: Optional[datetime] = None) -> List[str]:
+        """Domains whose next check is due, most overdue first"""
+        now = now or datetime.now()
+        self.sync(now)
+        return [domain for when, domain in sorted(self._heap)
+                if when <= now and self.next_check.get(domain) == when]
+
+    def refresh_due(self, now: Optional[datetime] = None,
+                    on_result=None) -> Tuple[int, int]:
+        """Refresh the domains that are due and schedule their next checks
+
+        on_result(domain, success) is called as each check completes.
+        Returns the number refreshed and failed.
+        """
+        now = now or datetime.now()
+        domains = self.due_domains(now)
+        if not domains:
+            return 0, 0
+        serials = {domain: self.manager.certificates[domain].serial_number
+                   for domain in domains}
+        reported = set()
+
+        def record(domain, success):
+            reported.add(domain)
+            done = datetime.now()
+            cert = self.manager.certificates.get(domain)
+            if cert is not None:
+                if success:
+                    self.failures.pop(domain, None)
+                    if cert.serial_number != serials[domain]:
+                        logging.info(f"Certificate for {domain} was rotated")
+                        self._rotated[domain] = done
+                    self._checked[domain] = cert.last_checked
+                else:
+                    self.failures[domain] = self.failures.get(domain, 0) + 1
+                self._schedule(domain, done, done)
+            if on_result:
+                on_result(domain, success)
+
+        logging.info(f"Scheduled refresh of {len(domains)} certificates")
+        try:
+            return self.manager.refresh_certificates(domains, on_result=record,
+                                                     **self.options)
+        finally:
+            # Checks cut short by an error count as failed, so they back
+            # off instead of being retried at once
+            for domain in domains:
+                if domain not in reported and domain in self.manager.certificates:
+                    self.failures[domain] = self.failures.get(domain, 0) + 1
+                    self._schedule(domain, datetime.now(), datetime.now())
+
+    def run(self, stop_event: threading.Event, on_result=None):
+        """Refresh certificates as they fall due until stop_event is set"""
+        while not stop_event.is_set():
+            try:
+                self.refresh_due(on_result=on_result)
+            except Exception as e:
+                logging.error(f"Error in scheduled refresh: {e}")
+            timeout = self.MAX_SLEEP
+            next_due = self.next_due()
+            if next_due is not None:
+                timeout = min(timeout, max(
+                    0.0, (next_due - datetime.now()).total_seconds()))
+            stop_event.wait(timeout)
+
+
 class SSLManagerGUI:
-    def __init__(self):
-        self.manager = SSLCertificateManager()
+    # Rows updated per pass of the Tk loop, so long lists stay responsive
+    ROW_BATCH = 2000
+
+    # How often every row is recomputed, as days left change (ms)
+    FULL_UPDATE_INTERVAL = 60 * 60 * 1000
+
+    STATUS_ORDER = {'expired': 0, 'warning': 1, 'ok': 2}
+
+    def __init__(self, store: Optional[CertificateStore] = None):
+        self.manager = SSLCertificateManager(store)
 
         self.root = ctk.CTk()
         self.root.title("SSL Certificate Manager")
@@ -203,8 +1289,23 @@ class SSLManagerGUI:
         ctk.set_appearance_mode("dark")
         ctk.set_default_color_theme("blue")
 
+        # Background threads never touch widgets, they queue events instead
+        self.events = queue.Queue()
+        self.root.after(100, self.process_events)
+
+        # Rows are keyed by domain; _rows holds what each shows and _order
+        # the visible rows as sorted (key, domain) pairs
+        self._rows: Dict[str, Tuple] = {}
+        self._keys: Dict[str, Tuple] = {}
+        self._order: List[Tuple] = []
+        self.sort_column = "Domain"
+        self.sort_reverse = False
+        self._filter = ""
+        self._filter_job = None
+
         self.setup_gui()
         self.start_monitoring()
+        self.start_scheduler()
 
     def setup_gui(self):
         # Main container
@@ -240,6 +1341,14 @@ class SSLManagerGUI:
         )
         add_btn.pack(side="left", padx=5)
 
+        self.filter_entry = ctk.CTkEntry(
+            control_frame,
+            placeholder_text="Filter",
+            width=160
+        )
+        self.filter_entry.pack(side="left", padx=10)
+        self.filter_entry.bind("<KeyRelease>", self.on_filter_changed)
+
         # Action Buttons (Right side)
         remove_btn = ctk.CTkButton(
             control_frame,
@@ -250,12 +1359,12 @@ class SSLManagerGUI:
         )
         remove_btn.pack(side="right", padx=10)
 
-        refresh_btn = ctk.CTkButton(
+        self.refresh_btn = ctk.CTkButton(
             control_frame,
             text="Refresh All",
             command=self.refresh_all
         )
-        refresh_btn.pack(side="right", padx=10)
+        self.refresh_btn.pack(side="right", padx=10)
 
         # Certificate List with Headers
         list_frame = ctk.CTkFrame(main_frame)
@@ -282,6 +1391,15 @@ class SSLManagerGUI:
         self.cert_tree.column("Days Left", width=80, stretch=False)
         self.cert_tree.column("Status", width=200, stretch=True)
 
+        for column in columns:
+            self.cert_tree.heading(
+                column, command=lambda column=column: self.sort_by(column))
+
+        # Configure tag colors
+        self.cert_tree.tag_configure('expired', foreground='red')
+        self.cert_tree.tag_configure('warning', foreground='orange')
+        self.cert_tree.tag_configure('ok', foreground='green')
+
         # Add scrollbar
         scrollbar = ttk.Scrollbar(
             list_frame,
@@ -321,13 +1439,14 @@ class SSLManagerGUI:
         self.status_bar.pack(fill="x", padx=10, pady=(0, 5))
 
         # Initial update
+        self.update_heading_arrows()
         self.update_certificate_list()
-    
+        self.root.after(self.FULL_UPDATE_INTERVAL, self.periodic_update)
+
     def on_select(self, event):
         selection = self.cert_tree.selection()
         if selection:
-            item = selection[0]
-            domain = self.cert_tree.item(item)['values'][0]
+            domain = selection[0]
             cert = self.manager.certificates[domain]
             expiry_info = self.manager.check_expiration(domain)
 
@@ -357,7 +1476,7 @@ class SSLManagerGUI:
             return
 
         if self.manager.add_certificate(domain, threshold):
-            self.update_certificate_list()
+            self.update_certificate_list([domain])
             self.domain_entry.delete(0, 'end')
             self.threshold_entry.delete(0, 'end')
             CTkMessagebox(title="Success",
@@ -375,8 +1494,7 @@ class SSLManagerGUI:
                 title="Error", message="Please select a certificate to remove")
             return
 
-        item = selection[0]
-        domain = self.cert_tree.item(item)['values'][0]
+        domain = selection[0]
 
         if CTkMessagebox(
             title="Confirm Removal",
@@ -387,39 +1505,137 @@ class SSLManagerGUI:
         ).get() == "Yes":
             self.remove_certificate(domain)
 
-    def update_certificate_list(self):
-        # Clear existing items
-        for item in self.cert_tree.get_children():
-            self.cert_tree.delete(item)
+    def update_certificate_list(self, domains: Optional[Iterable[str]] = None):
+        """Bring the rows of the given domains (all by default) up to date
 
-        # Add certificates to list
-        for domain, cert in self.manager.certificates.items():
-            expiry_info = self.manager.check_expiration(domain)
+        Only rows whose contents changed are touched. Updating every row
+        also drops rows of removed certificates, and runs ROW_BATCH rows
+        per pass of the Tk loop.
+        """
+        if domains is None:
+            domains = set(self.manager.certificates) | set(self._rows)
+        pending = iter(list(domains))
+
+        def update_batch():
+            batch = list(islice(pending, self.ROW_BATCH))
+            for domain in batch:
+                self._update_row(domain)
+            if len(batch) == self.ROW_BATCH:
+                self.root.after(1, update_batch)
+
+        update_batch()
+
+    def periodic_update(self):
+        self.update_certificate_list()
+        self.root.after(self.FULL_UPDATE_INTERVAL, self.periodic_update)
 
+    def _update_row(self, domain: str):
+        cert = self.manager.certificates.get(domain)
+        row = None
+        if cert is not None:
+            expiry_info = self.manager.check_expiration(domain)
+            values = (domain,
+                      cert.issuer,
+                      cert.not_after.strftime('%Y-%m-%d'),
+                      expiry_info['days'],
+                      expiry_info['message'])
             # Set row color based on status
-            tags = (expiry_info['status'],)
-
-            self.cert_tree.insert(
-                "",
-                "end",
-                values=(
-                    domain,
-                    cert.issuer,
-                    cert.not_after.strftime('%Y-%m-%d'),
-                    expiry_info['days'],
-                    expiry_info['message']
-                ),
-                tags=tags
-            )
+            row = (values, expiry_info['status'])
+            if not self._matches_filter(values, expiry_info['status']):
+                row = None
 
-        # Configure tag colors
-        self.cert_tree.tag_configure('expired', foreground='red')
-        self.cert_tree.tag_configure('warning', foreground='orange')
-        self.cert_tree.tag_configure('ok', foreground='green')
+        old_row = self._rows.get(domain)
+        if row == old_row:
+            return
+        if row is None:
+            self._unindex(domain)
+            self.cert_tree.delete(domain)
+            del self._rows[domain]
+            return
+
+        key = self._sort_key(domain, cert, row[1])
+        if old_row is None:
+            self.cert_tree.insert("", self._index(domain, key), iid=domain,
+                                  values=row[0], tags=(row[1],))
+        else:
+            self.cert_tree.item(domain, values=row[0], tags=(row[1],))
+            if key != self._keys[domain]:
+                self._unindex(domain)
+                self.cert_tree.move(domain, "", self._index(domain, key))
+        self._rows[domain] = row
+
+    def _sort_key(self, domain: str, cert: Certificate, status: str) -> Tuple:
+        if self.sort_column == "Issuer":
+            key = cert.issuer.lower()
+        elif self.sort_column in ("Expires", "Days Left"):
+            key = cert.not_after
+        elif self.sort_column == "Status":
+            key = (self.STATUS_ORDER.get(status, 0), cert.not_after)
+        else:
+            key = domain.lower()
+        return (key, domain)
+
+    def _index(self, domain: str, key: Tuple) -> int:
+        """Add a row to the sort order and return its position in the view"""
+        position = bisect.bisect_left(self._order, key)
+        self._order.insert(position, key)
+        self._keys[domain] = key
+        if self.sort_reverse:
+            return len(self._order) - 1 - position
+        return position
+
+    def _unindex(self, domain: str):
+        key = self._keys.pop(domain)
+        del self._order[bisect.bisect_left(self._order, key)]
+
+    def _matches_filter(self, values: Tuple, status: str) -> bool:
+        if not self._filter:
+            return True
+        domain, issuer, _, _, message = values
+        return any(self._filter in text.lower()
+                   for text in (domain, issuer, message, status))
+
+    def sort_by(self, column: str):
+        """Sort rows by column, or reverse the order if already sorted by it"""
+        if column == self.sort_column:
+            self.sort_reverse = not self.sort_reverse
+        else:
+            self.sort_column = column
+            self.sort_reverse = False
+        self._keys = {
+            domain: self._sort_key(domain, self.manager.certificates[domain],
+                                   status)
+            for domain, (_, status) in self._rows.items()}
+        self._order = sorted(self._keys.values())
+        order = [domain for _, domain in self._order]
+        if self.sort_reverse:
+            order.reverse()
+        self.cert_tree.set_children("", *order)
+        self.update_heading_arrows()
+
+    def update_heading_arrows(self):
+        for column in self.cert_tree["columns"]:
+            text = column
+            if column == self.sort_column:
+                text += " \u25bc" if self.sort_reverse else " \u25b2"
+            self.cert_tree.heading(column, text=text)
+
+    def on_filter_changed(self, event=None):
+        # Wait for a pause in typing before going through every row
+        if self._filter_job is not None:
+            self.root.after_cancel(self._filter_job)
+        self._filter_job = self.root.after(300, self.apply_filter)
+
+    def apply_filter(self):
+        self._filter_job = None
+        self._filter = self.filter_entry.get().strip().lower()
+        self.update_certificate_list()
 
     def show_certificate_details(self, event):
-        item = self.cert_tree.selection()[0]
-        domain = self.cert_tree.item(item)['values'][0]
+        selection = self.cert_tree.selection()
+        if not selection:
+            return
+        domain = selection[0]
         cert = self.manager.certificates[domain]
 
         details_window = ctk.CTkToplevel(self.root)
@@ -439,7 +1655,13 @@ class SSLManagerGUI:
             ("Version", cert.version),
             ("Added Date", cert.added_date.strftime('%Y-%m-%d %H:%M:%S')),
             ("Last Checked", cert.last_checked.strftime('%Y-%m-%d %H:%M:%S')),
-            ("Alert Threshold", f"{cert.alert_threshold} days")
+            ("Alert Threshold", f"{cert.alert_threshold} days"),
+            ("Fingerprint", cert.chain[0] if cert.chain else "Unknown"),
+            ("Chain", " \u2192 ".join(
+                self.manager.chain_certificates[fingerprint].subject
+                if fingerprint in self.manager.chain_certificates else "?"
+                for fingerprint in cert.chain[1:]) or "Not captured"),
+            ("Endpoints", self.endpoint_summary(cert))
         ]
 
         for label, value in details:
@@ -461,7 +1683,7 @@ class SSLManagerGUI:
 
         def save_notes():
             cert.notes = notes_text.get("1.0", "end-1c")
-            self.manager.save_certificates()
+            self.manager.save_certificates([domain])
             CTkMessagebox(title="Success", message="Notes saved")
 
         ctk.CTkButton(notes_frame, text="Save Notes",
@@ -486,9 +1708,20 @@ class SSLManagerGUI:
             command=lambda: self.remove_certificate(domain, details_window)
         ).pack(side="right", padx=5)
 
+    def endpoint_summary(self, cert: Certificate) -> str:
+        if not cert.endpoints:
+            return "Not checked yet"
+        disagreeing = self.manager.disagreeing_endpoints(cert.endpoints)
+        summary = f"{len(cert.endpoints)} checked"
+        if disagreeing:
+            summary += ", disagreeing: " + ", ".join(
+                f"{endpoint['address']}:{endpoint['port']}"
+                for endpoint in disagreeing)
+        return summary
+
     def refresh_certificate(self, domain):
         if self.manager.refresh_certificate(domain):
-            self.update_certificate_list()
+            self.update_certificate_list([domain])
             CTkMessagebox(title="Success",
                           message=f"Refreshed certificate for {domain}")
         else:
@@ -499,7 +1732,7 @@ class SSLManagerGUI:
 
     def remove_certificate(self, domain, details_window=None):
         if self.manager.remove_certificate(domain):
-            self.update_certificate_list()
+            self.update_certificate_list([domain])
             CTkMessagebox(title="Success",
                           message=f"Removed certificate for {domain}")
             if details_window:
@@ -510,34 +1743,83 @@ class SSLManagerGUI:
                 message=f"Could not remove certificate for {domain}"
             )
 
+    def process_events(self):
+        """Apply events queued by background threads on the Tk thread"""
+        scheduled = set()
+        try:
+            while True:
+                event = self.events.get_nowait()
+                if event[0] == 'alert':
+                    _, domain, message = event
+                    self.update_certificate_list([domain])
+                    self.show_notification(domain, message)
+                elif event[0] == 'scheduled_refresh':
+                    # Updated together below, however many arrived
+                    scheduled.add(event[1])
+                elif event[0] == 'refresh_progress':
+                    _, done, total = event
+                    self.status_bar.configure(
+                        text=f"Refreshing certificates... {done}/{total}")
+                elif event[0] == 'refresh_done':
+                    _, success, failed = event
+                    self.refresh_btn.configure(state="normal")
+                    self.status_bar.configure(text="Ready")
+                    self.update_certificate_list()
+                    CTkMessagebox(
+                        title="Refresh Complete",
+                        message=f"Successfully refreshed {success} certificates\nFailed to refresh {failed} certificates"
+                    )
+        except queue.Empty:
+            pass
+        if scheduled:
+            self.update_certificate_list(scheduled)
+        self.root.after(100, self.process_events)
+
     def refresh_all(self):
-        success = 0
-        failed = 0
+        domains = list(self.manager.certificates.keys())
+        self.refresh_btn.configure(state="disabled")
+        self.status_bar.configure(
+            text=f"Refreshing certificates... 0/{len(domains)}")
 
-        for domain in list(self.manager.certificates.keys()):
-            if self.manager.refresh_certificate(domain):
-                success += 1
-            else:
-                failed += 1
+        def refresh():
+            done = 0
 
-        self.update_certificate_list()
-        CTkMessagebox(
-            title="Refresh Complete",
-            message=f"Successfully refreshed {success} certificates\nFailed to refresh {failed} certificates"
-        )
+            def on_result(domain, success):
+                nonlocal done
+                done += 1
+                self.events.put(('refresh_progress', done, len(domains)))
+
+            try:
+                success, failed = self.manager.refresh_certificates(
+                    domains, on_result=on_result)
+            except Exception as e:
+                logging.error(f"Error refreshing certificates: {e}")
+                success, failed = done, len(domains) - done
+            self.events.put(('refresh_done', success, failed))
+
+        threading.Thread(target=refresh, daemon=True).start()
 
     def start_monitoring(self):
         """Start background monitoring thread"""
-        def monitor():
-            while True:
-                for domain in list(self.manager.certificates.keys()):
-                    expiry_info = self.manager.check_expiration(domain)
-                    if expiry_info['status'] in ['expired', 'warning']:
-                        self.show_notification(domain, expiry_info['message'])
-                self.update_certificate_list()
-                time.sleep(3600)  # Check every hour
-
-        thread = threading.Thread(target=monitor, daemon=True)
+        def on_alert(domain, expiry_info):
+            self.events.put(('alert', domain, expiry_info['message']))
+
+        self.monitor_stop = threading.Event()
+        thread = threading.Thread(target=self.manager.monitor,
+                                  args=(on_alert, self.monitor_stop),
+                                  daemon=True)
+        thread.start()
+
+    def start_scheduler(self):
+        """Start the background thread refreshing certificates as they fall due"""
+        def on_result(domain, success):
+            self.events.put(('scheduled_refresh', domain, success))
+
+        self.scheduler = RefreshScheduler(self.manager)
+        self.scheduler_stop = threading.Event()
+        thread = threading.Thread(target=self.scheduler.run,
+                                  args=(self.scheduler_stop, on_result),
+                                  daemon=True)
         thread.start()
 
     def show_notification(self, domain: str, message: str):
@@ -556,10 +1838,244 @@ def main():
     parser = argparse.ArgumentParser(description='SSL Certificate Manager')
     parser.add_argument('--cli', action='store_true',
                         help='Run in command-line mode')
+    parser.add_argument('--store', choices=['sqlite', 'json'], default='sqlite',
+                        help='Keep certificates in certificates.db (default; '
+                        'certificates.json is migrated once) or in '
+                        'certificates.json')
+
+    # Options shared by the commands that connect to servers
+    check_options = argparse.ArgumentParser(add_help=False)
+    check_options.add_argument(
+        '--workers', type=int, default=SSLCertificateManager.MAX_WORKERS,
+        help='Checks running at once')
+    check_options.add_argument(
+        '--per-host', type=int, default=SSLCertificateManager.PER_HOST_LIMIT,
+        help='Connections at once to the same IP address')
+    check_options.add_argument(
+        '--per-host-interval', type=float, default=None,
+        help='Minimum seconds between connections to the same IP address '
+        f'(default: 0 for refresh, {RefreshScheduler.PER_HOST_INTERVAL:g} '
+        'for schedule and refresh --due)')
+    check_options.add_argument('--timeout', type=float, default=10,
+                               help='Connection timeout in seconds')
+
+    subparsers = parser.add_subparsers(dest='command')
+    refresh_parser = subparsers.add_parser(
+        'refresh', parents=[check_options],
+        help='Refresh certificates concurrently')
+    refresh_parser.add_argument('domains', nargs='*',
+                                help='Domains to refresh (default: all)')
+    refresh_parser.add_argument(
+        '--due', action='store_true',
+        help='Only refresh certificates whose scheduled check is due, '
+        'e.g. from cron')
+    subparsers.add_parser(
+        'schedule', parents=[check_options],
+        help='Keep refreshing each certificate when its check is due')
+
+    # Batch commands print one JSON record per domain and exit with the
+    # worst status seen (0 ok, 1 warning or disagreeing endpoints,
+    # 2 expired, 3 error)
+    add_parser = subparsers.add_parser(
+        'add', parents=[check_options], help='Add domains to monitor')
+    add_parser.add_argument('domains', nargs='+', help='Domains to add')
+    import_parser = subparsers.add_parser(
+        'import', parents=[check_options],
+        help='Add the domains listed in a text or CSV file')
+    import_parser.add_argument(
+        'file', help="One domain per line, or CSV rows of "
+        "domain[,alert_threshold] ('-' reads standard input)")
+    for command_parser in (add_parser, import_parser):
+        command_parser.add_argument(
+            '--threshold', type=int, default=30,
+            help='Days before expiration to start alerting (default: 30)')
+        command_parser.add_argument(
+            '--port', type=int, action='append', dest='ports', default=None,
+            help=f'Port to check, may be repeated (default: {DEFAULT_PORT})')
+        command_parser.add_argument(
+            '--sni', action='append', dest='sni_names', default=None,
+            help='Server name to send instead of the domain, may be repeated')
+        command_parser.add_argument(
+            '--all-addresses', action='store_true',
+            help='Check every A/AAAA address instead of the first one')
+    check_parser = subparsers.add_parser(
+        'check', help='Report the expiration status of stored certificates')
+    check_parser.add_argument('domains', nargs='*',
+                              help='Domains to check (default: all)')
+    list_parser = subparsers.add_parser('list', help='List certificates')
+    list_parser.add_argument(
+        '--expiring', type=float, default=None, metavar='DAYS',
+        help='Only certificates expiring within DAYS, soonest first')
+    intermediates_parser = subparsers.add_parser(
+        'intermediates',
+        help='List intermediate certificates and the domains that serve them')
+    intermediates_parser.add_argument(
+        '--expiring', type=float, default=None, metavar='DAYS',
+        help='Only intermediates expiring within DAYS, soonest first')
+    export_parser = subparsers.add_parser(
+        'export', help='Write all certificates to standard output or a file')
+    export_parser.add_argument('--format', choices=['csv', 'json', 'ndjson'],
+                               default='csv',
+                               help='csv (default; can be imported again), '
+                               'json (the certificates.json layout) or ndjson')
+    export_parser.add_argument('--output', '-o', default=None,
+                               help='File to write instead of standard output')
     args = parser.parse_args()
 
-    if args.cli:
-        manager = SSLCertificateManager()
+    if args.command is not None:
+        manager = SSLCertificateManager(open_store(args.store))
+
+    def emit(record):
+        print(json.dumps(record), flush=True)
+
+    def status_exit_code(record):
+        code = STATUS_EXIT_CODES[record['status']]
+        if 'disagreeing' in record:
+            code = max(code, STATUS_EXIT_CODES['warning'])
+        return code
+
+    if args.command in ('refresh', 'schedule', 'add', 'import'):
+        options = {'max_workers': args.workers,
+                   'per_host_limit': args.per_host,
+                   'timeout': args.timeout}
+        if args.per_host_interval is not None:
+            options['per_host_interval'] = args.per_host_interval
+
+        def print_result(domain, success):
+            if success:
+                expiry_info = manager.check_expiration(domain)
+                print(f"{domain}: {expiry_info['message']}", flush=True)
+            else:
+                print(f"{domain}: failed to refresh", flush=True)
+
+    if args.command == 'schedule':
+        scheduler = RefreshScheduler(manager, **options)
+        print(f"Scheduling {len(manager.certificates)} certificates, "
+              "press Ctrl+C to stop", flush=True)
+        try:
+            scheduler.run(threading.Event(), on_result=print_result)
+        except KeyboardInterrupt:
+            pass
+    elif args.command == 'refresh':
+        start = time.monotonic()
+        if args.due:
+            if args.domains:
+                parser.error('refresh --due takes no domains')
+            scheduler = RefreshScheduler(manager, **options)
+            success, failed = scheduler.refresh_due(on_result=print_result)
+        else:
+            domains = args.domains or list(manager.certificates.keys())
+            unknown = [domain for domain in domains
+                       if domain not in manager.certificates]
+            for domain in unknown:
+                print(f"Not monitored: {domain}")
+            domains = [domain for domain in domains
+                       if domain in manager.certificates]
+            success, failed = manager.refresh_certificates(
+                domains, on_result=print_result, **options)
+        print(f"\nRefreshed {success} certificates, {failed} failed "
+              f"in {time.monotonic() - start:.1f}s")
+    elif args.command in ('add', 'import'):
+        exit_code = 0
+        settings = {name: getattr(args, name) for name in ENDPOINT_SETTINGS
+                    if getattr(args, name)}
+        if settings:
+            options['settings'] = settings
+        source = None
+        if args.command == 'add':
+            entries = ((domain, args.threshold) for domain in args.domains)
+        elif args.file == '-':
+            entries = read_domain_list(sys.stdin, args.threshold)
+        else:
+            try:
+                source = open(args.file, newline='')
+            except OSError as e:
+                print(f"Error reading domain list: {e}", file=sys.stderr)
+                sys.exit(STATUS_EXIT_CODES['error'])
+            entries = read_domain_list(source, args.threshold)
+
+        def new_domains():
+            # Domains already monitored keep their certificate and settings
+            nonlocal exit_code
+            for domain, threshold in entries:
+                if domain in manager.certificates:
+                    record = manager.status_record(domain)
+                    record['action'] = 'exists'
+                    exit_code = max(exit_code, STATUS_EXIT_CODES[record['status']])
+                    emit(record)
+                else:
+                    yield domain, threshold
+
+        def emit_result(domain, success):
+            nonlocal exit_code
+            if success:
+                record = manager.status_record(domain)
+                record['action'] = 'added'
+            else:
+                record = {'domain': domain, 'status': 'error',
+                          'message': 'Could not fetch certificate'}
+            exit_code = max(exit_code, STATUS_EXIT_CODES[record['status']])
+            emit(record)
+
+        try:
+            manager.add_certificates(new_domains(), on_result=emit_result,
+                                     **options)
+        except (OSError, ValueError) as e:
+            print(f"Error reading domain list: {e}", file=sys.stderr)
+            exit_code = STATUS_EXIT_CODES['error']
+        finally:
+            if source is not None:
+                source.close()
+        sys.exit(exit_code)
+    elif args.command == 'check':
+        exit_code = 0
+        for domain in args.domains or list(manager.certificates.keys()):
+            record = manager.status_record(domain)
+            exit_code = max(exit_code, status_exit_code(record))
+            emit(record)
+        sys.exit(exit_code)
+    elif args.command == 'list':
+        if args.expiring is not None:
+            domains = manager.expiring_within(args.expiring)
+        else:
+            domains = list(manager.certificates.keys())
+        exit_code = 0
+        for domain in domains:
+            record = manager.status_record(domain)
+            exit_code = max(exit_code, status_exit_code(record))
+            emit(record)
+        sys.exit(exit_code)
+    elif args.command == 'intermediates':
+        for cert, domains in manager.expiring_intermediates(args.expiring):
+            emit({'fingerprint': cert.fingerprint,
+                  'subject': cert.subject,
+                  'issuer': cert.issuer,
+                  'not_after': cert.not_after.isoformat(),
+                  'domains': domains})
+    elif args.command == 'export':
+        output = open(args.output, 'w', newline='') if args.output else sys.stdout
+        try:
+            records = (dict(certificate_to_dict(cert), domain=domain)
+                       for domain, cert in manager.certificates.items())
+            if args.format == 'csv':
+                writer = csv.DictWriter(output,
+                                        SQLiteCertificateStore.COLUMNS)
+                writer.writeheader()
+                writer.writerows({name: csv_value(value)
+                                  for name, value in record.items()}
+                                 for record in records)
+            elif args.format == 'json':
+                json.dump({record['domain']: record for record in records},
+                          output, indent=2)
+                output.write('\n')
+            else:
+                for record in records:
+                    output.write(json.dumps(record) + '\n')
+        finally:
+            if args.output:
+                output.close()
+    elif args.cli:
+        manager = SSLCertificateManager(open_store(args.store))
         while True:
             print("\nSSL Certificate Manager")
             print("1. Add certificate")
@@ -617,7 +2133,7 @@ def main():
             else:
                 print("Invalid choice")
     else:
-        app = SSLManagerGUI()
+        app = SSLManagerGUI(open_store(args.store))
         app.run()
 
 
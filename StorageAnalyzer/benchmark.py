@@ -0,0 +1,298 @@
+#!/usr/bin/env python3
+"""Benchmark scan engines of storage_analyzer.py on synthetic trees.
+
+A reproducible tree is generated in a temporary directory (files are sparse,
+so large size distributions cost no disk space) and every engine is run on
+it in a fresh subprocess, so peak RSS is measured per engine. When strace is
+installed the subprocess runs under `strace -f -c` to count syscalls.
+Results are written as JSON for comparison across versions.
+"""
+import os
+import sys
+import json
+import math
+import random
+import shutil
+import argparse
+import platform
+import resource
+import statistics
+import subprocess
+import tempfile
+import time
+from typing import Dict, List, Optional, Tuple
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from storage_analyzer import FileAnalyzer, ScanIndex
+
+
+def generate_tree(root: str, depth: int = 3, fanout: int = 5,
+                  files_per_dir: int = 20, size_distribution: str = 'lognormal',
+                  mean_size: int = 64 * 1024, seed: int = 0) -> Dict:
+    """Create a synthetic directory tree below root and describe it.
+
+    Every directory down to depth has fanout subdirectories and
+    files_per_dir files. File sizes follow size_distribution ('fixed',
+    'uniform' or 'lognormal') around mean_size; the same seed always gives
+    the same tree. Directory mtimes are set an hour back, as on a tree
+    that has settled, so ScanIndex stores them.
+    """
+    rng = random.Random(seed)
+    extensions = ['.txt', '.py', '.jpg', '.log', '.json', '.bin', '']
+
+    def file_size():
+        if size_distribution == 'fixed':
+            return mean_size
+        if size_distribution == 'uniform':
+            return rng.randint(0, 2 * mean_size)
+        # Median of e^mu with sigma 1.5 gives a long tail, like real data
+        sigma = 1.5
+        mu = max(0.0, math.log(mean_size) - sigma ** 2 / 2)
+        return int(rng.lognormvariate(mu, sigma))
+
+    total_files = 0
+    total_dirs = 0
+    total_size = 0
+    directories = []
+    pending = [(root, 0)]
+    while pending:
+        directory, level = pending.pop()
+        os.makedirs(directory, exist_ok=True)
+        directories.append(directory)
+        for i in range(files_per_dir):
+            size = file_size()
+            name = f"file{i}{rng.choice(extensions)}"
+            with open(os.path.join(directory, name), 'wb') as f:
+                f.truncate(size)
+            total_files += 1
+            total_size += size
+        if level < depth:
+            for i in range(fanout):
+                pending.append((os.path.join(directory, f"dir{i}"), level + 1))
+                total_dirs += 1
+
+    settled = time.time() - 3600
+    for directory in directories:
+        os.utime(directory, (settled, settled))
+
+    return {
+        'depth': depth,
+        'fanout': fanout,
+        'files_per_dir': files_per_dir,
+        'size_distribution': size_distribution,
+        'mean_size': mean_size,
+        'seed': seed,
+        'total_files': total_files,
+        'total_dirs': total_dirs,
+        'total_size': total_size
+    }
+
+
+def _walk_baseline(path: str) -> int:
+    """The original os.walk + os.stat scan loop, for reference"""
+    files = 0
+    for root, _, names in os.walk(path):
+        for name in names:
+            try:
+                os.stat(os.path.join(root, name))
+                files += 1
+            except OSError:
+                pass
+    return files
+
+
+def _scan(path: str, **kwargs) -> int:
+    return FileAnalyzer().scan_directory(path, **kwargs)['total_files']
+
+
+def _scan_incremental(path: str) -> Tuple[int, float, Dict]:
+    # Time a rescan served from a warm index, as a nightly job would see it
+    with tempfile.TemporaryDirectory() as tmp:
+        index = ScanIndex(os.path.join(tmp, 'index.db'))
+        FileAnalyzer().scan_directory(path, index=index)
+        index.hits = index.misses = 0
+        start = time.perf_counter()
+        files = FileAnalyzer().scan_directory(path, index=index)['total_files']
+        elapsed = time.perf_counter() - start
+        index.close()
+        return files, elapsed, {'index_hits': index.hits,
+                                'index_misses': index.misses}
+
+
+ENGINES = {
+    'os.walk': _walk_baseline,
+    'scan_directory': _scan,
+    'scan_directory-1-worker': lambda path: _scan(path, workers=1),
+    'scan_directory-incremental': _scan_incremental,
+}
+
+
+def run_engine(engine: str, path: str) -> Dict:
+    """Run one engine in this process and measure it"""
+    start = time.perf_counter()
+    result = ENGINES[engine](path)
+    elapsed = time.perf_counter() - start
+    extra = {}
+    if isinstance(result, tuple):
+        # Engines that do setup work report their own timed section, and
+        # may add measurements of their own
+        result, elapsed, extra = result
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    measurement = {
+        'files': result,
+        'seconds': elapsed,
+        'files_per_sec': result / elapsed if elapsed > 0 else None,
+        # ru_maxrss is in kilobytes on Linux and bytes on macOS
+        'peak_rss': usage.ru_maxrss * (1 if sys.platform == 'darwin' else 1024)
+    }
+    measurement.update(extra)
+    try:
+        with open('/proc/self/io') as f:
+            io = dict(line.split(': ') for line in f.read().splitlines())
+        measurement['read_syscalls'] = int(io['syscr'])
+    except OSError:
+        pass
+    return measurement
+
+
+def _parse_strace_summary(text: str) -> Dict:
+    """Extract per-syscall call counts from `strace -c` output"""
+    calls = {}
+    for line in text.splitlines():
+        fields = line.split()
+        # % time, seconds, usecs/call, calls, [errors,] syscall
+        if len(fields) >= 5 and fields[3].isdigit():
+            calls[fields[-1]] = int(fields[3])
+    return calls
+
+
+def measure(engine: str, path: str, use_strace: bool) -> Dict:
+    """Run engine on path in a fresh interpreter, optionally under strace"""
+    command = [sys.executable, os.path.abspath(__file__), '_run', engine, path]
+    strace_file = None
+    if use_strace:
+        fd, strace_file = tempfile.mkstemp(suffix='.strace')
+        os.close(fd)
+        command = ['strace', '-f', '-c', '-o', strace_file] + command
+    try:
+        output = subprocess.run(command, check=True, capture_output=True,
+                                text=True).stdout
+        measurement = json.loads(output.strip().splitlines()[-1])
+        if strace_file:
+            with open(strace_file) as f:
+                syscalls = _parse_strace_summary(f.read())
+            measurement['syscalls'] = syscalls.pop('total', None)
+            measurement['syscalls_by_name'] = syscalls
+        return measurement
+    finally:
+        if strace_file:
+            os.unlink(strace_file)
+
+
+def run_benchmark(engines: List[str], tree: Dict, repeat: int = 3,
+                  use_strace: Optional[bool] = None,
+                  workdir: Optional[str] = None) -> Dict:
+    """Generate a tree, run every engine repeat times and collect results"""
+    if use_strace is None:
+        use_strace = shutil.which('strace') is not None
+
+    root = tempfile.mkdtemp(prefix='scan-bench-', dir=workdir)
+    try:
+        tree_info = generate_tree(os.path.join(root, 'tree'), **tree)
+        results = {}
+        for engine in engines:
+            runs = [measure(engine, os.path.join(root, 'tree'), False)
+                    for _ in range(repeat)]
+            result = {
+                'files': runs[0]['files'],
+                'seconds': statistics.median(r['seconds'] for r in runs),
+                'seconds_min': min(r['seconds'] for r in runs),
+                'peak_rss': max(r['peak_rss'] for r in runs),
+                'runs': runs
+            }
+            result['files_per_sec'] = result['files'] / result['seconds']
+            if 'index_hits' in runs[0]:
+                result['index_hits'] = min(r['index_hits'] for r in runs)
+                result['index_misses'] = max(r['index_misses'] for r in runs)
+                if not result['index_hits']:
+                    print(f"Warning: {engine} was never served from the "
+                          f"index, so it timed a cold scan", file=sys.stderr)
+            if use_strace:
+                # Traced separately: strace overhead would skew the timings
+                traced = measure(engine, os.path.join(root, 'tree'), True)
+                result['syscalls'] = traced.get('syscalls')
+                result['syscalls_by_name'] = traced.get('syscalls_by_name')
+            results[engine] = result
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
+
+    return {
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'tree': tree_info,
+        'results': results
+    }
+
+
+def main():
+    if len(sys.argv) == 4 and sys.argv[1] == '_run':
+        # Child process started by measure()
+        print(json.dumps(run_engine(sys.argv[2], sys.argv[3])))
+        return
+
+    parser = argparse.ArgumentParser(
+        description='Benchmark storage_analyzer scan engines')
+    parser.add_argument('--engines', nargs='+', default=list(ENGINES),
+                        choices=list(ENGINES), help='Engines to run')
+    parser.add_argument('--depth', type=int, default=3)
+    parser.add_argument('--fanout', type=int, default=5)
+    parser.add_argument('--files-per-dir', type=int, default=20)
+    parser.add_argument('--size-distribution', default='lognormal',
+                        choices=['fixed', 'uniform', 'lognormal'])
+    parser.add_argument('--mean-size', type=int, default=64 * 1024)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--repeat', type=int, default=3,
+                        help='Timed runs per engine (the median is reported)')
+    parser.add_argument('--no-strace', action='store_true',
+                        help='Skip syscall counting even if strace is available')
+    parser.add_argument('--workdir', type=str, default=None,
+                        help='Where to generate the tree (default: system temp)')
+    parser.add_argument('--output', type=str, default=None,
+                        help='Write JSON results to this file')
+    parser.add_argument('--compare', type=str, default=None,
+                        help='Earlier JSON results to compare against')
+    args = parser.parse_args()
+
+    report = run_benchmark(
+        args.engines,
+        {
+            'depth': args.depth,
+            'fanout': args.fanout,
+            'files_per_dir': args.files_per_dir,
+            'size_distribution': args.size_distribution,
+            'mean_size': args.mean_size,
+            'seed': args.seed
+        },
+        repeat=args.repeat,
+        use_strace=False if args.no_strace else None,
+        workdir=args.workdir)
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)['results']
+        for engine, result in report['results'].items():
+            if engine in baseline:
+                result['speedup_vs_baseline'] = (
+                    baseline[engine]['seconds'] / result['seconds'])
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output + '\n')
+    print(output)
+
+
+if __name__ == '__main__':
+    main()
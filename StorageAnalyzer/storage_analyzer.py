@@ -1,66 +1,1401 @@
 #!/usr/bin/env python3
 import os
+import sys
 import time
 import json
-import asyncio
+import ctypes
+import ctypes.util
+import errno
+import functools
+import gzip
+import hashlib
+import heapq
+import itertools
+import math
+import mmap
+import random
+import re
+import select
+import struct
 import argparse
+import sqlite3
+from array import array
 from datetime import datetime
-import customtkinter as ctk
 from pathlib import Path
 import humanize
-from typing import Dict, List, Optional
-from openai import AsyncOpenAI
+from typing import Dict, List, NamedTuple, Optional
 import threading
-from CTkMessagebox import CTkMessagebox
+from concurrent.futures import (ThreadPoolExecutor, ProcessPoolExecutor,
+                                FIRST_COMPLETED, as_completed, wait)
+
+# Default thresholds: files bigger than LARGE_FILE_SIZE are reported as
+# large, files not accessed for UNUSED_AGE as unused
+LARGE_FILE_SIZE = 100 * 1024 * 1024  # 100MB in bytes
+UNUSED_AGE = 180 * 24 * 60 * 60  # 6 months in seconds
+
+# Totals extrapolated by sampled scans
+SAMPLED_COUNTERS = ('total_size', 'total_files', 'total_dirs', 'unused_count',
+                    'unused_size', 'large_count', 'large_size')
+# Per-extension totals extrapolated by sampled scans
+ESTIMATED_GROUPS = ('file_types', 'file_type_sizes')
+# Two-sided 95% normal quantile, for confidence intervals of estimates
+Z_95 = 1.96
+
+class ScanProgress:
+    """Single-pass progress estimate for a directory scan.
+
+    With an expected file count (e.g. from a previous scan) progress is the
+    fraction of files seen so far. Without one it falls back to the ratio of
+    directories scanned to directories discovered, which starts out rough
+    but converges as the frontier of unscanned directories shrinks.
+    """
+
+    def __init__(self, expected_files: Optional[int] = None,
+                 interval: float = 0.1):
+        self.expected_files = expected_files
+        self.interval = interval
+        self.start_time = time.monotonic()
+        self.last_report = 0.0
+
+    def due(self) -> bool:
+        """Whether enough time has passed since the last report"""
+        return time.monotonic() - self.last_report >= self.interval
+
+    def update(self, files: int, dirs_scanned: int, dirs_found: int,
+               finished: bool = False):
+        """Return (percent, details) for the current position of the scan"""
+        now = time.monotonic()
+        self.last_report = now
+        elapsed = now - self.start_time
+        files_per_sec = files / elapsed if elapsed > 0 else 0.0
+
+        if finished:
+            fraction = 1.0
+        elif self.expected_files:
+            fraction = min(files / self.expected_files, 0.99)
+        else:
+            fraction = min(dirs_scanned / max(dirs_found, 1), 0.99)
+
+        eta = None
+        if finished:
+            eta = 0.0
+        elif self.expected_files and files_per_sec > 0:
+            eta = max(self.expected_files - files, 0) / files_per_sec
+        elif fraction > 0:
+            eta = elapsed * (1 - fraction) / fraction
+
+        return fraction * 100, {
+            'files': files,
+            'dirs_scanned': dirs_scanned,
+            'dirs_found': dirs_found,
+            'elapsed': elapsed,
+            'files_per_sec': files_per_sec,
+            'eta': eta
+        }
 
-# Set appearance mode and default color theme
-ctk.set_appearance_mode("system")  # Follows system theme
-ctk.set_default_color_theme("blue")
 
-class FileAnalyzer:
+class IndexedStat(NamedTuple):
+    """The subset of os.stat_result the analyzer uses, as kept in ScanIndex"""
+    st_size: int
+    st_mtime: float
+    st_atime: float
+    st_ino: int
+    st_dev: int
+
+
+class ScanIndex:
+    """On-disk cache of directory listings for incremental rescans.
+
+    Each scanned directory is stored with its mtime and inode together with
+    its subdirectories and the stat data of its files. On a rescan a
+    directory whose mtime and inode are unchanged is served from the index
+    with a single stat call instead of being listed and having every file
+    stat'ed again.
+
+    A directory's mtime only changes when entries are added, removed or
+    renamed, so a file rewritten in place keeps its cached size until
+    something else touches its directory.
+    """
+
+    SCHEMA_VERSION = 2
+
+    def __init__(self, db_path: Optional[str] = None):
+        if db_path is None:
+            cache_dir = Path(os.environ.get('XDG_CACHE_HOME')
+                             or Path.home() / '.cache') / 'storage_analyzer'
+            cache_dir.mkdir(parents=True, exist_ok=True)
+            db_path = str(cache_dir / 'index.db')
+        self.db_path = db_path
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._setup()
+
+    def _setup(self):
+        version = self._conn.execute('PRAGMA user_version').fetchone()[0]
+        if version != self.SCHEMA_VERSION:
+            # The index is only a cache, so an old layout is simply dropped
+            self._conn.execute('DROP TABLE IF EXISTS directories')
+            self._conn.execute('DROP TABLE IF EXISTS roots')
+            self._conn.execute(f'PRAGMA user_version = {self.SCHEMA_VERSION}')
+        self._conn.execute(
+            'CREATE TABLE IF NOT EXISTS directories ('
+            'path TEXT PRIMARY KEY, mtime_ns INTEGER, inode INTEGER, '
+            'dirs TEXT, files TEXT)')
+        self._conn.execute(
+            'CREATE TABLE IF NOT EXISTS roots ('
+            'path TEXT PRIMARY KEY, total_files INTEGER)')
+        self._conn.commit()
+
+    def lookup(self, path: str, stat: os.stat_result):
+        """Return the cached (dirs, files) of path if it is unchanged"""
+        with self._lock:
+            row = self._conn.execute(
+                'SELECT mtime_ns, inode, dirs, files FROM directories '
+                'WHERE path = ?', (path,)).fetchone()
+            if not row or row[0] != stat.st_mtime_ns or row[1] != stat.st_ino:
+                self.misses += 1
+                return None
+            self.hits += 1
+        dirs = [tuple(d) for d in json.loads(row[2])]
+        files = []
+        for name, size, mtime, atime, ino, dev, error in json.loads(row[3]):
+            if error is not None:
+                files.append((name, OSError(error)))
+            else:
+                files.append((name, IndexedStat(size, mtime, atime, ino, dev)))
+        return dirs, files
+
+    def store(self, path: str, stat: os.stat_result, dirs, files):
+        """Record the listing of path taken while it had the given stat"""
+        # A directory modified during the last moment may change again
+        # without its mtime moving on, so it is left for the next scan
+        if time.time_ns() - stat.st_mtime_ns < 2_000_000_000:
+            return
+        rows = []
+        for name, file_stat in files:
+            if isinstance(file_stat, Exception):
+                rows.append((name, None, None, None, None, None,
+                             str(file_stat)))
+            else:
+                rows.append((name, file_stat.st_size, file_stat.st_mtime,
+                             file_stat.st_atime, file_stat.st_ino,
+                             file_stat.st_dev, None))
+        with self._lock:
+            self._conn.execute(
+                'INSERT OR REPLACE INTO directories VALUES (?, ?, ?, ?, ?)',
+                (path, stat.st_mtime_ns, stat.st_ino,
+                 json.dumps(dirs), json.dumps(rows)))
+
+    def previous_file_count(self, root: str) -> Optional[int]:
+        """File count recorded by the last finished scan of root"""
+        with self._lock:
+            row = self._conn.execute(
+                'SELECT total_files FROM roots WHERE path = ?',
+                (root,)).fetchone()
+        return row[0] if row else None
+
+    def finish_scan(self, root: str, visited, total_files: int):
+        """Drop entries for directories under root that no longer exist"""
+        prefix = root.rstrip(os.sep) + os.sep
+        with self._lock:
+            self._conn.execute('CREATE TEMP TABLE IF NOT EXISTS visited '
+                               '(path TEXT PRIMARY KEY)')
+            self._conn.execute('DELETE FROM visited')
+            self._conn.executemany('INSERT OR IGNORE INTO visited VALUES (?)',
+                                   ((p,) for p in visited))
+            self._conn.execute(
+                'DELETE FROM directories WHERE substr(path, 1, ?) = ? '
+                'AND path NOT IN (SELECT path FROM visited)',
+                (len(prefix), prefix))
+            self._conn.execute('INSERT OR REPLACE INTO roots VALUES (?, ?)',
+                               (root, total_files))
+            self._conn.commit()
+
+    def close(self):
+        with self._lock:
+            self._conn.commit()
+            self._conn.close()
+
+
+class AnalysisCache:
+    """On-disk cache of AI analyses, so identical stats aren't paid twice.
+
+    Each analysis is stored as a JSON file named by the SHA-256 digest of
+    the model and prompt it answered. Entries older than ttl seconds are
+    treated as missing and removed by evict(), which runs on every store.
+    """
+
+    def __init__(self, cache_dir: Optional[str] = None,
+                 ttl: float = 7 * 24 * 60 * 60):
+        if cache_dir is None:
+            cache_dir = (Path(os.environ.get('XDG_CACHE_HOME')
+                              or Path.home() / '.cache')
+                         / 'storage_analyzer' / 'ai')
+        self.cache_dir = Path(cache_dir)
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self.ttl = ttl
+
+    @staticmethod
+    def digest(model: str, prompt: str) -> str:
+        return hashlib.sha256(f"{model}\n{prompt}".encode()).hexdigest()
+
+    def get(self, digest: str) -> Optional[str]:
+        path = self.cache_dir / f"{digest}.json"
+        try:
+            with open(path) as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if time.time() - entry['created'] > self.ttl:
+            path.unlink(missing_ok=True)
+            return None
+        return entry['analysis']
+
+    def put(self, digest: str, analysis: str):
+        # Write to a temporary name first so readers never see half a file
+        path = self.cache_dir / f"{digest}.json"
+        tmp_path = path.with_suffix(f".{os.getpid()}.tmp")
+        with open(tmp_path, 'w') as f:
+            json.dump({'created': time.time(), 'analysis': analysis}, f)
+        os.replace(tmp_path, path)
+        self.evict()
+
+    def evict(self):
+        """Remove expired entries"""
+        cutoff = time.time() - self.ttl
+        for path in self.cache_dir.glob('*.json'):
+            try:
+                if path.stat().st_mtime < cutoff:
+                    path.unlink()
+            except OSError:
+                pass
+
+
+class TopK:
+    """Bounded collector keeping the k entries with the largest keys.
+
+    Every entry offered is counted towards count and total_size, but only
+    the k best are retained, in a min-heap, so memory stays O(k) however
+    many files match. Entries are stored as tuples and only turned into
+    dicts (with the given field names) when read back.
+    """
+
+    def __init__(self, k: int, fields):
+        self.k = k
+        self.fields = fields
+        self.count = 0
+        self.total_size = 0
+        self._heap = []
+        self._sequence = itertools.count()
+
+    def add(self, key, size: int, values: tuple):
+        self.count += 1
+        self.total_size += size
+        if len(self._heap) < self.k:
+            heapq.heappush(self._heap, (key, next(self._sequence), values))
+        elif self._heap and key > self._heap[0][0]:
+            heapq.heapreplace(self._heap, (key, next(self._sequence), values))
+
+    def items(self) -> List[Dict]:
+        """Retained entries as dicts, best first"""
+        return [dict(zip(self.fields, values))
+                for _, _, values in sorted(self._heap, reverse=True)]
+
+
+class DirectoryTree:
+    """du-style tree of recursive directory sizes.
+
+    Directories are stored as parallel arrays indexed by node number: the
+    parent node, the bytes and the number of files. Only the last path
+    component of each name is kept, encoded into one shared buffer with an
+    array of offsets, so a node costs 32 bytes plus its name and a tree of
+    ten million directories fits in a few hundred MB. A node is always
+    added after its parent, which lets roll_up() sum children into their
+    parents in a single reverse pass.
+    """
+
     def __init__(self):
-        self.stats = {
-            'total_size': 0,
-            'total_files': 0,
-            'total_dirs': 0,
-            'file_types': {},
-            'unused_files': [],  # files not accessed in last 6 months
-            'large_files': [],   # files > 100MB
-            'newest_file': None,
-            'oldest_file': None
+        self.parents = array('q')
+        self.sizes = array('q')
+        self.file_counts = array('q')
+        self._names = bytearray()
+        self._name_offsets = array('q', [0])
+
+    def __len__(self):
+        return len(self.parents)
+
+    def add(self, parent: int, name: str) -> int:
+        """Add a directory below parent (-1 for the root) and return its node"""
+        self.parents.append(parent)
+        self.sizes.append(0)
+        self.file_counts.append(0)
+        self._names += name.encode('utf-8', 'surrogateescape')
+        self._name_offsets.append(len(self._names))
+        return len(self.parents) - 1
+
+    def name(self, node: int) -> str:
+        """Last path component of node (the full root path for node 0)"""
+        return self._names[self._name_offsets[node]:
+                           self._name_offsets[node + 1]].decode(
+                               'utf-8', 'surrogateescape')
+
+    def add_files(self, node: int, count: int, size: int):
+        """Account for files directly inside node"""
+        self.file_counts[node] += count
+        self.sizes[node] += size
+
+    def roll_up(self):
+        """Turn per-directory totals into recursive totals"""
+        parents, sizes, file_counts = self.parents, self.sizes, self.file_counts
+        for node in range(len(self.parents) - 1, 0, -1):
+            parent = parents[node]
+            sizes[parent] += sizes[node]
+            file_counts[parent] += file_counts[node]
+
+    def path(self, node: int) -> str:
+        parts = []
+        while node >= 0:
+            parts.append(self.name(node))
+            node = self.parents[node]
+        return os.path.join(*reversed(parts))
+
+    def to_dict(self) -> Dict:
+        return {
+            'parents': self.parents.tolist(),
+            'sizes': self.sizes.tolist(),
+            'file_counts': self.file_counts.tolist(),
+            'names': [self.name(node) for node in range(len(self))]
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> 'DirectoryTree':
+        tree = cls()
+        tree.parents = array('q', data['parents'])
+        tree.sizes = array('q', data['sizes'])
+        tree.file_counts = array('q', data['file_counts'])
+        for name in data['names']:
+            tree._names += name.encode('utf-8', 'surrogateescape')
+            tree._name_offsets.append(len(tree._names))
+        return tree
+
+    @classmethod
+    def merged(cls, trees: List['DirectoryTree']) -> 'DirectoryTree':
+        """Combine rolled-up trees of disjoint parts of a filesystem.
+
+        The result is rooted at the common ancestor of all roots. Nodes with
+        the same path are combined and every ancestor of a tree's root is
+        credited with that root's totals, so the result is rolled up too.
+        """
+        trees = [tree for tree in trees if len(tree)]
+        merged = cls()
+        if not trees:
+            return merged
+        merged.add(-1, os.path.commonpath([tree.name(0) for tree in trees]))
+        children = {}
+
+        def child(parent: int, name: str) -> int:
+            node = children.get((parent, name))
+            if node is None:
+                node = children[(parent, name)] = merged.add(parent, name)
+            return node
+
+        for tree in trees:
+            chain = [0]
+            relative = os.path.relpath(tree.name(0), merged.name(0))
+            if relative != os.curdir:
+                for part in relative.split(os.sep):
+                    chain.append(child(chain[-1], part))
+            for node in chain:
+                merged.add_files(node, tree.file_counts[0], tree.sizes[0])
+
+            mapping = [chain[-1]]
+            for node in range(1, len(tree)):
+                target = child(mapping[tree.parents[node]], tree.name(node))
+                merged.add_files(target, tree.file_counts[node],
+                                 tree.sizes[node])
+                mapping.append(target)
+        return merged
+
+    def top(self, n: int) -> List[Dict]:
+        """The n largest directories by recursive size"""
+        nodes = heapq.nlargest(n, range(len(self)),
+                               key=self.sizes.__getitem__)
+        return [{
+            'path': self.path(node),
+            'size': self.sizes[node],
+            'files': self.file_counts[node]
+        } for node in nodes]
+
+
+def _hash_file(path: str, size: int, partial_block: int = 0) -> Optional[str]:
+    """SHA-256 of a file, or of its first and last partial_block bytes.
+
+    Full hashes map the file into memory so the whole file is handed to
+    hashlib in one call; files that cannot be mapped are read in large
+    chunks instead. Returns None if the file can't be read.
+    """
+    digest = hashlib.sha256()
+    try:
+        with open(path, 'rb') as f:
+            if partial_block:
+                digest.update(f.read(partial_block))
+                if size > partial_block:
+                    f.seek(max(size - partial_block, partial_block))
+                    digest.update(f.read(partial_block))
+                return digest.hexdigest()
+            try:
+                with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                    digest.update(data)
+            except (OSError, ValueError):
+                for chunk in iter(functools.partial(f.read, 1 << 20), b''):
+                    digest.update(chunk)
+        return digest.hexdigest()
+    except OSError:
+        return None
+
+
+class DuplicateFinder:
+    """Staged duplicate file detection.
+
+    Files are offered during the scan and bucketed by size. find() then
+    narrows each bucket down in increasingly expensive stages: hardlinks to
+    the same inode are folded together (they take no extra space), the
+    first and last blocks are hashed on a thread pool, and only files that
+    still collide are hashed in full on a process pool.
+    """
+
+    BLOCK_SIZE = 64 * 1024
+
+    def __init__(self, min_size: int = 1, workers: Optional[int] = None):
+        self.min_size = min_size
+        self.workers = workers
+        self._by_size: Dict[int, List] = {}
+
+    def add(self, path: str, size: int, dev: int, ino: int):
+        if size >= self.min_size:
+            self._by_size.setdefault(size, []).append((path, dev, ino))
+
+    def _refine(self, groups, hash_fn, pool):
+        """Split each group of paths by hash_fn, keeping groups of two+"""
+        futures = [(size, paths, [pool.submit(hash_fn, path, size)
+                                  for path in paths])
+                   for size, paths in groups]
+        refined = []
+        for size, paths, hashes in futures:
+            by_hash = {}
+            for path, future in zip(paths, hashes):
+                digest = future.result()
+                if digest is not None:
+                    by_hash.setdefault(digest, []).append(path)
+            refined.extend((size, same) for same in by_hash.values()
+                           if len(same) > 1)
+        return refined
+
+    def find(self) -> List[Dict]:
+        """Return duplicate groups, most reclaimable space first"""
+        candidates = []
+        for size, files in self._by_size.items():
+            if len(files) < 2:
+                continue
+            # One path per inode: hardlinks are the same data, not copies
+            inodes = {}
+            for path, dev, ino in files:
+                inodes.setdefault((dev, ino), path)
+            if len(inodes) > 1:
+                candidates.append((size, list(inodes.values())))
+        self._by_size = {}
+
+        partial = functools.partial(_hash_file, partial_block=self.BLOCK_SIZE)
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            candidates = self._refine(candidates, partial, pool)
+
+        # Files no bigger than two blocks were hashed completely already
+        confirmed = [group for group in candidates
+                     if group[0] <= 2 * self.BLOCK_SIZE]
+        remaining = [group for group in candidates
+                     if group[0] > 2 * self.BLOCK_SIZE]
+        if remaining:
+            with ProcessPoolExecutor(max_workers=self.workers) as pool:
+                confirmed.extend(self._refine(remaining, _hash_file, pool))
+
+        groups = [{
+            'size': size,
+            'paths': sorted(paths),
+            'reclaimable': size * (len(paths) - 1)
+        } for size, paths in confirmed]
+        groups.sort(key=lambda group: group['reclaimable'], reverse=True)
+        return groups
+
+
+class SizeSketch:
+    """Mergeable streaming quantile sketch of file sizes.
+
+    Sizes are counted in logarithmic buckets (the DDSketch scheme), so any
+    quantile is returned within relative_accuracy of the true value. The
+    number of buckets is bounded by max_buckets, after which the smallest
+    buckets are folded together, and two sketches merge by adding their
+    bucket counts.
+    """
+
+    def __init__(self, relative_accuracy: float = 0.01,
+                 max_buckets: int = 2048):
+        self.relative_accuracy = relative_accuracy
+        self.max_buckets = max_buckets
+        self.gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self._log_gamma = math.log(self.gamma)
+        self.count = 0
+        self.zero_count = 0
+        self.buckets: Dict[int, int] = {}
+
+    def add(self, size: int, count: int = 1):
+        self.count += count
+        if size <= 0:
+            self.zero_count += count
+            return
+        index = math.ceil(math.log(size) / self._log_gamma)
+        self.buckets[index] = self.buckets.get(index, 0) + count
+        if len(self.buckets) > self.max_buckets:
+            self._collapse()
+
+    def _collapse(self):
+        lowest, second = sorted(self.buckets)[:2]
+        self.buckets[second] += self.buckets.pop(lowest)
+
+    def merge(self, other: 'SizeSketch') -> 'SizeSketch':
+        merged = SizeSketch(self.relative_accuracy, self.max_buckets)
+        merged.count = self.count + other.count
+        merged.zero_count = self.zero_count + other.zero_count
+        merged.buckets = dict(self.buckets)
+        for index, count in other.buckets.items():
+            merged.buckets[index] = merged.buckets.get(index, 0) + count
+        while len(merged.buckets) > merged.max_buckets:
+            merged._collapse()
+        return merged
+
+    def quantile(self, q: float) -> float:
+        """Size at quantile q (0..1), or 0 for an empty sketch"""
+        if not self.count:
+            return 0
+        rank = q * (self.count - 1)
+        seen = self.zero_count
+        if rank < seen:
+            return 0
+        for index in sorted(self.buckets):
+            seen += self.buckets[index]
+            if rank < seen:
+                return 2 * self.gamma ** index / (self.gamma + 1)
+        return 2 * self.gamma ** max(self.buckets) / (self.gamma + 1)
+
+    def summary(self) -> Dict[str, float]:
+        return {name: round(self.quantile(q))
+                for name, q in (('p50', 0.5), ('p90', 0.9), ('p99', 0.99))}
+
+    def to_dict(self) -> Dict:
+        return {
+            'relative_accuracy': self.relative_accuracy,
+            'max_buckets': self.max_buckets,
+            'zero_count': self.zero_count,
+            'buckets': sorted(self.buckets.items())
         }
 
-    def scan_directory(self, path: str, progress_callback=None) -> Dict:
-        """Scan directory and collect statistics"""
-        self.stats = {
+    @classmethod
+    def from_dict(cls, data: Dict) -> 'SizeSketch':
+        sketch = cls(data['relative_accuracy'], data['max_buckets'])
+        sketch.zero_count = data['zero_count']
+        sketch.buckets = {index: count for index, count in data['buckets']}
+        sketch.count = sketch.zero_count + sum(sketch.buckets.values())
+        return sketch
+
+
+class ScanStats(dict):
+    """Scan results that can be merged and saved.
+
+    This is the stats dict returned by FileAnalyzer.scan_directory, so
+    stats['...'] access works as before, with the directory tree attached.
+    merge() combines the results of scans of disjoint parts of a filesystem
+    (for example one per top-level directory, or one per machine): totals
+    and histograms are summed, bounded lists keep the top_k best entries of
+    both and trees are grafted together. It is associative, so partial
+    results can be combined in any grouping. Duplicate groups are only
+    those found within each part.
+
+    The size distribution overall and per extension is kept in SizeSketch
+    objects (size_sketch and type_sketches), summarized as p50/p90/p99 in
+    size_quantiles and file_type_quantiles.
+    """
+
+    COUNTERS = ('total_size', 'total_files', 'total_dirs', 'unused_count',
+                'unused_size', 'large_count', 'large_size',
+                'duplicate_files', 'duplicate_reclaimable')
+
+    def __init__(self, top_k: int = 100, unused_age: float = UNUSED_AGE,
+                 large_file_size: int = LARGE_FILE_SIZE):
+        super().__init__({
+            # Thresholds the unused and large files were selected with
+            'unused_age': unused_age,
+            'large_file_size': large_file_size,
             'total_size': 0,
             'total_files': 0,
             'total_dirs': 0,
             'file_types': {},
-            'unused_files': [],
-            'large_files': [],
+            'file_type_sizes': {},  # bytes per extension
+            'size_quantiles': {},  # p50/p90/p99 of all file sizes
+            'file_type_quantiles': {},  # p50/p90/p99 per extension
+            'unused_files': [],  # oldest files not accessed in unused_age
+            'unused_count': 0,
+            'unused_size': 0,
+            'large_files': [],   # largest files > large_file_size
+            'large_count': 0,
+            'large_size': 0,
             'newest_file': None,
-            'oldest_file': None
+            'oldest_file': None,
+            'top_directories': [],  # largest directories by recursive size
+            'duplicate_groups': [],  # sets of identical files
+            'duplicate_files': 0,
+            'duplicate_reclaimable': 0,
+            # For sampled scans: [estimate, standard error] of each total,
+            # and of each extension's entry under 'file_types' and
+            # 'file_type_sizes'
+            'estimates': None
+        })
+        self.top_k = top_k
+        self.tree: Optional[DirectoryTree] = None
+        self.size_sketch = SizeSketch()
+        self.type_sketches: Dict[str, SizeSketch] = {}
+
+    def update_quantiles(self):
+        """Refresh the quantile summaries from the sketches"""
+        self['size_quantiles'] = self.size_sketch.summary()
+        self['file_type_quantiles'] = {
+            ext: sketch.summary() for ext, sketch in self.type_sketches.items()}
+
+    def merge(self, other: 'ScanStats') -> 'ScanStats':
+        """Return the combined results of self and other"""
+        if (self['unused_age'], self['large_file_size']) != (
+                other['unused_age'], other['large_file_size']):
+            raise ValueError("Can't merge results scanned with different "
+                             "unused/large file thresholds")
+        merged = ScanStats(max(self.top_k, other.top_k), self['unused_age'],
+                           self['large_file_size'])
+        k = merged.top_k
+        for key in self.COUNTERS:
+            merged[key] = self[key] + other[key]
+        for group in ESTIMATED_GROUPS:
+            for stats in (self, other):
+                for ext, value in stats[group].items():
+                    merged[group][ext] = merged[group].get(ext, 0) + value
+
+        merged.size_sketch = self.size_sketch.merge(other.size_sketch)
+        merged.type_sketches = dict(self.type_sketches)
+        for ext, sketch in other.type_sketches.items():
+            merged.type_sketches[ext] = (
+                merged.type_sketches[ext].merge(sketch)
+                if ext in merged.type_sketches else sketch)
+        merged.update_quantiles()
+
+        merged['unused_files'] = heapq.nsmallest(
+            k, self['unused_files'] + other['unused_files'],
+            key=lambda f: f['last_accessed'])
+        merged['large_files'] = heapq.nlargest(
+            k, self['large_files'] + other['large_files'],
+            key=lambda f: f['size'])
+        merged['duplicate_groups'] = heapq.nlargest(
+            k, self['duplicate_groups'] + other['duplicate_groups'],
+            key=lambda g: g['reclaimable'])
+
+        newest = [s['newest_file'] for s in (self, other) if s['newest_file']]
+        oldest = [s['oldest_file'] for s in (self, other) if s['oldest_file']]
+        merged['newest_file'] = min(newest, key=lambda f: (-f['time'], f['path']),
+                                    default=None)
+        merged['oldest_file'] = min(oldest, key=lambda f: (f['time'], f['path']),
+                                    default=None)
+
+        if self.tree is not None and other.tree is not None:
+            merged.tree = DirectoryTree.merged([self.tree, other.tree])
+            merged['top_directories'] = merged.tree.top(k)
+        else:
+            sizes = {}
+            for directory in self['top_directories'] + other['top_directories']:
+                entry = sizes.setdefault(
+                    directory['path'],
+                    {'path': directory['path'], 'size': 0, 'files': 0})
+                entry['size'] += directory['size']
+                entry['files'] += directory['files']
+            merged['top_directories'] = heapq.nlargest(
+                k, sizes.values(), key=lambda d: d['size'])
+
+        if self['estimates'] or other['estimates']:
+            # Exact results count as estimates without error; errors of
+            # independent parts add in quadrature
+            estimates = {}
+            for key in SAMPLED_COUNTERS:
+                parts = [s._estimate(key) for s in (self, other)]
+                estimates[key] = [sum(p[0] for p in parts),
+                                  math.sqrt(sum(p[1] ** 2 for p in parts))]
+            for group in ESTIMATED_GROUPS:
+                estimates[group] = {}
+                for ext in merged[group]:
+                    parts = [s._estimate(ext, group) for s in (self, other)]
+                    estimates[group][ext] = [
+                        sum(p[0] for p in parts),
+                        math.sqrt(sum(p[1] ** 2 for p in parts))]
+            merged['estimates'] = estimates
+        return merged
+
+    def _estimate(self, key: str, group: Optional[str] = None) -> List[float]:
+        """[estimate, standard error] of a total, exact ones having no error"""
+        values = self[group] if group else self
+        estimates = self['estimates'] or {}
+        if group:
+            estimates = estimates.get(group, {})
+        return estimates.get(key, [values.get(key, 0), 0.0])
+
+    def to_dict(self) -> Dict:
+        data = dict(self)
+        data['top_k'] = self.top_k
+        data['tree'] = self.tree.to_dict() if self.tree is not None else None
+        data['size_sketch'] = self.size_sketch.to_dict()
+        data['type_sketches'] = {ext: sketch.to_dict()
+                                 for ext, sketch in self.type_sketches.items()}
+        return data
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> 'ScanStats':
+        data = dict(data)
+        tree = data.pop('tree', None)
+        size_sketch = data.pop('size_sketch', None)
+        type_sketches = data.pop('type_sketches', {})
+        stats = cls(data.pop('top_k', 100))
+        stats.update(data)
+        if tree is not None:
+            stats.tree = DirectoryTree.from_dict(tree)
+        if size_sketch is not None:
+            stats.size_sketch = SizeSketch.from_dict(size_sketch)
+        stats.type_sketches = {ext: SizeSketch.from_dict(sketch)
+                               for ext, sketch in type_sketches.items()}
+        return stats
+
+    def save(self, path: str):
+        """Write the results to a JSON file"""
+        with open(path, 'w') as f:
+            json.dump(self.to_dict(), f)
+
+    @classmethod
+    def load(cls, path: str) -> 'ScanStats':
+        with open(path) as f:
+            return cls.from_dict(json.load(f))
+
+
+class ExcludeRules:
+    """gitignore-style exclude patterns, compiled into a single regex.
+
+    Patterns follow .gitignore syntax: '*', '?' and '[...]' match within
+    one path component, '**' across components, a trailing '/' restricts a
+    pattern to directories, a pattern containing a '/' is anchored to the
+    scan root (otherwise it matches at any depth) and '!' re-includes what
+    an earlier pattern excluded. Paths are matched relative to the scan
+    root. As with git, nothing below an excluded directory can be
+    re-included, since the scanner never reads it.
+    """
+
+    def __init__(self, patterns: List[str]):
+        self.patterns = []
+        rules = []
+        for line in patterns:
+            line = line.rstrip()
+            if not line or line.startswith('#'):
+                continue
+            self.patterns.append(line)
+            negate = line.startswith('!')
+            if negate:
+                line = line[1:]
+            elif line.startswith('\\'):
+                line = line[1:]
+            dir_only = line.endswith('/')
+            line = line.rstrip('/')
+            anchored = '/' in line
+            source = self._translate(line.lstrip('/'))
+            if not anchored:
+                source = '(?:.*/)?' + source
+            rules.append((source, negate, dir_only))
+
+        # Later patterns win, so they come first in the alternation and the
+        # name of the group that matched tells which rule decided
+        self._negated = {f"r{i}": negate
+                         for i, (_, negate, _) in enumerate(rules)}
+        self._dir_regex = self._compile(
+            (i, source) for i, (source, _, _) in enumerate(rules))
+        self._file_regex = self._compile(
+            (i, source) for i, (source, _, dir_only) in enumerate(rules)
+            if not dir_only)
+
+    @classmethod
+    def from_file(cls, path: str, extra: Optional[List[str]] = None):
+        with open(path) as f:
+            return cls(f.read().splitlines() + (extra or []))
+
+    @staticmethod
+    def _compile(rules):
+        alternatives = [f"(?P<r{i}>{source})\\Z" for i, source in rules]
+        if not alternatives:
+            return None
+        return re.compile('|'.join(reversed(alternatives)), re.DOTALL)
+
+    @staticmethod
+    def _translate(pattern: str) -> str:
+        """Regex source for one gitignore pattern"""
+        parts = []
+        i = 0
+        while i < len(pattern):
+            if pattern.startswith('**/', i):
+                parts.append('(?:.*/)?')
+                i += 3
+            elif pattern.startswith('**', i):
+                parts.append('.*')
+                i += 2
+            elif pattern[i] == '*':
+                parts.append('[^/]*')
+                i += 1
+            elif pattern[i] == '?':
+                parts.append('[^/]')
+                i += 1
+            elif pattern[i] == '[' and ']' in pattern[i + 2:]:
+                end = pattern.index(']', i + 2)
+                content = pattern[i + 1:end].replace('\\', '\\\\')
+                if content.startswith('!'):
+                    content = '^' + content[1:]
+                parts.append(f"[{content}]")
+                i = end + 1
+            elif pattern[i] == '\\' and i + 1 < len(pattern):
+                parts.append(re.escape(pattern[i + 1]))
+                i += 2
+            else:
+                parts.append(re.escape(pattern[i]))
+                i += 1
+        return ''.join(parts)
+
+    def match(self, relative_path: str, is_dir: bool) -> bool:
+        """Whether a path relative to the scan root is excluded"""
+        regex = self._dir_regex if is_dir else self._file_regex
+        if regex is None:
+            return False
+        if os.sep != '/':
+            relative_path = relative_path.replace(os.sep, '/')
+        match = regex.match(relative_path)
+        return match is not None and not self._negated[match.lastgroup]
+
+
+class Snapshot:
+    """Compact record of one scan, for comparing scans over time.
+
+    Holds the recursive size and file count of every directory, keyed by
+    its path relative to the scanned root, and the bytes and file count of
+    every extension. Both tables are sorted by key and stored column by
+    column (a NUL-separated key blob followed by int64 arrays) in a gzip
+    file, so two snapshots can be compared with a single merge-join.
+    """
+
+    MAGIC = b'storage-analyzer-snapshot'
+    VERSION = 1
+
+    def __init__(self, root: str, created: float):
+        self.root = root
+        self.created = created
+        self.paths: List[str] = []
+        self.sizes = array('q')
+        self.file_counts = array('q')
+        self.extensions: List[str] = []
+        self.extension_sizes = array('q')
+        self.extension_counts = array('q')
+
+    @classmethod
+    def from_stats(cls, stats: ScanStats,
+                   created: Optional[float] = None) -> 'Snapshot':
+        tree = stats.tree
+        snapshot = cls(tree.name(0) if tree is not None and len(tree) else '',
+                       time.time() if created is None else created)
+        if snapshot.root:
+            # Parents come before children, so one forward pass builds paths
+            paths = ['']
+            for node in range(1, len(tree)):
+                parent = paths[tree.parents[node]]
+                paths.append(os.path.join(parent, tree.name(node))
+                             if parent else tree.name(node))
+            for node in sorted(range(len(tree)), key=paths.__getitem__):
+                snapshot.paths.append(paths[node])
+                snapshot.sizes.append(tree.sizes[node])
+                snapshot.file_counts.append(tree.file_counts[node])
+        for ext in sorted(stats['file_types']):
+            snapshot.extensions.append(ext)
+            snapshot.extension_sizes.append(stats['file_type_sizes'].get(ext, 0))
+            snapshot.extension_counts.append(stats['file_types'][ext])
+        return snapshot
+
+    def save(self, path: str):
+        header = {
+            'version': self.VERSION,
+            'root': self.root,
+            'created': self.created,
+            'byteorder': sys.byteorder
         }
+        with gzip.open(path, 'wb') as f:
+            f.write(self.MAGIC + b'\n' + json.dumps(header).encode() + b'\n')
+            for column in (self.paths, self.sizes, self.file_counts,
+                           self.extensions, self.extension_sizes,
+                           self.extension_counts):
+                data = (column.tobytes() if isinstance(column, array)
+                        else '\0'.join(column).encode('utf-8', 'surrogateescape'))
+                f.write(struct.pack('<Q', len(data)))
+                f.write(data)
+
+    @classmethod
+    def load(cls, path: str) -> 'Snapshot':
+        with gzip.open(path, 'rb') as f:
+            if f.readline().rstrip(b'\n') != cls.MAGIC:
+                raise ValueError(f"{path} is not a snapshot")
+            header = json.loads(f.readline())
+            if header['version'] != cls.VERSION:
+                raise ValueError(f"{path}: unsupported snapshot version "
+                                 f"{header['version']}")
+            snapshot = cls(header['root'], header['created'])
+
+            def read_column(numeric: bool):
+                size, = struct.unpack('<Q', f.read(8))
+                data = f.read(size)
+                if not numeric:
+                    text = data.decode('utf-8', 'surrogateescape')
+                    return text.split('\0') if text else []
+                column = array('q', data)
+                if header['byteorder'] != sys.byteorder:
+                    column.byteswap()
+                return column
+
+            snapshot.paths = read_column(False)
+            snapshot.sizes = read_column(True)
+            snapshot.file_counts = read_column(True)
+            if len(snapshot.sizes) == 1:
+                # The root's own key is '', so a lone root reads back as []
+                snapshot.paths = ['']
+            snapshot.extensions = read_column(False)
+            snapshot.extension_sizes = read_column(True)
+            snapshot.extension_counts = read_column(True)
+        return snapshot
+
+
+def _merge_join(old_keys: List[str], new_keys: List[str]):
+    """Walk two sorted key lists together, yielding (key, old_i, new_i).
+
+    The index is None on the side where the key is missing.
+    """
+    i = j = 0
+    while i < len(old_keys) or j < len(new_keys):
+        if j == len(new_keys) or (i < len(old_keys)
+                                  and old_keys[i] < new_keys[j]):
+            yield old_keys[i], i, None
+            i += 1
+        elif i == len(old_keys) or new_keys[j] < old_keys[i]:
+            yield new_keys[j], None, j
+            j += 1
+        else:
+            yield old_keys[i], i, j
+            i += 1
+            j += 1
+
+
+def diff_snapshots(old: Snapshot, new: Snapshot) -> Dict:
+    """Size changes of every directory and extension, largest growth first"""
+    def changes(old_keys, old_sizes, old_counts, new_keys, new_sizes,
+                new_counts):
+        rows = []
+        for key, i, j in _merge_join(old_keys, new_keys):
+            old_size = old_sizes[i] if i is not None else 0
+            new_size = new_sizes[j] if j is not None else 0
+            if old_size == new_size and i is not None and j is not None:
+                continue
+            rows.append({
+                'key': key,
+                'old_size': old_size,
+                'new_size': new_size,
+                'growth': new_size - old_size,
+                'files': ((new_counts[j] if j is not None else 0)
+                          - (old_counts[i] if i is not None else 0)),
+                'status': ('added' if i is None else
+                           'removed' if j is None else 'changed')
+            })
+        rows.sort(key=lambda row: row['growth'], reverse=True)
+        return rows
+
+    directories = changes(old.paths, old.sizes, old.file_counts,
+                          new.paths, new.sizes, new.file_counts)
+    for row in directories:
+        row['path'] = os.path.join(new.root, row.pop('key')).rstrip(os.sep)
+    extensions = changes(old.extensions, old.extension_sizes,
+                         old.extension_counts, new.extensions,
+                         new.extension_sizes, new.extension_counts)
+    for row in extensions:
+        row['extension'] = row.pop('key')
+    return {
+        'old_root': old.root,
+        'new_root': new.root,
+        'seconds': new.created - old.created,
+        'directories': directories,
+        'extensions': extensions
+    }
+
+
+class FileTable:
+    """Per-file records of a scan, stored column by column.
+
+    Every file has a path id (the DirectoryTree node of its directory), a
+    name, its size, mtime and atime, and an extension id indexing
+    extensions. Columns are collected in plain arrays during the scan and
+    saved as one .npy file each, so a saved table can be memory-mapped and
+    queried with vectorized NumPy filters instead of scanning again.
+    NumPy is only needed to save, load and query tables.
+    """
+
+    COLUMNS = (('dirs', 'q'), ('sizes', 'q'), ('mtimes', 'd'),
+               ('atimes', 'd'), ('exts', 'i'))
+
+    def __init__(self, root: str):
+        self.root = root
+        self.tree = DirectoryTree()
+        for name, typecode in self.COLUMNS:
+            setattr(self, name, array(typecode))
+        self.names: Optional[List[str]] = []
+        self.extensions: List[str] = []
+        self._extension_ids: Dict[str, int] = {}
+        self._names_path = None
+
+    def __len__(self):
+        return len(self.sizes)
+
+    def add(self, node: int, name: str, size: int, mtime: float,
+            atime: float, ext: str):
+        ext_id = self._extension_ids.get(ext)
+        if ext_id is None:
+            ext_id = self._extension_ids[ext] = len(self.extensions)
+            self.extensions.append(ext)
+        self.dirs.append(node)
+        self.names.append(name)
+        self.sizes.append(size)
+        self.mtimes.append(mtime)
+        self.atimes.append(atime)
+        self.exts.append(ext_id)
+
+    def save(self, directory: str):
+        """Write the table to directory as .npy columns plus metadata"""
+        import numpy as np
+
+        os.makedirs(directory, exist_ok=True)
+        for name, _ in self.COLUMNS:
+            np.save(os.path.join(directory, f"{name}.npy"),
+                    np.asarray(getattr(self, name)))
+        with open(os.path.join(directory, 'names.bin'), 'wb') as f:
+            f.write('\0'.join(self._load_names()).encode('utf-8',
+                                                         'surrogateescape'))
+        with open(os.path.join(directory, 'table.json'), 'w') as f:
+            json.dump({
+                'root': self.root,
+                'extensions': self.extensions,
+                'tree': self.tree.to_dict()
+            }, f)
+
+    @classmethod
+    def load(cls, directory: str, mmap: bool = True) -> 'FileTable':
+        """Read a saved table; columns are memory-mapped unless mmap=False"""
+        import numpy as np
+
+        with open(os.path.join(directory, 'table.json')) as f:
+            meta = json.load(f)
+        table = cls(meta['root'])
+        table.tree = DirectoryTree.from_dict(meta['tree'])
+        table.extensions = meta['extensions']
+        table._extension_ids = {ext: i for i, ext
+                                in enumerate(table.extensions)}
+        for name, _ in cls.COLUMNS:
+            setattr(table, name, np.load(os.path.join(directory, f"{name}.npy"),
+                                         mmap_mode='r' if mmap else None))
+        # File names are only needed to print paths, so they're read lazily
+        table.names = None
+        table._names_path = os.path.join(directory, 'names.bin')
+        return table
+
+    def _load_names(self) -> List[str]:
+        if self.names is None:
+            with open(self._names_path, 'rb') as f:
+                text = f.read().decode('utf-8', 'surrogateescape')
+            self.names = text.split('\0') if len(self) else []
+        return self.names
+
+    def file_path(self, i: int) -> str:
+        return os.path.join(self.tree.path(int(self.dirs[i])),
+                            self._load_names()[i])
+
+    def _subtree(self, path: str):
+        """Boolean array over tree nodes: True for path and its descendants"""
+        import numpy as np
+
+        relative = os.path.relpath(os.path.abspath(path), self.tree.name(0))
+        if relative.startswith(os.pardir):
+            return np.zeros(len(self.tree), dtype=bool)
+        node = 0
+        if relative != os.curdir:
+            for part in relative.split(os.sep):
+                node = next((child for child in range(node + 1, len(self.tree))
+                             if self.tree.parents[child] == node
+                             and self.tree.name(child) == part), None)
+                if node is None:
+                    return np.zeros(len(self.tree), dtype=bool)
+
+        # Spread the mark down one level per step until nothing changes
+        parents = np.asarray(self.tree.parents).copy()
+        parents[0] = 0
+        inside = np.zeros(len(self.tree), dtype=bool)
+        inside[node] = True
+        while True:
+            spread = inside | inside[parents]
+            if np.array_equal(spread, inside):
+                return inside
+            inside = spread
+
+    def query(self, min_size: Optional[int] = None,
+              max_size: Optional[int] = None,
+              accessed_before: Optional[float] = None,
+              modified_before: Optional[float] = None,
+              under: Optional[str] = None,
+              extensions: Optional[List[str]] = None):
+        """Indices of the files matching every given condition"""
+        import numpy as np
+
+        sizes = np.asarray(self.sizes)
+        mask = np.ones(len(sizes), dtype=bool)
+        if min_size is not None:
+            mask &= sizes > min_size
+        if max_size is not None:
+            mask &= sizes < max_size
+        if accessed_before is not None:
+            mask &= np.asarray(self.atimes) < accessed_before
+        if modified_before is not None:
+            mask &= np.asarray(self.mtimes) < modified_before
+        if under is not None:
+            mask &= self._subtree(under)[np.asarray(self.dirs)]
+        if extensions is not None:
+            ids = [self._extension_ids[ext] for ext in extensions
+                   if ext in self._extension_ids]
+            mask &= np.isin(np.asarray(self.exts), ids)
+        return np.flatnonzero(mask)
+
+    def group(self, indices, by: str = 'extension') -> List[Dict]:
+        """File count and bytes of the selected files per extension or
+        directory, largest first"""
+        import numpy as np
+
+        if by == 'extension':
+            keys, labels = np.asarray(self.exts), self.extensions
+        else:
+            keys, labels = np.asarray(self.dirs), None
+        keys = keys[indices]
+        sizes = np.asarray(self.sizes)[indices]
+        length = (len(self.extensions) if by == 'extension'
+                  else len(self.tree))
+        counts = np.bincount(keys, minlength=length)
+        totals = np.bincount(keys, weights=sizes, minlength=length)
+        groups = []
+        for key in np.flatnonzero(counts):
+            groups.append({
+                by: labels[key] if labels else self.tree.path(int(key)),
+                'files': int(counts[key]),
+                'size': int(totals[key])
+            })
+        groups.sort(key=lambda group: group['size'], reverse=True)
+        return groups
+
+    def largest(self, indices, n: int) -> List[Dict]:
+        """The n largest of the selected files"""
+        import numpy as np
+
+        sizes = np.asarray(self.sizes)[indices]
+        order = indices[np.argsort(sizes, kind='stable')[::-1][:n]]
+        return [{
+            'path': self.file_path(i),
+            'size': int(self.sizes[i]),
+            'modified': float(self.mtimes[i]),
+            'accessed': float(self.atimes[i])
+        } for i in order]
+
+
+def _scan_shard(path: str, top_k: int, find_duplicates: bool,
+                workers: Optional[int], unused_age: float,
+                large_file_size: int, exclude: Optional[ExcludeRules],
+                one_file_system: bool, follow_symlinks: bool,
+                rules_root: str) -> ScanStats:
+    """Process pool entry point for FileAnalyzer.scan_sharded"""
+    analyzer = FileAnalyzer(top_k=top_k, find_duplicates=find_duplicates,
+                            unused_age=unused_age,
+                            large_file_size=large_file_size,
+                            exclude=exclude, one_file_system=one_file_system,
+                            follow_symlinks=follow_symlinks)
+    analyzer.rules_root = rules_root
+    return analyzer.scan_directory(path, workers=workers)
 
-        # First count total files for progress
-        total_files = sum([len(files) for _, _, files in os.walk(path)])
-        processed_files = 0
 
-        for root, dirs, files in os.walk(path):
+class FileAnalyzer:
+    def __init__(self, top_k: int = 100, find_duplicates: bool = False,
+                 hash_workers: Optional[int] = None,
+                 unused_age: float = UNUSED_AGE,
+                 large_file_size: int = LARGE_FILE_SIZE,
+                 exclude: Optional[ExcludeRules] = None,
+                 one_file_system: bool = False,
+                 follow_symlinks: bool = False):
+        # Number of entries kept in the unused and large file lists
+        self.top_k = top_k
+        # Files not accessed for unused_age seconds count as unused, files
+        # bigger than large_file_size bytes as large
+        self.unused_age = unused_age
+        self.large_file_size = large_file_size
+        # Paths matching exclude are skipped, excluded directories without
+        # being read. one_file_system keeps scans on the device of the scan
+        # root, follow_symlinks descends into symlinked directories (each
+        # directory is still read only once, so links can't loop)
+        self.exclude = exclude
+        self.one_file_system = one_file_system
+        self.follow_symlinks = follow_symlinks
+        # The directory exclude patterns are anchored to and whose device
+        # one_file_system keeps to; None means the scanned path
+        self.rules_root: Optional[str] = None
+        # Whether scans also look for duplicate files, and with how many
+        # processes files are hashed
+        self.find_duplicates = find_duplicates
+        self.hash_workers = hash_workers
+        # File counts of earlier scans, used to estimate progress on rescans
+        self.previous_file_counts: Dict[str, int] = {}
+        # Recursive per-directory sizes of the last scan
+        self.tree = DirectoryTree()
+        # (size, mtime, atime) of every file, only kept when a scan is
+        # asked to keep_files (e.g. for watch mode)
+        self.files: Dict[str, tuple] = {}
+        # Columnar per-file records, only kept when a scan is asked for
+        # columns
+        self.columns: Optional[FileTable] = None
+        self.stats = self._empty_stats()
+
+    def _empty_stats(self) -> ScanStats:
+        return ScanStats(self.top_k, self.unused_age, self.large_file_size)
+
+    def scan_directory(self, path: str, progress_callback=None,
+                       workers: Optional[int] = None,
+                       expected_files: Optional[int] = None,
+                       index: Optional[ScanIndex] = None,
+                       keep_files: bool = False,
+                       recursive: bool = True,
+                       sample: Optional[float] = None,
+                       seed: Optional[int] = None,
+                       columns: bool = False,
+                       directory_callback=None) -> ScanStats:
+        """Scan directory and collect statistics
+
+        workers bounds the number of threads listing directories in
+        parallel; None uses the ThreadPoolExecutor default.
+
+        progress_callback is called as progress_callback(percent, details)
+        where details holds 'files', 'dirs_scanned', 'dirs_found', 'elapsed',
+        'files_per_sec' and 'eta' (seconds, or None while unknown).
+        expected_files, when known, gives a better estimate than the
+        directory ratio used otherwise. directory_callback, if given, is
+        called as directory_callback(path, files, size, dirs) as each
+        directory is scanned, with the count and bytes of the files
+        directly inside it and its number of subdirectories.
+
+        With an index, directories unchanged since the previous scan are
+        taken from it instead of being read again.
+
+        unused_files and large_files hold at most top_k entries (the least
+        recently accessed and the largest respectively); unused_count,
+        unused_size, large_count and large_size cover every match.
+
+        The recursive size of every directory is kept in self.tree, and the
+        top_k largest are listed in top_directories.
+
+        With find_duplicates set, the top_k duplicate groups with the most
+        reclaimable space are listed in duplicate_groups, and
+        duplicate_files/duplicate_reclaimable count redundant copies over
+        all groups.
+
+        keep_files fills self.files with the size, times and unused/large
+        classification of every file, and columns fills self.columns with
+        a FileTable of them for queries.
+        Without recursive only the files directly inside path are scanned
+        (its subdirectories are still counted).
+
+        sample (a fraction between 0 and 1) makes an approximate scan that
+        descends into only that fraction of the subdirectories at each
+        level, chosen at random (reproducibly with seed). Totals, the
+        unused/large counts, extension counts and bytes and directory sizes
+        are then extrapolated (size quantiles and columns describe the
+        sampled files), and 'estimates' maps each of them to its
+        [estimate, standard error].
+        """
+        self.stats = self._empty_stats()
+        self.tree = DirectoryTree()
+        self.files = {}
+        self.columns = FileTable(os.path.abspath(path)) if columns else None
+        duplicates = (DuplicateFinder(workers=self.hash_workers)
+                      if self.find_duplicates else None)
+        unused_files = TopK(self.top_k, ('path', 'last_accessed', 'size'))
+        large_files = TopK(self.top_k, ('path', 'size'))
+        unused_before = time.time() - self.unused_age
+
+        # Progress is estimated during the single pass, seeded with the
+        # file count of the previous scan of the same path if there was one
+        scan_key = os.path.abspath(path)
+        if expected_files is None:
+            expected_files = self.previous_file_counts.get(scan_key)
+        if expected_files is None and index is not None:
+            expected_files = index.previous_file_count(scan_key)
+        progress = ScanProgress(expected_files)
+        dirs_scanned = 0
+        dirs_found = 1
+        visited = []
+
+        # Per sampled directory: its own totals and (subdirectories, sampled)
+        sampled_totals = {}
+        sampling = {}
+        dir_types = None
+
+        def counters():
+            # Current values of SAMPLED_COUNTERS, in that order
+            return (self.stats['total_size'], self.stats['total_files'],
+                    self.stats['total_dirs'], unused_files.count,
+                    unused_files.total_size, large_files.count,
+                    large_files.total_size)
+
+        walk = self._walk(scan_key, workers, index, self.tree, recursive,
+                          sample, random.Random(seed))
+        for node, root, dirs, files, queued in walk:
+            if sample is not None:
+                counters_before = counters()
+                dir_types = {}
             self.stats['total_dirs'] += len(dirs)
-
-            for file in files:
+            if index is not None:
+                visited.append(root)
+            dirs_scanned += 1
+            dirs_found += queued
+            if sample is not None:
+                sampling[node] = (sum(1 for _, is_symlink in dirs
+                                      if self.follow_symlinks
+                                      or not is_symlink), queued)
+
+            dir_size = 0
+            dir_files = 0
+            for file, stat in files:
                 file_path = os.path.join(root, file)
                 try:
-                    # Update progress
-                    processed_files += 1
-                    if progress_callback:
-                        progress = (processed_files / total_files) * 100
-                        progress_callback(progress)
-
                     # Get file stats
-                    stat = os.stat(file_path)
+                    if isinstance(stat, Exception):
+                        raise stat
                     size = stat.st_size
                     modified_time = stat.st_mtime
                     accessed_time = stat.st_atime
@@ -68,427 +1403,1228 @@ class FileAnalyzer:
                     # Update total size and count
                     self.stats['total_size'] += size
                     self.stats['total_files'] += 1
+                    dir_size += size
+                    dir_files += 1
+                    if duplicates is not None:
+                        duplicates.add(file_path, size, stat.st_dev,
+                                       stat.st_ino)
+                    unused = accessed_time < unused_before
+                    large = size > self.large_file_size
+                    if keep_files:
+                        # With how the file was counted, so a watcher can
+                        # take back exactly that
+                        self.files[file_path] = (size, modified_time,
+                                                 accessed_time, unused, large)
 
                     # Track file types
                     ext = os.path.splitext(file)[1].lower() or 'no_extension'
                     self.stats['file_types'][ext] = self.stats['file_types'].get(ext, 0) + 1
-
-                    # Track newest/oldest files
-                    if not self.stats['newest_file'] or modified_time > self.stats['newest_file']['time']:
+                    self.stats['file_type_sizes'][ext] = (
+                        self.stats['file_type_sizes'].get(ext, 0) + size)
+                    if dir_types is not None:
+                        dir_types[('file_types', ext)] = (
+                            dir_types.get(('file_types', ext), 0) + 1)
+                        dir_types[('file_type_sizes', ext)] = (
+                            dir_types.get(('file_type_sizes', ext), 0) + size)
+
+                    # Track the size distribution
+                    self.stats.size_sketch.add(size)
+                    sketch = self.stats.type_sketches.get(ext)
+                    if sketch is None:
+                        sketch = self.stats.type_sketches[ext] = SizeSketch()
+                    sketch.add(size)
+
+                    # Track newest/oldest files; ties go to the first path
+                    # in sorted order, whatever order threads report them in
+                    newest = self.stats['newest_file']
+                    oldest = self.stats['oldest_file']
+                    if not newest or (modified_time, newest['path']) > (newest['time'], file_path):
                         self.stats['newest_file'] = {
                             'path': file_path,
                             'time': modified_time
                         }
-                    if not self.stats['oldest_file'] or modified_time < self.stats['oldest_file']['time']:
+                    if not oldest or (modified_time, file_path) < (oldest['time'], oldest['path']):
                         self.stats['oldest_file'] = {
                             'path': file_path,
                             'time': modified_time
                         }
 
-                    # Check for unused files (not accessed in 6 months)
-                    six_months_ago = time.time() - (180 * 24 * 60 * 60)
-                    if accessed_time < six_months_ago:
-                        self.stats['unused_files'].append({
-                            'path': file_path,
-                            'last_accessed': accessed_time,
-                            'size': size
-                        })
+                    if self.columns is not None:
+                        self.columns.add(node, file, size, modified_time,
+                                         accessed_time, ext)
 
-                    # Check for large files (>100MB)
-                    if size > 100 * 1024 * 1024:  # 100MB in bytes
-                        self.stats['large_files'].append({
-                            'path': file_path,
-                            'size': size
-                        })
+                    # Check for unused files (not accessed in unused_age)
+                    if unused:
+                        unused_files.add(-accessed_time, size,
+                                         (file_path, accessed_time, size))
+
+                    # Check for large files (> large_file_size)
+                    if large:
+                        large_files.add(size, size, (file_path, size))
 
                 except Exception as e:
-                    print(f"Error processing {file_path}: {e}")
+                    print(f"Error processing {file_path}: {e}",
+                          file=sys.stderr)
                     continue
 
-        return self.stats
+            self.tree.add_files(node, dir_files, dir_size)
+            if directory_callback:
+                directory_callback(root, dir_files, dir_size, len(dirs))
+            if sample is not None:
+                totals = {key: after - before for key, before, after
+                          in zip(SAMPLED_COUNTERS, counters_before,
+                                 counters())}
+                totals.update(dir_types)
+                sampled_totals[node] = totals
+            if progress_callback and progress.due():
+                progress_callback(*progress.update(
+                    self.stats['total_files'], dirs_scanned, dirs_found))
+
+        self.stats['unused_files'] = unused_files.items()
+        self.stats['unused_count'] = unused_files.count
+        self.stats['unused_size'] = unused_files.total_size
+        self.stats['large_files'] = large_files.items()
+        self.stats['large_count'] = large_files.count
+        self.stats['large_size'] = large_files.total_size
+        if sample is not None:
+            self._extrapolate(sampled_totals, sampling)
+        else:
+            self.tree.roll_up()
+        self.stats.tree = self.tree
+        if self.columns is not None:
+            self.columns.tree = self.tree
+        self.stats.update_quantiles()
+        self.stats['top_directories'] = self.tree.top(self.top_k)
+        if duplicates is not None:
+            groups = duplicates.find()
+            self.stats['duplicate_groups'] = groups[:self.top_k]
+            self.stats['duplicate_files'] = sum(
+                len(group['paths']) - 1 for group in groups)
+            self.stats['duplicate_reclaimable'] = sum(
+                group['reclaimable'] for group in groups)
+
+        self.previous_file_counts[scan_key] = self.stats['total_files']
+        if index is not None:
+            index.finish_scan(scan_key, visited, self.stats['total_files'])
+        if progress_callback:
+            progress_callback(*progress.update(
+                self.stats['total_files'], dirs_scanned, dirs_found,
+                finished=True))
 
-    async def analyze_with_ai(self, api_key: str) -> str:
-        """Analyze directory statistics using OpenAI"""
-        client = AsyncOpenAI(api_key=api_key)
+        return self.stats
 
-        stats_summary = f"""
+    def _extrapolate(self, sampled_totals: Dict[int, Dict],
+                     sampling: Dict[int, tuple]):
+        """Replace the stats of a sampled scan with estimates.
+
+        Each directory's subtree total is estimated as its own total plus
+        n/m times the estimated totals of the m subdirectories sampled out
+        of n, the standard unbiased two-stage estimator under sampling
+        without replacement. Its variance combines the spread between the
+        sampled subtrees, n^2 (1 - m/n) s^2 / m, with n/m times their own
+        estimated variances. Both are computed bottom-up over the tree, and
+        directory sizes in the tree are replaced by their estimates.
+
+        Confidence intervals derived from these rely on a normal
+        approximation, and are too narrow when a few directories hold most
+        of the data.
+        """
+        tree = self.tree
+        # Per node: [sum, sum of squares, sum of variances] of the
+        # estimates of its sampled children, by quantity
+        children = {}
+        for node in range(len(tree) - 1, -1, -1):
+            estimate = dict(sampled_totals.get(node, {}))
+            variance = {}
+            n, m = sampling.get(node, (0, 0))
+            sums, squares, variances = children.pop(node, ({}, {}, {}))
+            if m:
+                for key, total in sums.items():
+                    estimate[key] = estimate.get(key, 0) + n / m * total
+                    if m > 1:
+                        spread = (squares[key] - total * total / m) / (m - 1)
+                        variance[key] = n * n * (1 - m / n) * max(spread, 0) / m
+                for key, total in variances.items():
+                    variance[key] = variance.get(key, 0) + n / m * total
+
+            tree.sizes[node] = round(estimate.get('total_size', 0))
+            tree.file_counts[node] = round(estimate.get('total_files', 0))
+            parent = tree.parents[node]
+            if parent >= 0:
+                sums, squares, variances = children.setdefault(
+                    parent, ({}, {}, {}))
+                for key, value in estimate.items():
+                    sums[key] = sums.get(key, 0) + value
+                    squares[key] = squares.get(key, 0) + value * value
+                for key, value in variance.items():
+                    variances[key] = variances.get(key, 0) + value
+
+        estimates = {group: {} for group in ESTIMATED_GROUPS}
+        for key, value in estimate.items():
+            standard_error = math.sqrt(variance.get(key, 0))
+            if isinstance(key, tuple):
+                group, ext = key
+                self.stats[group][ext] = round(value)
+                estimates[group][ext] = [value, standard_error]
+            else:
+                self.stats[key] = round(value)
+                estimates[key] = [value, standard_error]
+        self.stats['estimates'] = estimates
+
+    def scan_sharded(self, path: str, processes: Optional[int] = None,
+                     workers: Optional[int] = None) -> ScanStats:
+        """Scan each top-level directory of path in its own process.
+
+        The files directly inside path are scanned here, every subdirectory
+        is scanned by a process pool worker and the partial results are
+        merged as they arrive. With follow_symlinks a directory is only
+        read once per shard, so links between shards are counted twice.
+        """
+        root = os.path.abspath(path)
+        stats = self.scan_directory(root, workers=workers, recursive=False)
+        _, dirs, _ = self._read_directory(root)
+        shards = [os.path.join(root, name)
+                  for name, is_symlink in dirs
+                  if (self.follow_symlinks or not is_symlink)
+                  and not self.is_excluded(os.path.join(root, name), True,
+                                           root)]
+
+        with ProcessPoolExecutor(max_workers=processes) as pool:
+            futures = [pool.submit(_scan_shard, shard, self.top_k,
+                                   self.find_duplicates, workers,
+                                   self.unused_age, self.large_file_size,
+                                   self.exclude, self.one_file_system,
+                                   self.follow_symlinks, root)
+                       for shard in shards]
+            for future in as_completed(futures):
+                stats = stats.merge(future.result())
+
+        self.stats = stats
+        self.tree = stats.tree
+        self.previous_file_counts[root] = stats['total_files']
+        return stats
+
+    @staticmethod
+    def _read_directory(path: str):
+        """List one directory with os.scandir.
+
+        Returns the names of its subdirectories and a (name, stat) pair for
+        every other entry. The DirEntry type information means directories
+        never need a separate stat call; a failed stat is returned in place
+        of the stat result so the caller can report it.
+        """
+        dirs = []
+        files = []
+        try:
+            with os.scandir(path) as entries:
+                for entry in entries:
+                    try:
+                        is_dir = entry.is_dir()
+                    except OSError:
+                        is_dir = False
+                    if is_dir:
+                        # Like os.walk, count symlinked directories but
+                        # don't descend into them
+                        dirs.append((entry.name, entry.is_symlink()))
+                        continue
+                    try:
+                        files.append((entry.name, entry.stat()))
+                    except OSError as e:
+                        files.append((entry.name, e))
+        except OSError:
+            # Unreadable directories are skipped, as os.walk does
+            pass
+        return path, dirs, files
+
+    @classmethod
+    def _read_directory_indexed(cls, index: ScanIndex, path: str):
+        """_read_directory, served from the index when path is unchanged"""
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return path, [], []
+        cached = index.lookup(path, stat)
+        if cached is not None:
+            return (path,) + cached
+        path, dirs, files = cls._read_directory(path)
+        index.store(path, stat, dirs, files)
+        return path, dirs, files
+
+    def is_excluded(self, path: str, is_dir: bool, root: str) -> bool:
+        """Whether path, found while scanning root, matches self.exclude"""
+        if self.exclude is None:
+            return False
+        root = self.rules_root or root
+        prefix = root if root.endswith(os.sep) else root + os.sep
+        if not path.startswith(prefix):
+            return False
+        return self.exclude.match(path[len(prefix):], is_dir)
+
+    def _walk(self, path: str, workers: Optional[int] = None,
+              index: Optional[ScanIndex] = None,
+              tree: Optional[DirectoryTree] = None,
+              recursive: bool = True,
+              sample: Optional[float] = None,
+              rng: Optional[random.Random] = None):
+        """Yield (node, root, [(dir_name, is_symlink), ...],
+        [(file_name, stat), ...], queued).
+
+        Every directory scanned is added to tree (a fresh one if not given)
+        and node is its index there.
+
+        queued is the number of subdirectories scheduled for scanning as a
+        result of listing root, which lets callers track how much of the
+        discovered tree is still outstanding. With sample, only that
+        fraction of the subdirectories of each directory (but at least two,
+        when there are two) is chosen at random for scanning.
+
+        Directories are listed concurrently on a bounded thread pool so that
+        slow stat calls (network filesystems, cold caches) overlap. Results
+        are yielded on the calling thread in completion order, so callers can
+        aggregate without any locking.
+
+        Entries matching self.exclude are left out of the results, and
+        excluded directories are never read. With one_file_system,
+        directories on another device (mount points) are yielded empty; with
+        follow_symlinks, symlinked directories are descended into, and a
+        directory reached a second time is yielded empty.
+        """
+        if index is None:
+            read_listing = self._read_directory
+        else:
+            read_listing = functools.partial(
+                self._read_directory_indexed, index)
+
+        if self.one_file_system or self.follow_symlinks:
+            try:
+                root_dev = os.stat(self.rules_root or path).st_dev
+            except OSError:
+                root_dev = None
+            seen = set()
+            seen_lock = threading.Lock()
+
+            def read_checked(directory):
+                # Skip other devices and directories already read
+                try:
+                    stat = os.stat(directory)
+                except OSError:
+                    return directory, [], []
+                if self.one_file_system and stat.st_dev != root_dev:
+                    return directory, [], []
+                if self.follow_symlinks:
+                    with seen_lock:
+                        if (stat.st_dev, stat.st_ino) in seen:
+                            return directory, [], []
+                        seen.add((stat.st_dev, stat.st_ino))
+                return read_listing(directory)
+
+            read_directory = read_checked
+        else:
+            read_directory = read_listing
+
+        if tree is None:
+            tree = DirectoryTree()
+        if rng is None:
+            rng = random.Random()
+
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            nodes = {pool.submit(read_directory, path): tree.add(-1, path)}
+            pending = set(nodes)
+            while pending:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    node = nodes.pop(future)
+                    root, dirs, files = future.result()
+                    if self.exclude is not None:
+                        dirs = [(name, is_symlink) for name, is_symlink in dirs
+                                if not self.is_excluded(
+                                    os.path.join(root, name), True, path)]
+                        files = [(name, stat) for name, stat in files
+                                 if not self.is_excluded(
+                                     os.path.join(root, name), False, path)]
+                    subdirs = [name for name, is_symlink in dirs
+                               if recursive
+                               and (self.follow_symlinks or not is_symlink)]
+                    if sample is not None and subdirs:
+                        chosen = max(min(2, len(subdirs)),
+                                     math.ceil(sample * len(subdirs)))
+                        subdirs = rng.sample(subdirs, min(chosen, len(subdirs)))
+                    for name in subdirs:
+                        child = pool.submit(
+                            read_directory, os.path.join(root, name))
+                        nodes[child] = tree.add(node, name)
+                        pending.add(child)
+                    yield node, root, dirs, files, len(subdirs)
+
+    def _stats_summary(self, stats: Dict) -> str:
+        return f"""
         Directory Analysis Summary:
-        - Total Size: {humanize.naturalsize(self.stats['total_size'])}
-        - Total Files: {self.stats['total_files']}
-        - Total Directories: {self.stats['total_dirs']}
-
-        File Types Distribution:
-        {json.dumps(self.stats['file_types'], indent=2)}
+        - Total Size: {humanize.naturalsize(stats['total_size'])}
+        - Total Files: {stats['total_files']}
+        - Total Directories: {stats['total_dirs']}
+
+        File Size Percentiles (bytes): {json.dumps(stats['size_quantiles'])}
+
+        File Types Distribution (files, bytes, size percentiles):
+        {json.dumps({
+            ext: {
+                'files': count,
+                'bytes': stats['file_type_sizes'].get(ext, 0),
+                **stats['file_type_quantiles'].get(ext, {})
+            } for ext, count in sorted(stats['file_types'].items())
+        }, indent=2)}
+
+        Unused Files (>{humanize.naturaldelta(self.unused_age)}): {stats['unused_count']} \
+({humanize.naturalsize(stats['unused_size'])})
+        Large Files (>{format_threshold(self.large_file_size)}): {stats['large_count']} \
+({humanize.naturalsize(stats['large_size'])})
+        Duplicate Files: {stats['duplicate_files']} \
+({humanize.naturalsize(stats['duplicate_reclaimable'])} reclaimable)
+
+        Oldest File: {stats['oldest_file']['path']}
+        ({datetime.fromtimestamp(stats['oldest_file']['time']).strftime('%Y-%m-%d')})
+
+        Newest File: {stats['newest_file']['path']}
+        ({datetime.fromtimestamp(stats['newest_file']['time']).strftime('%Y-%m-%d')})
+        """
 
-        Unused Files (>6 months): {len(self.stats['unused_files'])}
-        Large Files (>100MB): {len(self.stats['large_files'])}
+    async def analyze_with_ai(self, api_key: str, base_url: Optional[str] = None,
+                              model: str = "gpt-3.5-turbo",
+                              on_token=None,
+                              cache: Optional[AnalysisCache] = None,
+                              stats: Optional[Dict] = None) -> str:
+        """Analyze directory statistics using OpenAI.
+
+        The response is streamed and each piece of text is passed to
+        on_token as it arrives. base_url points the client at any
+        OpenAI-compatible server. With a cache, an answer for the same
+        model and stats is returned (and passed to on_token) without a
+        request. stats defaults to this analyzer's; pass a copy when
+        another thread may still be changing them.
+        """
+        summary = self._stats_summary(self.stats if stats is None else stats)
+        prompt = (
+            f"Analyze this directory structure and provide insights:\n{summary}\n\n"
+            "Please provide:\n"
+            "1. Overall structure analysis\n"
+            "2. Storage efficiency recommendations\n"
+            "3. Cleanup opportunities\n"
+            "4. File organization suggestions\n"
+            "5. Potential issues or risks\n"
+            "6. Best practices recommendations"
+        )
 
-        Oldest File: {self.stats['oldest_file']['path']}
-        ({datetime.fromtimestamp(self.stats['oldest_file']['time']).strftime('%Y-%m-%d')})
+        digest = AnalysisCache.digest(model, prompt)
+        if cache is not None:
+            analysis = cache.get(digest)
+            if analysis is not None:
+                if on_token:
+                    on_token(analysis)
+                return analysis
 
-        Newest File: {self.stats['newest_file']['path']}
-        ({datetime.fromtimestamp(self.stats['newest_file']['time']).strftime('%Y-%m-%d')})
-        """
+        from openai import AsyncOpenAI
 
+        client = AsyncOpenAI(api_key=api_key, base_url=base_url)
         try:
-            response = await client.chat.completions.create(
-                model="gpt-3.5-turbo",
-                messages=[{
-                    "role": "user",
-                    "content": f"Analyze this directory structure and provide insights:\n{stats_summary}\n\n"
-                    "Please provide:\n"
-                    "1. Overall structure analysis\n"
-                    "2. Storage efficiency recommendations\n"
-                    "3. Cleanup opportunities\n"
-                    "4. File organization suggestions\n"
-                    "5. Potential issues or risks\n"
-                    "6. Best practices recommendations"
-                }]
+            stream = await client.chat.completions.create(
+                model=model,
+                messages=[{"role": "user", "content": prompt}],
+                stream=True
             )
-            return response.choices[0].message.content
+            parts = []
+            async for chunk in stream:
+                if not chunk.choices:
+                    continue
+                text = chunk.choices[0].delta.content
+                if text:
+                    parts.append(text)
+                    if on_token:
+                        on_token(text)
+            analysis = "".join(parts)
         except Exception as e:
             return f"Error getting AI analysis: {str(e)}"
+        finally:
+            await client.close()
+
+        if cache is not None:
+            try:
+                cache.put(digest, analysis)
+            except OSError as e:
+                print(f"Could not cache AI analysis: {e}", file=sys.stderr)
+        return analysis
+
+
+class Inotify:
+    """Minimal ctypes binding to the Linux inotify API"""
+
+    IN_MODIFY = 0x00000002
+    IN_CLOSE_WRITE = 0x00000008
+    IN_MOVED_FROM = 0x00000040
+    IN_MOVED_TO = 0x00000080
+    IN_CREATE = 0x00000100
+    IN_DELETE = 0x00000200
+    IN_Q_OVERFLOW = 0x00004000
+    IN_IGNORED = 0x00008000
+    IN_ONLYDIR = 0x01000000
+    IN_DONT_FOLLOW = 0x02000000
+    IN_ISDIR = 0x40000000
+    IN_CLOEXEC = 0o2000000
+
+    _EVENT = struct.Struct('iIII')
 
-
-class ModernFileAnalyzerGUI(ctk.CTk):
     def __init__(self):
-        super().__init__()
-
-        self.title("Modern File System Analyzer")
-        self.geometry("1000x800")
-        
-        # Initialize analyzer
-        self.analyzer = FileAnalyzer()
-        
-        # Create the main container with padding
-        self.grid_columnconfigure(0, weight=1)
-        self.grid_rowconfigure(0, weight=1)
-        
-        self.setup_gui()
-
-    def setup_gui(self):
-        # Create main container
-        main_container = ctk.CTkFrame(self)
-        main_container.grid(row=0, column=0, sticky="nsew", padx=30, pady=30)
-        main_container.grid_columnconfigure(0, weight=1)
-
-        # Header
-        header_frame = ctk.CTkFrame(main_container, fg_color="transparent")
-        header_frame.grid(row=0, column=0, sticky="ew", pady=(20, 30), padx=(20, 30))
-        
-        header_label = ctk.CTkLabel(
-            header_frame, 
-            text="File System Analyzer", 
-            font=ctk.CTkFont(size=24, weight="bold")
-        )
-        header_label.grid(row=0, column=0, sticky="w")
-
-        # Select folder button with modern styling
-        self.select_button = ctk.CTkButton(
-            header_frame,
-            text="Select Folder",
-            command=self.select_folder,
-            font=ctk.CTkFont(size=14)
-        )
-        self.select_button.grid(row=0, column=1, padx=20)
-
-        # Progress bar
-        self.progress_bar = ctk.CTkProgressBar(header_frame)
-        self.progress_bar.grid(row=1, column=0, columnspan=2, sticky="ew", pady=(10, 0))
-        self.progress_bar.set(0)
-
-        # Create tabview for organizing content
-        self.tabview = ctk.CTkTabview(main_container)
-        self.tabview.grid(row=1, column=0, sticky="nsew")
-        main_container.grid_rowconfigure(1, weight=1)
-
-        # Add tabs
-        self.tab_overview = self.tabview.add("Overview")
-        self.tab_details = self.tabview.add("File Details")
-        self.tab_ai = self.tabview.add("AI Analysis")
-
-        # Setup tab contents
-        self.setup_overview_tab()
-        self.setup_details_tab()
-        self.setup_ai_tab()
-
-    def setup_overview_tab(self):
-        # Overview frame
-        self.overview_frame = ctk.CTkFrame(self.tab_overview)
-        self.overview_frame.pack(fill="both", expand=True, padx=20, pady=20)
-
-        # Stats labels with modern styling
-        self.total_size_label = ctk.CTkLabel(
-            self.overview_frame,
-            text="Total Size: -",
-            font=ctk.CTkFont(size=16)
-        )
-        self.total_size_label.pack(anchor="w", pady=10, padx=15)
-
-        self.total_files_label = ctk.CTkLabel(
-            self.overview_frame,
-            text="Total Files: -",
-            font=ctk.CTkFont(size=16)
-        )
-        self.total_files_label.pack(anchor="w", pady=10, padx=15)
-
-        self.total_dirs_label = ctk.CTkLabel(
-            self.overview_frame,
-            text="Total Directories: -",
-            font=ctk.CTkFont(size=16)
-        )
-        self.total_dirs_label.pack(anchor="w", pady=10, padx=15)
-
-
-    def setup_details_tab(self):
-        # Details frame with scrollable sections
-        self.details_frame = ctk.CTkFrame(self.tab_details)
-        self.details_frame.pack(fill="both", expand=True, padx=20, pady=20)
-
-        # File types section
-        file_types_label = ctk.CTkLabel(
-            self.details_frame,
-            text="File Types Distribution:",
-            font=ctk.CTkFont(size=16, weight="bold")
-        )
-        file_types_label.pack(anchor="w", pady=(0, 10), padx=15)
-
-        self.file_types_text = ctk.CTkTextbox(
-            self.details_frame,
-            height=150,
-            font=ctk.CTkFont(size=14)
-        )
-        self.file_types_text.pack(fill="both", pady=(0, 20), padx=15)
-
-        # Large files section
-        large_files_label = ctk.CTkLabel(
-            self.details_frame,
-            text="Large Files (>100MB):",
-            font=ctk.CTkFont(size=16, weight="bold")
-        )
-        large_files_label.pack(anchor="w", pady=(0, 10), padx=15)
-
-        self.large_files_text = ctk.CTkTextbox(
-            self.details_frame,
-            height=150,
-            font=ctk.CTkFont(size=14)
-        )
-        self.large_files_text.pack(fill="both", pady=(0, 20), padx=15)
-
-        # Unused files section
-        unused_files_label = ctk.CTkLabel(
-            self.details_frame,
-            text="Unused Files (Not Accessed in 6 Months):",
-            font=ctk.CTkFont(size=16, weight="bold")
-        )
-        unused_files_label.pack(anchor="w", pady=(0, 10), padx=15)
-
-        self.unused_files_text = ctk.CTkTextbox(
-            self.details_frame,
-            height=150,
-            font=ctk.CTkFont(size=14)
-        )
-        self.unused_files_text.pack(fill="both", pady=(0, 20), padx=15)
-
-        # Timestamps section
-        timestamps_label = ctk.CTkLabel(
-            self.details_frame,
-            text="File Timestamps:",
-            font=ctk.CTkFont(size=16, weight="bold")
-        )
-        timestamps_label.pack(anchor="w", pady=(0, 10), padx=15)
-
-        self.timestamps_text = ctk.CTkTextbox(
-            self.details_frame,
-            height=100,
-            font=ctk.CTkFont(size=14)
-        )
-        self.timestamps_text.pack(fill="both", pady=(0, 20), padx=15)
-
-    def setup_ai_tab(self):
-        # AI Analysis frame
-        self.ai_frame = ctk.CTkFrame(self.tab_ai)
-        self.ai_frame.pack(fill="both", expand=True, padx=20, pady=20)
-
-        # API Key entry
-        api_key_frame = ctk.CTkFrame(self.ai_frame, fg_color="transparent")
-        api_key_frame.pack(fill="x", pady=(15, 25))
-
-        self.api_key_entry = ctk.CTkEntry(
-            api_key_frame,
-            placeholder_text="Enter OpenAI API Key",
-            width=300,
-            show="*"
-        )
-        self.api_key_entry.pack(side="left", padx=(10, 10))
-
-        self.analyze_button = ctk.CTkButton(
-            api_key_frame,
-            text="Get AI Analysis",
-            command=self.get_ai_analysis
-        )
-        self.analyze_button.pack(side="left")
-
-        # AI Results
-        self.ai_results_text = ctk.CTkTextbox(
-            self.ai_frame,
-            wrap="word",
-            font=ctk.CTkFont(size=14)
-        )
-        self.ai_results_text.pack(fill="both", expand=True)
-
-    def select_folder(self):
-        folder_path = ctk.filedialog.askdirectory()
-        if folder_path:
-            self.select_button.configure(state="disabled")
-            self.progress_bar.set(0)
-            
-            # Create a thread for scanning
-            scan_thread = threading.Thread(
-                target=self.scan_directory_thread,
-                args=(folder_path,)
-            )
-            scan_thread.start()
-
-    def scan_directory_thread(self, folder_path):
-        def update_progress(progress):
-            self.progress_bar.set(progress / 100)
-            
+        libc_name = ctypes.util.find_library('c') or 'libc.so.6'
+        self._libc = ctypes.CDLL(libc_name, use_errno=True)
+        self.fd = self._libc.inotify_init1(self.IN_CLOEXEC)
+        if self.fd < 0:
+            self._raise()
+
+    def _raise(self):
+        code = ctypes.get_errno()
+        if code == errno.ENOSPC:
+            raise OSError(code, "inotify watch limit reached, raise "
+                          "fs.inotify.max_user_watches")
+        raise OSError(code, os.strerror(code))
+
+    def add_watch(self, path: str, mask: int) -> int:
+        wd = self._libc.inotify_add_watch(self.fd, os.fsencode(path), mask)
+        if wd < 0:
+            self._raise()
+        return wd
+
+    def remove_watch(self, wd: int):
+        self._libc.inotify_rm_watch(self.fd, wd)
+
+    def read(self, timeout: float) -> List[tuple]:
+        """Wait up to timeout seconds and return (wd, mask, name) events"""
+        readable, _, _ = select.select([self.fd], [], [], timeout)
+        if not readable:
+            return []
+        data = os.read(self.fd, 64 * 1024)
+        events = []
+        offset = 0
+        while offset < len(data):
+            wd, mask, _, length = self._EVENT.unpack_from(data, offset)
+            offset += self._EVENT.size
+            name = data[offset:offset + length].rstrip(b'\0')
+            offset += length
+            events.append((wd, mask, os.fsdecode(name)))
+        return events
+
+    def close(self):
+        os.close(self.fd)
+
+
+class ScanWatcher:
+    """Keep a FileAnalyzer's stats current from inotify events.
+
+    The analyzer must have scanned root with keep_files=True. Events are
+    collected for interval seconds at a time and then applied as deltas:
+    every file path touched is stat'ed again and its old contribution is
+    replaced by the new one, so the order of events within a batch doesn't
+    matter. New directories are walked and watched, removed ones are
+    dropped with everything below them. If the kernel event queue
+    overflows the root is scanned again from scratch.
+
+    Totals, extension counts, large/unused counts and sizes, timestamps and
+    directory sizes are maintained; the large and unused lists only hold
+    entries seen so far, and duplicate groups and size quantiles are not
+    updated.
+    """
+
+    MASK = (Inotify.IN_CREATE | Inotify.IN_DELETE | Inotify.IN_MODIFY
+            | Inotify.IN_CLOSE_WRITE | Inotify.IN_MOVED_FROM
+            | Inotify.IN_MOVED_TO | Inotify.IN_ONLYDIR
+            | Inotify.IN_DONT_FOLLOW)
+
+    def __init__(self, analyzer: 'FileAnalyzer', root: str,
+                 on_update=None, interval: float = 1.0):
+        self.analyzer = analyzer
+        self.root = os.path.abspath(root)
+        self.on_update = on_update
+        self.interval = interval
+        self.inotify = Inotify()
+        self.watches: Dict[int, str] = {}
+        self.dir_nodes: Dict[str, int] = {}
+
+    def _index_tree(self):
+        tree = self.analyzer.tree
+        self.dir_nodes = {tree.path(node): node for node in range(len(tree))}
+
+    def _watch(self, path: str):
         try:
-            stats = self.analyzer.scan_directory(folder_path, update_progress)
-            self.after(0, self.update_gui_with_stats, stats)
-        finally:
-            self.after(0, lambda: self.select_button.configure(state="normal"))
-
-
-    def update_gui_with_stats(self, stats):
-        # Update overview tab
-        self.total_size_label.configure(
-            text=f"Total Size: {humanize.naturalsize(stats['total_size'])}")
-        self.total_files_label.configure(
-            text=f"Total Files: {stats['total_files']}")
-        self.total_dirs_label.configure(
-            text=f"Total Directories: {stats['total_dirs']}")
-
-        # Update file types text
-        self.file_types_text.delete("1.0", "end")
-        self.file_types_text.insert("1.0", "Distribution by extension:\n\n")
-        sorted_types = sorted(stats['file_types'].items(),
-                            key=lambda x: x[1],
-                            reverse=True)
-        for ext, count in sorted_types:
-            self.file_types_text.insert(
-                "end",
-                f"{ext}: {count} files\n"
-            )
-
-        # Update large files text
-        self.large_files_text.delete("1.0", "end")
-        if stats['large_files']:
-            sorted_large_files = sorted(stats['large_files'],
-                                        key=lambda x: x['size'],
-                                        reverse=True)
-            for file in sorted_large_files:
-                self.large_files_text.insert(
-                    "end",
-                    f"{os.path.basename(file['path'])}\n"
-                    f"Size: {humanize.naturalsize(file['size'])}\n"
-                    f"Path: {file['path']}\n\n"
-                )
-        else:
-            self.large_files_text.insert(
-                "end", "No files larger than 100MB found.\n")
-
-        # Update unused files text
-        self.unused_files_text.delete("1.0", "end")
-        if stats['unused_files']:
-            sorted_unused = sorted(stats['unused_files'],
-                                key=lambda x: x['last_accessed'])
-            for file in sorted_unused:
-                last_access = datetime.fromtimestamp(file['last_accessed'])
-                self.unused_files_text.insert(
-                    "end",
-                    f"{os.path.basename(file['path'])}\n"
-                    f"Last accessed: {last_access.strftime('%Y-%m-%d %H:%M:%S')}\n"
-                    f"Size: {humanize.naturalsize(file['size'])}\n"
-                    f"Path: {file['path']}\n\n"
-                )
-        else:
-            self.unused_files_text.insert("end", "No unused files found.\n")
-
-        # Update timestamps text
-        self.timestamps_text.delete("1.0", "end")
-        if stats['newest_file'] and stats['oldest_file']:
-            newest_time = datetime.fromtimestamp(stats['newest_file']['time'])
-            oldest_time = datetime.fromtimestamp(stats['oldest_file']['time'])
-
-            self.timestamps_text.insert(
-                "end",
-                f"Newest File:\n"
-                f"- {os.path.basename(stats['newest_file']['path'])}\n"
-                f"- Modified: {newest_time.strftime('%Y-%m-%d %H:%M:%S')}\n\n"
-                f"Oldest File:\n"
-                f"- {os.path.basename(stats['oldest_file']['path'])}\n"
-                f"- Modified: {oldest_time.strftime('%Y-%m-%d %H:%M:%S')}\n"
-            )
-    async def _get_ai_analysis(self):
-        if not self.api_key_entry.get():
-            CTkMessagebox(
-                title="Error",
-                message="Please enter an OpenAI API key",
-                icon="warning"
-            )
+            self.watches[self.inotify.add_watch(path, self.MASK)] = path
+        except FileNotFoundError:
+            pass
+
+    def _watch_all(self):
+        for wd in list(self.watches):
+            self.inotify.remove_watch(wd)
+        self.watches = {}
+        self._index_tree()
+        for path in self.dir_nodes:
+            self._watch(path)
+
+    def _adjust_tree(self, directory: str, size: int, count: int):
+        tree = self.analyzer.tree
+        node = self.dir_nodes.get(directory, -1)
+        while node >= 0:
+            tree.sizes[node] += size
+            tree.file_counts[node] += count
+            node = tree.parents[node]
+
+    def _entry(self, stat: os.stat_result) -> tuple:
+        """A file's entry in analyzer.files, classified as of now"""
+        return (stat.st_size, stat.st_mtime, stat.st_atime,
+                stat.st_atime < time.time() - self.analyzer.unused_age,
+                stat.st_size > self.analyzer.large_file_size)
+
+    def _account(self, path: str, entry: tuple, sign: int):
+        """Add (sign=1) or remove (sign=-1) one file's contribution
+
+        The unused and large flags stored in entry decide which counters
+        change, so a removal undoes exactly what the addition counted.
+        """
+        stats = self.analyzer.stats
+        top_k = self.analyzer.top_k
+        size, modified_time, accessed_time, unused, large = entry
+        stats['total_size'] += sign * size
+        stats['total_files'] += sign
+        ext = os.path.splitext(path)[1].lower() or 'no_extension'
+        stats['file_types'][ext] = stats['file_types'].get(ext, 0) + sign
+        stats['file_type_sizes'][ext] = (
+            stats['file_type_sizes'].get(ext, 0) + sign * size)
+        if not stats['file_types'][ext]:
+            del stats['file_types'][ext]
+            del stats['file_type_sizes'][ext]
+        self._adjust_tree(os.path.dirname(path), sign * size, sign)
+
+        if unused:
+            stats['unused_count'] += sign
+            stats['unused_size'] += sign * size
+            if sign < 0:
+                stats['unused_files'] = [f for f in stats['unused_files']
+                                         if f['path'] != path]
+            else:
+                stats['unused_files'].append({'path': path,
+                                              'last_accessed': accessed_time,
+                                              'size': size})
+                stats['unused_files'].sort(key=lambda f: f['last_accessed'])
+                del stats['unused_files'][top_k:]
+        if large:
+            stats['large_count'] += sign
+            stats['large_size'] += sign * size
+            if sign < 0:
+                stats['large_files'] = [f for f in stats['large_files']
+                                        if f['path'] != path]
+            else:
+                stats['large_files'].append({'path': path, 'size': size})
+                stats['large_files'].sort(key=lambda f: f['size'],
+                                          reverse=True)
+                del stats['large_files'][top_k:]
+
+        if sign > 0:
+            newest = stats['newest_file']
+            if not newest or (modified_time, newest['path']) > (newest['time'], path):
+                stats['newest_file'] = {'path': path, 'time': modified_time}
+            oldest = stats['oldest_file']
+            if not oldest or (modified_time, path) < (oldest['time'], oldest['path']):
+                stats['oldest_file'] = {'path': path, 'time': modified_time}
+
+    def _update_file(self, path: str):
+        if self.analyzer.is_excluded(path, False, self.root):
             return
-
-        self.analyze_button.configure(state="disabled")
-        self.ai_results_text.delete("1.0", "end")
-        self.ai_results_text.insert("1.0", "Getting AI analysis... Please wait.\n")
-
+        files = self.analyzer.files
+        old = files.pop(path, None)
+        if old is not None:
+            self._account(path, old, -1)
         try:
-            analysis = await self.analyzer.analyze_with_ai(self.api_key_entry.get())
-            self.ai_results_text.delete("1.0", "end")
-            self.ai_results_text.insert("1.0", analysis)
-        except Exception as e:
-            self.ai_results_text.delete("1.0", "end")
-            self.ai_results_text.insert("1.0", f"Error: {str(e)}")
+            stat = os.stat(path)
+        except OSError:
+            stat = None
+        if stat is not None and not os.path.isdir(path):
+            files[path] = self._entry(stat)
+            self._account(path, files[path], 1)
+
+        # A removed or modified oldest/newest file may no longer be either
+        stats = self.analyzer.stats
+        if old is not None and path in (
+                (stats['oldest_file'] or {}).get('path'),
+                (stats['newest_file'] or {}).get('path')):
+            self._recompute_timestamps()
+
+    def _recompute_timestamps(self):
+        stats = self.analyzer.stats
+        stats['newest_file'] = stats['oldest_file'] = None
+        for path, entry in self.analyzer.files.items():
+            modified_time = entry[1]
+            newest = stats['newest_file']
+            oldest = stats['oldest_file']
+            if not newest or (modified_time, newest['path']) > (newest['time'], path):
+                stats['newest_file'] = {'path': path, 'time': modified_time}
+            if not oldest or (modified_time, path) < (oldest['time'], oldest['path']):
+                stats['oldest_file'] = {'path': path, 'time': modified_time}
+
+    def _add_directory(self, path: str):
+        parent = self.dir_nodes.get(os.path.dirname(path))
+        if (path in self.dir_nodes or parent is None
+                or self.analyzer.is_excluded(path, True, self.root)):
+            return
+        self.dir_nodes[path] = self.analyzer.tree.add(
+            parent, os.path.basename(path))
+        self.analyzer.stats['total_dirs'] += 1
+        self._watch(path)
+        _, dirs, files = self.analyzer._read_directory(path)
+        for name, _ in files:
+            self._update_file(os.path.join(path, name))
+        for name, is_symlink in dirs:
+            if is_symlink:
+                if not self.analyzer.is_excluded(os.path.join(path, name),
+                                                 True, self.root):
+                    self.analyzer.stats['total_dirs'] += 1
+            else:
+                self._add_directory(os.path.join(path, name))
+
+    def _remove_directory(self, path: str):
+        prefix = path + os.sep
+        for file_path in [p for p in self.analyzer.files
+                          if p.startswith(prefix)]:
+            self._update_file(file_path)
+        for dir_path in [p for p in self.dir_nodes
+                         if p == path or p.startswith(prefix)]:
+            del self.dir_nodes[dir_path]
+            self.analyzer.stats['total_dirs'] -= 1
+        for wd, watched in list(self.watches.items()):
+            if watched == path or watched.startswith(prefix):
+                self.inotify.remove_watch(wd)
+                del self.watches[wd]
+
+    def snapshot(self) -> Dict:
+        """Copy of the current stats, safe to hand to another thread"""
+        stats = dict(self.analyzer.stats)
+        stats['file_types'] = dict(stats['file_types'])
+        stats['file_type_sizes'] = dict(stats['file_type_sizes'])
+        stats['unused_files'] = list(stats['unused_files'])
+        stats['large_files'] = list(stats['large_files'])
+        stats['top_directories'] = self.analyzer.tree.top(
+            self.analyzer.top_k)
+        return stats
+
+    def run(self, stop_event: threading.Event):
+        """Apply events until stop_event is set; a batch still being
+        collected then is dropped"""
+        self._watch_all()
+        try:
+            while not stop_event.is_set():
+                changed_files = set()
+                created_dirs = []
+                removed_dirs = []
+                overflow = False
+                deadline = time.monotonic() + self.interval
+                while not stop_event.is_set():
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    for wd, mask, name in self.inotify.read(remaining):
+                        if mask & Inotify.IN_Q_OVERFLOW:
+                            overflow = True
+                            continue
+                        if mask & Inotify.IN_IGNORED or wd not in self.watches:
+                            continue
+                        path = os.path.join(self.watches[wd], name)
+                        if not mask & Inotify.IN_ISDIR:
+                            changed_files.add(path)
+                        elif mask & (Inotify.IN_CREATE | Inotify.IN_MOVED_TO):
+                            created_dirs.append(path)
+                        elif mask & (Inotify.IN_DELETE | Inotify.IN_MOVED_FROM):
+                            removed_dirs.append(path)
+
+                if stop_event.is_set():
+                    # The analyzer may already belong to another scan
+                    break
+                if overflow:
+                    self.analyzer.scan_directory(self.root, keep_files=True)
+                    self._watch_all()
+                elif not (changed_files or created_dirs or removed_dirs):
+                    continue
+                else:
+                    for path in removed_dirs:
+                        self._remove_directory(path)
+                    for path in created_dirs:
+                        self._add_directory(path)
+                    for path in changed_files:
+                        self._update_file(path)
+                if self.on_update:
+                    self.on_update(self.snapshot())
         finally:
-            self.analyze_button.configure(state="normal")
+            self.inotify.close()
+
+
+def format_progress(details: Dict) -> str:
+    """One-line description of scan progress details"""
+    text = (f"{details['files']:,} files, "
+            f"{details['files_per_sec']:,.0f} files/s")
+    if details['eta'] is not None:
+        text += f", ETA {humanize.naturaldelta(details['eta'])}"
+    return text
+
+
+def format_total(stats: Dict, key: str, size: bool = False,
+                 group: Optional[str] = None) -> str:
+    """A total from stats, with its 95% confidence interval if estimated"""
+    value = (stats[group] if group else stats)[key]
+    text = humanize.naturalsize(value) if size else str(value)
+    estimates = stats.get('estimates')
+    if estimates:
+        estimate = (estimates[group] if group else estimates).get(key)
+        if estimate and estimate[1]:
+            margin = Z_95 * estimate[1]
+            text += (f" ± {humanize.naturalsize(margin)}" if size
+                     else f" ± {margin:.0f}")
+    return text
+
+
+def format_threshold(size: int) -> str:
+    return humanize.naturalsize(size, binary=True, format='%.0f')
+
+
+def parse_size(text: str) -> int:
+    """Bytes from a size like 500, 100M, 1.5GB or 2GiB (binary units)"""
+    number = text.strip().upper().rstrip('B').rstrip('I')
+    factor = 1
+    if number and number[-1] in 'KMGTP':
+        factor = 1024 ** ('KMGTP'.index(number[-1]) + 1)
+        number = number[:-1]
+    try:
+        return int(float(number) * factor)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"invalid size: {text}")
+
+
+def parse_date(text: str) -> float:
+    """Timestamp of an ISO date (2024-01-01) or a bare year (2024)"""
+    try:
+        if text.isdigit() and len(text) == 4:
+            return datetime(int(text), 1, 1).timestamp()
+        return datetime.fromisoformat(text).timestamp()
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"invalid date: {text}")
+
+
+def print_query(table: FileTable, indices, group_by: Optional[str],
+                limit: int):
+    """Print the files matching a query, or their totals per group"""
+    total = int(table.sizes[indices].sum()) if len(indices) else 0
+    print(f"{len(indices)} files, {humanize.naturalsize(total)}")
+    if group_by:
+        for group in table.group(indices, group_by)[:limit]:
+            print(f"{humanize.naturalsize(group['size']):>12}  "
+                  f"{group['files']:>8} files  {group[group_by]}")
+    else:
+        for file in table.largest(indices, limit):
+            accessed = datetime.fromtimestamp(file['accessed'])
+            print(f"{humanize.naturalsize(file['size']):>12}  "
+                  f"{accessed.strftime('%Y-%m-%d')}  {file['path']}")
+
+
+def format_quantiles(quantiles: Dict) -> str:
+    return ", ".join(f"{name} {humanize.naturalsize(value)}"
+                     for name, value in quantiles.items())
+
+
+def format_file_type(stats: Dict, ext: str) -> str:
+    """Files, bytes and size percentiles of one extension"""
+    text = (f"{ext}: {format_total(stats, ext, group='file_types')} files, "
+            f"{format_total(stats, ext, True, group='file_type_sizes')}")
+    quantiles = stats['file_type_quantiles'].get(ext)
+    if quantiles:
+        text += f" ({format_quantiles(quantiles)})"
+    return text
+
+
+def print_stats(stats: ScanStats, top_dirs: int = 0):
+    """Print scan results for the command line"""
+    print(f"\nAnalysis Results:")
+    if stats['estimates']:
+        print("(Estimated from a sample, with 95% confidence intervals)")
+    print(f"Total Size: {format_total(stats, 'total_size', True)}")
+    print(f"Total Files: {format_total(stats, 'total_files')}")
+    print(f"Total Directories: {format_total(stats, 'total_dirs')}")
+
+    print(f"Unused Files (>{humanize.naturaldelta(stats['unused_age'])}): "
+          f"{format_total(stats, 'unused_count')} "
+          f"({format_total(stats, 'unused_size', True)})")
+    print(f"Large Files (>{format_threshold(stats['large_file_size'])}): "
+          f"{format_total(stats, 'large_count')} "
+          f"({format_total(stats, 'large_size', True)})")
+
+    if stats['size_quantiles']:
+        print(f"File Sizes: {format_quantiles(stats['size_quantiles'])}")
+
+    print("\nFile Types:")
+    for ext in sorted(stats['file_types'],
+                      key=lambda ext: stats['file_type_sizes'].get(ext, 0),
+                      reverse=True):
+        print(format_file_type(stats, ext))
+
+    if stats['duplicate_groups']:
+        print(f"\nDuplicate Files: {stats['duplicate_files']} "
+              f"({humanize.naturalsize(stats['duplicate_reclaimable'])} "
+              f"reclaimable)")
+        for group in stats['duplicate_groups']:
+            print(f"{len(group['paths'])} x "
+                  f"{humanize.naturalsize(group['size'])}: "
+                  + ", ".join(group['paths']))
+
+    if top_dirs:
+        print("\nTop Directories:")
+        directories = (stats.tree.top(top_dirs) if stats.tree is not None
+                       else stats['top_directories'][:top_dirs])
+        for directory in directories:
+            print(f"{humanize.naturalsize(directory['size']):>12}  "
+                  f"{directory['path']}")
+
+
+def print_diff(diff: Dict, top: int = 20):
+    """Print the fastest-growing directories and extensions of a diff"""
+    days = diff['seconds'] / (24 * 60 * 60)
+
+    def growth(row):
+        sign = '-' if row['growth'] < 0 else '+'
+        text = f"{sign}{humanize.naturalsize(abs(row['growth']))}"
+        if days > 0:
+            text += f" ({sign}{humanize.naturalsize(abs(row['growth']) / days)}/day)"
+        return text
+
+    print(f"Comparing {diff['old_root']} to {diff['new_root']} "
+          f"({humanize.naturaldelta(diff['seconds'])} apart)")
+
+    print("\nFastest-Growing Directories:")
+    for row in diff['directories'][:top]:
+        if row['growth'] <= 0:
+            break
+        print(f"{growth(row):>30}  {row['path']}"
+              + (f" [{row['status']}]" if row['status'] != 'changed' else ""))
+
+    print("\nFastest-Growing Extensions:")
+    for row in diff['extensions'][:top]:
+        if row['growth'] <= 0:
+            break
+        print(f"{growth(row):>30}  {row['extension']} "
+              f"({row['files']:+d} files)")
+
+    shrinking = [row for row in reversed(diff['directories'])
+                 if row['growth'] < 0][:top]
+    if shrinking:
+        print("\nShrinking Directories:")
+        for row in shrinking:
+            print(f"{growth(row):>30}  {row['path']}"
+                  + (f" [{row['status']}]" if row['status'] != 'changed' else ""))
+
+
+def snapshot_path(path: str) -> str:
+    """A new timestamped file name if path is a directory of snapshots"""
+    if os.path.isdir(path):
+        return os.path.join(
+            path, datetime.now().strftime('%Y%m%d-%H%M%S') + '.snapshot')
+    return path
 
-    def get_ai_analysis(self):
-        asyncio.run(self._get_ai_analysis())
 
 def main():
     parser = argparse.ArgumentParser(description='Analyze file system structure')
     parser.add_argument('--cli', action='store_true', help='Run in command-line mode')
     parser.add_argument('--path', type=str, help='Path to analyze')
     parser.add_argument('--api-key', type=str, help='OpenAI API key')
+    parser.add_argument('--api-base', type=str, default=None, metavar='URL',
+                        help='Base URL of an OpenAI-compatible API '
+                        '(e.g. a local server)')
+    parser.add_argument('--ai-cache-days', type=float, default=7,
+                        help='Reuse AI analyses of identical stats for this '
+                        'many days (0 disables the cache)')
+    parser.add_argument('--workers', type=int, default=None,
+                        help='Number of threads used to scan directories')
+    parser.add_argument('--top-k', type=int, default=100,
+                        help='Number of large and unused files to keep')
+    parser.add_argument('--top-dirs', type=int, default=0, metavar='N',
+                        help='Print the N largest directories')
+    parser.add_argument('--duplicates', action='store_true',
+                        help='Find duplicate files')
+    parser.add_argument('--hash-workers', type=int, default=None,
+                        help='Number of processes used to hash files')
+    parser.add_argument('--incremental', action='store_true',
+                        help='Reuse unchanged directories from the previous scan')
+    parser.add_argument('--index', type=str, default=None,
+                        help='Index database for --incremental '
+                        '(default: ~/.cache/storage_analyzer/index.db)')
+    parser.add_argument('--watch', action='store_true',
+                        help='Keep the results current with inotify '
+                        '(Linux only)')
+    parser.add_argument('--sample', type=float, default=None,
+                        metavar='FRACTION',
+                        help='Estimate from a random sample of this fraction '
+                        'of the subdirectories at each level')
+    parser.add_argument('--seed', type=int, default=None,
+                        help='Random seed for --sample')
+    parser.add_argument('--processes', type=int, default=None, metavar='N',
+                        help='Scan top-level directories in N processes')
+    parser.add_argument('--output', type=str, default=None,
+                        help='Save the results as JSON to this file')
+    output_format = parser.add_mutually_exclusive_group()
+    output_format.add_argument('--json', action='store_true',
+                               help='Print the results as JSON instead of text')
+    output_format.add_argument('--ndjson', action='store_true',
+                               help='Stream a JSON line per directory as it '
+                               'is scanned, then one with the results')
+    parser.add_argument('--unused-days', type=float, default=UNUSED_AGE / 86400,
+                        help='Report files not accessed for this many days '
+                        'as unused (default: 180)')
+    parser.add_argument('--large-size', type=parse_size,
+                        default=LARGE_FILE_SIZE, metavar='SIZE',
+                        help='Report files bigger than this as large '
+                        '(e.g. 500M, 2G; default: 100M)')
+    parser.add_argument('--exclude', action='append', default=[],
+                        metavar='PATTERN',
+                        help='Skip paths matching this gitignore-style '
+                        'pattern (e.g. .git/, node_modules/, "*.tmp"); '
+                        'can be repeated')
+    parser.add_argument('--exclude-from', type=str, default=None,
+                        metavar='FILE',
+                        help='Read exclude patterns from a file, one per '
+                        'line (e.g. a .gitignore)')
+    parser.add_argument('--one-file-system', action='store_true',
+                        help="Don't descend into other filesystems")
+    parser.add_argument('--follow-symlinks', action='store_true',
+                        help='Descend into symlinked directories '
+                        '(every directory is still counted once)')
+    parser.add_argument('--export-files', type=str, default=None,
+                        metavar='DIR',
+                        help='Save per-file records as .npy columns for '
+                        '"query" (needs numpy)')
+    parser.add_argument('--snapshot', type=str, default=None, metavar='PATH',
+                        help='Save a snapshot of directory sizes for "diff" '
+                        '(a directory gets a new timestamped file per scan)')
+
+    subparsers = parser.add_subparsers(dest='command')
+    merge_parser = subparsers.add_parser(
+        'merge', help='Combine results saved with --output')
+    merge_parser.add_argument('files', nargs='+',
+                              help='Result files of disjoint scans')
+    merge_parser.add_argument('--output', type=str, default=None,
+                              help='Save the merged results to this file')
+    merge_parser.add_argument('--top-dirs', type=int, default=0, metavar='N',
+                              help='Print the N largest directories')
+    merge_parser.add_argument('--snapshot', type=str, default=None,
+                              metavar='PATH',
+                              help='Save a snapshot of the merged results')
+    diff_parser = subparsers.add_parser(
+        'diff', help='Show what grew between two snapshots')
+    diff_parser.add_argument('old', help='Earlier snapshot')
+    diff_parser.add_argument('new', help='Later snapshot')
+    diff_parser.add_argument('--limit', type=int, default=20, metavar='N',
+                             help='Number of directories and extensions '
+                             'to list')
+    diff_parser.add_argument('--json', action='store_true',
+                             help='Print the full diff as JSON')
+
+    query_parser = subparsers.add_parser(
+        'query', help='Filter files saved with --export-files')
+    query_parser.add_argument('table', help='Directory given to --export-files')
+    query_parser.add_argument('--under', type=str, default=None,
+                              metavar='PATH',
+                              help='Only files below this directory')
+    query_parser.add_argument('--larger-than', type=parse_size, default=None,
+                              metavar='SIZE')
+    query_parser.add_argument('--smaller-than', type=parse_size, default=None,
+                              metavar='SIZE')
+    query_parser.add_argument('--not-accessed-since', type=parse_date,
+                              default=None, metavar='DATE')
+    query_parser.add_argument('--unused-days', type=float, default=None,
+                              help='Only files not accessed for this many days')
+    query_parser.add_argument('--not-modified-since', type=parse_date,
+                              default=None, metavar='DATE')
+    query_parser.add_argument('--ext', nargs='+', default=None,
+                              help='Only these extensions (e.g. .log .tmp)')
+    query_parser.add_argument('--group-by', choices=['extension', 'directory'],
+                              default=None,
+                              help='Print totals per group instead of files')
+    query_parser.add_argument('--limit', type=int, default=20, metavar='N',
+                              help='Number of files or groups to print')
 
     args = parser.parse_args()
 
-    if args.cli:
+    def open_ai_cache() -> Optional[AnalysisCache]:
+        # Only created when AI is used; without a usable cache directory
+        # analyses are simply not cached
+        if args.ai_cache_days <= 0:
+            return None
+        try:
+            return AnalysisCache(ttl=args.ai_cache_days * 24 * 60 * 60)
+        except (OSError, RuntimeError) as e:
+            # RuntimeError: no home directory to put the cache in
+            print(f"Not caching AI analyses: {e}", file=sys.stderr)
+            return None
+
+    if args.command == 'merge':
+        stats = functools.reduce(
+            ScanStats.merge, (ScanStats.load(path) for path in args.files))
+        print_stats(stats, args.top_dirs)
+        if args.output:
+            stats.save(args.output)
+        if args.snapshot:
+            Snapshot.from_stats(stats).save(snapshot_path(args.snapshot))
+    elif args.command == 'diff':
+        diff = diff_snapshots(Snapshot.load(args.old), Snapshot.load(args.new))
+        if args.json:
+            print(json.dumps(diff, indent=2))
+        else:
+            print_diff(diff, args.limit)
+    elif args.command == 'query':
+        table = FileTable.load(args.table)
+        accessed_before = args.not_accessed_since
+        if args.unused_days is not None:
+            unused_before = time.time() - args.unused_days * 86400
+            accessed_before = min(accessed_before or unused_before,
+                                  unused_before)
+        indices = table.query(
+            min_size=args.larger_than,
+            max_size=args.smaller_than,
+            accessed_before=accessed_before,
+            modified_before=args.not_modified_since,
+            under=args.under,
+            extensions=[ext.lower() if ext.startswith('.') or
+                        ext == 'no_extension' else '.' + ext.lower()
+                        for ext in args.ext] if args.ext else None)
+        print_query(table, indices, args.group_by, args.limit)
+    elif args.cli:
         if not args.path:
             print("Please provide a path to analyze with --path")
             return
-
-        analyzer = FileAnalyzer()
-        stats = analyzer.scan_directory(args.path)
-
-        print(f"\nAnalysis Results:")
-        print(f"Total Size: {humanize.naturalsize(stats['total_size'])}")
-        print(f"Total Files: {stats['total_files']}")
-        print(f"Total Directories: {stats['total_dirs']}")
-
-        print("\nFile Types:")
-        for ext, count in stats['file_types'].items():
-            print(f"{ext}: {count}")
-
-        if args.api_key:
-            print("\nGetting AI analysis...")
-            analysis = asyncio.run(analyzer.analyze_with_ai(args.api_key))
-            print("\nAI Analysis:")
-            print(analysis)
+        if args.processes:
+            # Shards are scanned by scan_directory in worker processes,
+            # which only get the options scan_sharded passes on
+            for option, value in [('--export-files', args.export_files),
+                                  ('--follow-symlinks', args.follow_symlinks),
+                                  ('--ndjson', args.ndjson),
+                                  ('--watch', args.watch),
+                                  ('--incremental', args.incremental),
+                                  ('--sample', args.sample is not None)]:
+                if value:
+                    parser.error(f"{option} can't be combined with --processes")
+        machine_readable = args.json or args.ndjson
+
+        def emit(record):
+            print(json.dumps(record), flush=True)
+
+        def emit_directory(path, files, size, dirs):
+            emit({'type': 'directory', 'path': path, 'files': files,
+                  'size': size, 'dirs': dirs})
+
+        def print_progress(progress, details):
+            print(f"\rScanning: {progress:5.1f}% - {format_progress(details)}",
+                  end="", file=sys.stderr, flush=True)
+
+        if args.exclude_from:
+            exclude = ExcludeRules.from_file(args.exclude_from, args.exclude)
+        else:
+            exclude = ExcludeRules(args.exclude) if args.exclude else None
+
+        index = ScanIndex(args.index) if args.incremental else None
+        analyzer = FileAnalyzer(top_k=args.top_k,
+                                find_duplicates=args.duplicates,
+                                hash_workers=args.hash_workers,
+                                unused_age=args.unused_days * 86400,
+                                large_file_size=args.large_size,
+                                exclude=exclude,
+                                one_file_system=args.one_file_system,
+                                follow_symlinks=args.follow_symlinks)
+        try:
+            if args.processes:
+                stats = analyzer.scan_sharded(args.path, args.processes,
+                                              workers=args.workers)
+            else:
+                stats = analyzer.scan_directory(
+                    args.path,
+                    print_progress if sys.stderr.isatty() else None,
+                    workers=args.workers,
+                    index=index,
+                    keep_files=args.watch,
+                    sample=args.sample,
+                    seed=args.seed,
+                    columns=bool(args.export_files),
+                    directory_callback=emit_directory if args.ndjson else None)
+        finally:
+            if index is not None:
+                index.close()
+        if sys.stderr.isatty():
+            print(file=sys.stderr)
+
+        if machine_readable:
+            # ScanStats keeps the tree and sketches as attributes, so the
+            # dict itself is plain JSON
+            result = {'type': 'results', 'path': os.path.abspath(args.path),
+                      **stats}
+            if index is not None:
+                result['index'] = {'hits': index.hits, 'misses': index.misses}
+        else:
+            print_stats(stats, args.top_dirs)
+            if index is not None:
+                print(f"\nDirectories reused from index: {index.hits} "
+                      f"of {index.hits + index.misses}")
+        if args.output:
+            stats.save(args.output)
+        if args.snapshot:
+            Snapshot.from_stats(stats).save(snapshot_path(args.snapshot))
+        if args.export_files:
+            analyzer.columns.save(args.export_files)
+
+        if args.api_key or args.api_base:
+            import asyncio
+
+            ai_cache = open_ai_cache()
+            if machine_readable:
+                result['ai_analysis'] = asyncio.run(analyzer.analyze_with_ai(
+                    args.api_key or "none", base_url=args.api_base,
+                    cache=ai_cache))
+            else:
+                print("\nAI Analysis:")
+                analysis = asyncio.run(analyzer.analyze_with_ai(
+                    args.api_key or "none", base_url=args.api_base,
+                    on_token=lambda text: print(text, end="", flush=True),
+                    cache=ai_cache))
+                if analysis.startswith("Error getting AI analysis"):
+                    print(analysis)
+                print()
+
+        if args.json:
+            print(json.dumps(result, indent=2), flush=True)
+        elif args.ndjson:
+            emit(result)
+
+        if args.watch:
+            def print_update(stats):
+                if machine_readable:
+                    emit({'type': 'update', 'time': time.time(),
+                          **{key: stats[key] for key in ScanStats.COUNTERS}})
+                    return
+                print(f"[{datetime.now().strftime('%H:%M:%S')}] "
+                      f"Total Size: {humanize.naturalsize(stats['total_size'])}, "
+                      f"Files: {stats['total_files']}, "
+                      f"Directories: {stats['total_dirs']}", flush=True)
+
+            if not machine_readable:
+                print("\nWatching for changes, press Ctrl+C to stop...")
+            watcher = ScanWatcher(analyzer, args.path, on_update=print_update,
+                                  interval=5.0)
+            try:
+                watcher.run(threading.Event())
+            except KeyboardInterrupt:
+                pass
     else:
-        app = ModernFileAnalyzerGUI()
+        from storage_analyzer_gui import ModernFileAnalyzerGUI
+
+        app = ModernFileAnalyzerGUI(watch=args.watch, sample=args.sample,
+                                    api_base=args.api_base,
+                                    ai_cache=open_ai_cache())
         app.mainloop()
 
 if __name__ == "__main__":
@@ -0,0 +1,581 @@
+#!/usr/bin/env python3
+"""customtkinter GUI of storage_analyzer.py.
+
+Kept apart from the scanner so the command-line mode never imports
+customtkinter and can run on servers without a display.
+"""
+import os
+import math
+import time
+import queue
+import asyncio
+import threading
+from datetime import datetime
+from typing import Dict, Optional
+import customtkinter as ctk
+import humanize
+from CTkMessagebox import CTkMessagebox
+
+from storage_analyzer import (AnalysisCache, FileAnalyzer, ScanWatcher,
+                              format_file_type, format_progress,
+                              format_quantiles, format_total)
+
+# Set appearance mode and default color theme
+ctk.set_appearance_mode("system")  # Follows system theme
+ctk.set_default_color_theme("blue")
+
+
+class PagedTextView(ctk.CTkFrame):
+    """Textbox showing a long list one page at a time.
+
+    Rows are only formatted and inserted for the visible page, with a
+    single insert call, so a list of any length renders in constant time.
+    """
+
+    def __init__(self, master, page_size: int = 100, height: int = 200):
+        super().__init__(master, fg_color="transparent")
+        self.page_size = page_size
+        self.rows = []
+        self.format_row = str
+        self.header = ""
+        self.page = 0
+
+        self.text = ctk.CTkTextbox(
+            self,
+            height=height,
+            font=ctk.CTkFont(size=14)
+        )
+        self.text.pack(fill="both", expand=True)
+
+        nav_frame = ctk.CTkFrame(self, fg_color="transparent")
+        nav_frame.pack(fill="x", pady=(5, 0))
+
+        self.prev_button = ctk.CTkButton(
+            nav_frame,
+            text="< Previous",
+            width=90,
+            command=lambda: self.show_page(self.page - 1)
+        )
+        self.prev_button.pack(side="left")
+
+        self.page_label = ctk.CTkLabel(nav_frame, text="")
+        self.page_label.pack(side="left", padx=10)
+
+        self.next_button = ctk.CTkButton(
+            nav_frame,
+            text="Next >",
+            width=90,
+            command=lambda: self.show_page(self.page + 1)
+        )
+        self.next_button.pack(side="left")
+
+    def set_rows(self, rows, format_row=str, header: str = ""):
+        """Show rows (any sequence), rendering each with format_row"""
+        self.rows = rows
+        self.format_row = format_row
+        self.header = header
+        self.show_page(0)
+
+    def show_page(self, page: int):
+        pages = max(1, math.ceil(len(self.rows) / self.page_size))
+        self.page = min(max(page, 0), pages - 1)
+        start = self.page * self.page_size
+        visible = self.rows[start:start + self.page_size]
+
+        self.text.delete("1.0", "end")
+        self.text.insert(
+            "1.0", self.header + "".join(map(self.format_row, visible)))
+        self.page_label.configure(
+            text=f"Page {self.page + 1} of {pages} ({len(self.rows)} rows)")
+        self.prev_button.configure(
+            state="normal" if self.page > 0 else "disabled")
+        self.next_button.configure(
+            state="normal" if self.page < pages - 1 else "disabled")
+
+
+class ModernFileAnalyzerGUI(ctk.CTk):
+    # How often (ms) queued updates from worker threads are drawn
+    FRAME_MS = 33
+    # How often (ms) watch mode refreshes the displayed stats
+    WATCH_REFRESH_MS = 2000
+
+    def __init__(self, watch: bool = False, sample: Optional[float] = None,
+                 api_base: Optional[str] = None,
+                 ai_cache: Optional[AnalysisCache] = None):
+        super().__init__()
+
+        # AI requests run on their own event loop so Tk never waits on them
+        self.api_base = api_base
+        self.ai_cache = ai_cache
+        self.ai_loop = asyncio.new_event_loop()
+        threading.Thread(target=self.ai_loop.run_forever, daemon=True).start()
+
+        # Fraction of subdirectories to sample, for approximate scans
+        self.sample = sample
+
+        # Keep stats current with inotify after each scan
+        self.watch = watch
+        self.watch_stop = None
+        self.watch_stats = None
+        # Numbers scans, so snapshots from a replaced watcher are dropped
+        self.scan_number = 0
+        # Stats on screen; AI analysis uses these rather than stats a
+        # scan or watcher thread is still changing
+        self.shown_stats = None
+        self.last_watch_render = 0.0
+        self.ai_waiting = False
+
+        # Worker threads never touch widgets, they queue events instead
+        self.events = queue.Queue()
+        self.after(self.FRAME_MS, self.process_events)
+
+        self.title("Modern File System Analyzer")
+        self.geometry("1000x800")
+        
+        # Initialize analyzer
+        self.analyzer = FileAnalyzer()
+        
+        # Create the main container with padding
+        self.grid_columnconfigure(0, weight=1)
+        self.grid_rowconfigure(0, weight=1)
+        
+        self.setup_gui()
+
+    def setup_gui(self):
+        # Create main container
+        main_container = ctk.CTkFrame(self)
+        main_container.grid(row=0, column=0, sticky="nsew", padx=30, pady=30)
+        main_container.grid_columnconfigure(0, weight=1)
+
+        # Header
+        header_frame = ctk.CTkFrame(main_container, fg_color="transparent")
+        header_frame.grid(row=0, column=0, sticky="ew", pady=(20, 30), padx=(20, 30))
+        
+        header_label = ctk.CTkLabel(
+            header_frame, 
+            text="File System Analyzer", 
+            font=ctk.CTkFont(size=24, weight="bold")
+        )
+        header_label.grid(row=0, column=0, sticky="w")
+
+        # Select folder button with modern styling
+        self.select_button = ctk.CTkButton(
+            header_frame,
+            text="Select Folder",
+            command=self.select_folder,
+            font=ctk.CTkFont(size=14)
+        )
+        self.select_button.grid(row=0, column=1, padx=20)
+
+        # Progress bar
+        self.progress_bar = ctk.CTkProgressBar(header_frame)
+        self.progress_bar.grid(row=1, column=0, columnspan=2, sticky="ew", pady=(10, 0))
+        self.progress_bar.set(0)
+
+        self.progress_label = ctk.CTkLabel(
+            header_frame,
+            text="",
+            font=ctk.CTkFont(size=12)
+        )
+        self.progress_label.grid(row=2, column=0, columnspan=2, sticky="w")
+
+        # Create tabview for organizing content
+        self.tabview = ctk.CTkTabview(main_container)
+        self.tabview.grid(row=1, column=0, sticky="nsew")
+        main_container.grid_rowconfigure(1, weight=1)
+
+        # Add tabs
+        self.tab_overview = self.tabview.add("Overview")
+        self.tab_details = self.tabview.add("File Details")
+        self.tab_directories = self.tabview.add("Top Directories")
+        self.tab_duplicates = self.tabview.add("Duplicates")
+        self.tab_ai = self.tabview.add("AI Analysis")
+
+        # Setup tab contents
+        self.setup_overview_tab()
+        self.setup_details_tab()
+        self.setup_directories_tab()
+        self.setup_duplicates_tab()
+        self.setup_ai_tab()
+
+    def setup_overview_tab(self):
+        # Overview frame
+        self.overview_frame = ctk.CTkFrame(self.tab_overview)
+        self.overview_frame.pack(fill="both", expand=True, padx=20, pady=20)
+
+        # Stats labels with modern styling
+        self.total_size_label = ctk.CTkLabel(
+            self.overview_frame,
+            text="Total Size: -",
+            font=ctk.CTkFont(size=16)
+        )
+        self.total_size_label.pack(anchor="w", pady=10, padx=15)
+
+        self.total_files_label = ctk.CTkLabel(
+            self.overview_frame,
+            text="Total Files: -",
+            font=ctk.CTkFont(size=16)
+        )
+        self.total_files_label.pack(anchor="w", pady=10, padx=15)
+
+        self.total_dirs_label = ctk.CTkLabel(
+            self.overview_frame,
+            text="Total Directories: -",
+            font=ctk.CTkFont(size=16)
+        )
+        self.total_dirs_label.pack(anchor="w", pady=10, padx=15)
+
+        self.estimate_label = ctk.CTkLabel(
+            self.overview_frame,
+            text="",
+            font=ctk.CTkFont(size=12)
+        )
+        self.estimate_label.pack(anchor="w", pady=10, padx=15)
+
+
+    def setup_details_tab(self):
+        # Details frame with scrollable sections
+        self.details_frame = ctk.CTkFrame(self.tab_details)
+        self.details_frame.pack(fill="both", expand=True, padx=20, pady=20)
+
+        # File types section
+        file_types_label = ctk.CTkLabel(
+            self.details_frame,
+            text="File Types Distribution:",
+            font=ctk.CTkFont(size=16, weight="bold")
+        )
+        file_types_label.pack(anchor="w", pady=(0, 10), padx=15)
+
+        self.file_types_view = PagedTextView(self.details_frame, height=150)
+        self.file_types_view.pack(fill="both", pady=(0, 20), padx=15)
+
+        # Large files section
+        large_files_label = ctk.CTkLabel(
+            self.details_frame,
+            text="Large Files (>100MB):",
+            font=ctk.CTkFont(size=16, weight="bold")
+        )
+        large_files_label.pack(anchor="w", pady=(0, 10), padx=15)
+
+        self.large_files_view = PagedTextView(self.details_frame, height=150)
+        self.large_files_view.pack(fill="both", pady=(0, 20), padx=15)
+
+        # Unused files section
+        unused_files_label = ctk.CTkLabel(
+            self.details_frame,
+            text="Unused Files (Not Accessed in 6 Months):",
+            font=ctk.CTkFont(size=16, weight="bold")
+        )
+        unused_files_label.pack(anchor="w", pady=(0, 10), padx=15)
+
+        self.unused_files_view = PagedTextView(self.details_frame, height=150)
+        self.unused_files_view.pack(fill="both", pady=(0, 20), padx=15)
+
+        # Timestamps section
+        timestamps_label = ctk.CTkLabel(
+            self.details_frame,
+            text="File Timestamps:",
+            font=ctk.CTkFont(size=16, weight="bold")
+        )
+        timestamps_label.pack(anchor="w", pady=(0, 10), padx=15)
+
+        self.timestamps_text = ctk.CTkTextbox(
+            self.details_frame,
+            height=100,
+            font=ctk.CTkFont(size=14)
+        )
+        self.timestamps_text.pack(fill="both", pady=(0, 20), padx=15)
+
+    def setup_directories_tab(self):
+        self.directories_frame = ctk.CTkFrame(self.tab_directories)
+        self.directories_frame.pack(fill="both", expand=True, padx=20, pady=20)
+
+        directories_label = ctk.CTkLabel(
+            self.directories_frame,
+            text="Largest Directories (recursive size):",
+            font=ctk.CTkFont(size=16, weight="bold")
+        )
+        directories_label.pack(anchor="w", pady=(0, 10), padx=15)
+
+        self.directories_view = PagedTextView(self.directories_frame)
+        self.directories_view.pack(fill="both", expand=True, padx=15)
+
+    def setup_duplicates_tab(self):
+        self.duplicates_frame = ctk.CTkFrame(self.tab_duplicates)
+        self.duplicates_frame.pack(fill="both", expand=True, padx=20, pady=20)
+
+        self.duplicates_check = ctk.CTkCheckBox(
+            self.duplicates_frame,
+            text="Find duplicate files on the next scan"
+        )
+        self.duplicates_check.pack(anchor="w", pady=(0, 10), padx=15)
+
+        self.duplicates_view = PagedTextView(self.duplicates_frame, page_size=20)
+        self.duplicates_view.pack(fill="both", expand=True, padx=15)
+
+    def setup_ai_tab(self):
+        # AI Analysis frame
+        self.ai_frame = ctk.CTkFrame(self.tab_ai)
+        self.ai_frame.pack(fill="both", expand=True, padx=20, pady=20)
+
+        # API Key entry
+        api_key_frame = ctk.CTkFrame(self.ai_frame, fg_color="transparent")
+        api_key_frame.pack(fill="x", pady=(15, 25))
+
+        self.api_key_entry = ctk.CTkEntry(
+            api_key_frame,
+            placeholder_text="Enter OpenAI API Key",
+            width=300,
+            show="*"
+        )
+        self.api_key_entry.pack(side="left", padx=(10, 10))
+
+        self.analyze_button = ctk.CTkButton(
+            api_key_frame,
+            text="Get AI Analysis",
+            command=self.get_ai_analysis
+        )
+        self.analyze_button.pack(side="left")
+
+        # AI Results
+        self.ai_results_text = ctk.CTkTextbox(
+            self.ai_frame,
+            wrap="word",
+            font=ctk.CTkFont(size=14)
+        )
+        self.ai_results_text.pack(fill="both", expand=True)
+
+    def select_folder(self):
+        folder_path = ctk.filedialog.askdirectory()
+        if folder_path:
+            self.select_button.configure(state="disabled")
+            self.progress_bar.set(0)
+            if self.watch_stop is not None:
+                self.watch_stop.set()
+                self.watch_stop = None
+            # The old watcher may still be finishing with its analyzer, so
+            # every scan gets a fresh one
+            self.analyzer = FileAnalyzer()
+            self.scan_number += 1
+            self.watch_stats = None
+            
+            # Create a thread for scanning
+            scan_thread = threading.Thread(
+                target=self.scan_directory_thread,
+                args=(folder_path, self.analyzer, self.scan_number)
+            )
+            scan_thread.start()
+
+    def scan_directory_thread(self, folder_path, analyzer, scan_number):
+        # Runs on a worker thread: everything for Tk goes through self.events
+        def update_progress(progress, details):
+            self.events.put(('progress', progress, details))
+
+        watcher = stop = None
+        try:
+            analyzer.find_duplicates = bool(self.duplicates_check.get())
+            stats = analyzer.scan_directory(folder_path, update_progress,
+                                            keep_files=self.watch,
+                                            sample=self.sample)
+            if self.watch:
+                # Ready before the button is enabled again, so a new scan
+                # can stop it; the watcher changes stats from now on, so
+                # Tk gets a copy
+                stop = self.watch_stop = threading.Event()
+                watcher = ScanWatcher(
+                    analyzer, folder_path,
+                    on_update=lambda stats: self.events.put(
+                        ('watch', scan_number, stats)))
+                stats = watcher.snapshot()
+            self.events.put(('stats', stats))
+        finally:
+            self.events.put(('scan_finished',))
+
+        if watcher is not None:
+            watcher.run(stop)
+
+    def process_events(self):
+        """Apply queued worker updates on the Tk thread, once per frame.
+
+        Only the newest progress report and watch snapshot are drawn, so
+        a burst of updates costs one redraw; watch snapshots are further
+        limited to one every WATCH_REFRESH_MS.
+        """
+        progress = None
+        try:
+            while True:
+                event = self.events.get_nowait()
+                if event[0] == 'progress':
+                    progress = event[1:]
+                elif event[0] == 'stats':
+                    self.update_gui_with_stats(event[1])
+                elif event[0] == 'scan_finished':
+                    self.select_button.configure(state="normal")
+                elif event[0] == 'watch':
+                    if event[1] == self.scan_number:
+                        self.watch_stats = event[2]
+                elif event[0] == 'ai_token':
+                    if self.ai_waiting:
+                        self.ai_results_text.delete("1.0", "end")
+                        self.ai_waiting = False
+                    self.ai_results_text.insert("end", event[1])
+                elif event[0] == 'ai_finished':
+                    self.ai_results_text.delete("1.0", "end")
+                    self.ai_results_text.insert("1.0", event[1])
+                    self.analyze_button.configure(state="normal")
+        except queue.Empty:
+            pass
+
+        if progress is not None:
+            percent, details = progress
+            self.progress_bar.set(percent / 100)
+            self.progress_label.configure(text=format_progress(details))
+
+        now = time.monotonic()
+        if (self.watch_stats is not None
+                and now - self.last_watch_render >= self.WATCH_REFRESH_MS / 1000):
+            self.update_gui_with_stats(self.watch_stats)
+            self.watch_stats = None
+            self.last_watch_render = now
+
+        self.after(self.FRAME_MS, self.process_events)
+
+    def update_gui_with_stats(self, stats):
+        self.shown_stats = stats
+        # Update overview tab
+        self.total_size_label.configure(
+            text=f"Total Size: {format_total(stats, 'total_size', True)}")
+        self.total_files_label.configure(
+            text=f"Total Files: {format_total(stats, 'total_files')}")
+        self.total_dirs_label.configure(
+            text=f"Total Directories: {format_total(stats, 'total_dirs')}")
+        self.estimate_label.configure(
+            text="Estimated from a sample, ± 95% confidence interval"
+            if stats.get('estimates') else "")
+
+        # Update file types view
+        sorted_types = sorted(stats['file_types'],
+                              key=lambda ext: stats['file_type_sizes'].get(ext, 0),
+                              reverse=True)
+        header = "Distribution by extension (largest first):\n"
+        if stats['size_quantiles']:
+            header += (f"All files: "
+                       f"{format_quantiles(stats['size_quantiles'])}\n")
+        self.file_types_view.set_rows(
+            sorted_types,
+            lambda ext: format_file_type(stats, ext) + "\n",
+            header=header + "\n")
+
+        # Update large files view
+        if stats['large_files']:
+            self.large_files_view.set_rows(
+                stats['large_files'],
+                lambda file: (
+                    f"{os.path.basename(file['path'])}\n"
+                    f"Size: {humanize.naturalsize(file['size'])}\n"
+                    f"Path: {file['path']}\n\n"),
+                header=(f"{stats['large_count']} files, "
+                        f"{humanize.naturalsize(stats['large_size'])} in total"
+                        f" (largest {len(stats['large_files'])} kept)\n\n"))
+        else:
+            self.large_files_view.set_rows(
+                [], header="No files larger than 100MB found.\n")
+
+        # Update unused files view
+        if stats['unused_files']:
+            self.unused_files_view.set_rows(
+                stats['unused_files'],
+                lambda file: (
+                    f"{os.path.basename(file['path'])}\n"
+                    f"Last accessed: "
+                    f"{datetime.fromtimestamp(file['last_accessed']).strftime('%Y-%m-%d %H:%M:%S')}\n"
+                    f"Size: {humanize.naturalsize(file['size'])}\n"
+                    f"Path: {file['path']}\n\n"),
+                header=(f"{stats['unused_count']} files, "
+                        f"{humanize.naturalsize(stats['unused_size'])} in total"
+                        f" (oldest {len(stats['unused_files'])} kept)\n\n"))
+        else:
+            self.unused_files_view.set_rows(
+                [], header="No unused files found.\n")
+
+        # Update top directories view
+        self.directories_view.set_rows(
+            stats['top_directories'],
+            lambda directory: (
+                f"{humanize.naturalsize(directory['size']):>12}  "
+                f"{directory['files']:>10} files  {directory['path']}\n"))
+
+        # Update duplicates view
+        if stats['duplicate_groups']:
+            self.duplicates_view.set_rows(
+                stats['duplicate_groups'],
+                lambda group: (
+                    f"{len(group['paths'])} copies of "
+                    f"{humanize.naturalsize(group['size'])} "
+                    f"({humanize.naturalsize(group['reclaimable'])} "
+                    f"reclaimable)\n"
+                    + "".join(f"- {path}\n" for path in group['paths'])
+                    + "\n"),
+                header=(f"{stats['duplicate_files']} redundant copies, "
+                        f"{humanize.naturalsize(stats['duplicate_reclaimable'])} "
+                        f"reclaimable\n\n"))
+        else:
+            self.duplicates_view.set_rows(
+                [], header="No duplicate files found.\n")
+
+        # Update timestamps text
+        self.timestamps_text.delete("1.0", "end")
+        if stats['newest_file'] and stats['oldest_file']:
+            newest_time = datetime.fromtimestamp(stats['newest_file']['time'])
+            oldest_time = datetime.fromtimestamp(stats['oldest_file']['time'])
+
+            self.timestamps_text.insert(
+                "end",
+                f"Newest File:\n"
+                f"- {os.path.basename(stats['newest_file']['path'])}\n"
+                f"- Modified: {newest_time.strftime('%Y-%m-%d %H:%M:%S')}\n\n"
+                f"Oldest File:\n"
+                f"- {os.path.basename(stats['oldest_file']['path'])}\n"
+                f"- Modified: {oldest_time.strftime('%Y-%m-%d %H:%M:%S')}\n"
+            )
+    async def _get_ai_analysis(self, api_key: str, analyzer: FileAnalyzer,
+                               stats: Dict):
+        # Runs on self.ai_loop: text reaches the widget through self.events
+        try:
+            analysis = await analyzer.analyze_with_ai(
+                api_key, base_url=self.api_base,
+                on_token=lambda text: self.events.put(('ai_token', text)),
+                cache=self.ai_cache, stats=stats)
+        except Exception as e:
+            analysis = f"Error: {str(e)}"
+        self.events.put(('ai_finished', analysis))
+
+    def get_ai_analysis(self):
+        # A local OpenAI-compatible server may not need a key
+        api_key = self.api_key_entry.get() or (self.api_base and "none")
+        if not api_key:
+            CTkMessagebox(
+                title="Error",
+                message="Please enter an OpenAI API key",
+                icon="warning"
+            )
+            return
+        if self.shown_stats is None:
+            CTkMessagebox(
+                title="Error",
+                message="Please scan a folder first",
+                icon="warning"
+            )
+            return
+
+        self.analyze_button.configure(state="disabled")
+        self.ai_results_text.delete("1.0", "end")
+        self.ai_results_text.insert("1.0", "Getting AI analysis... Please wait.\n")
+        self.ai_waiting = True
+        asyncio.run_coroutine_threadsafe(
+            self._get_ai_analysis(api_key, self.analyzer, self.shown_stats),
+            self.ai_loop)
+
+
+if __name__ == "__main__":
+    ModernFileAnalyzerGUI().mainloop()